@@ -13,6 +13,44 @@ import subprocess
 
 app = FastAPI(title="Applio Voice Conversion Service", version="1.0.0")
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def spool_upload(file: UploadFile, suffix: str) -> str:
+    """Copy the upload to a temp file in chunks, enforcing MAX_UPLOAD_MB (default 1024)."""
+    max_bytes = int(float(os.environ.get("MAX_UPLOAD_MB", "1024")) * 1024 * 1024)
+    if max_bytes and file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+    written = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_in:
+        try:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if max_bytes and written > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+                tmp_in.write(chunk)
+        except BaseException:
+            tmp_in.close()
+            os.remove(tmp_in.name)
+            raise
+    return tmp_in.name
+
+
+def shared_input_path(path: str) -> Optional[str]:
+    """Resolve ``input_path`` if it lies inside UPLOAD_ALLOWED_DIRS (os.pathsep-separated)."""
+    roots = [os.path.realpath(d) for d in os.environ.get("UPLOAD_ALLOWED_DIRS", "").split(os.pathsep) if d]
+    real = os.path.realpath(path)
+    if any(os.path.commonpath([real, root]) == root for root in roots) and os.path.isfile(real):
+        return real
+    return None
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -45,7 +83,8 @@ async def list_models():
 
 @app.post("/convert")
 async def convert_audio(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    input_path: Optional[str] = Form(None),
     model_name: Optional[str] = Form(None),
     pitch: Optional[int] = Form(0),
     index_rate: Optional[float] = Form(0.5),
@@ -59,6 +98,7 @@ async def convert_audio(
     
     Args:
         file: Audio file to convert
+        input_path: Server-local audio file inside UPLOAD_ALLOWED_DIRS, instead of file
         model_name: Name of the voice model to use
         pitch: Pitch shift in semitones
         index_rate: Index rate for retrieval
@@ -68,14 +108,18 @@ async def convert_audio(
         output_format: Output format (wav or mp3)
     """
     try:
-        # Sanitize filename - use fixed extension based on content
-        file_ext = ".wav" if file.content_type and "audio" in file.content_type else ".wav"
-        
-        # Save uploaded file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_in:
-            data = await file.read()
-            tmp_in.write(data)
-            in_path = tmp_in.name
+        if file is not None:
+            # Sanitize filename - use fixed extension based on content
+            file_ext = ".wav" if file.content_type and "audio" in file.content_type else ".wav"
+
+            # Stream the upload to disk
+            in_path = await spool_upload(file, file_ext)
+        elif input_path:
+            in_path = shared_input_path(input_path)
+            if in_path is None:
+                return JSONResponse({"error": "input_path must be a file inside UPLOAD_ALLOWED_DIRS"}, status_code=403)
+        else:
+            return JSONResponse({"error": "Either file or input_path is required"}, status_code=422)
 
         # Prepare output path
         tmp_dir = tempfile.mkdtemp()
@@ -124,6 +168,8 @@ async def convert_audio(
         media_type = "audio/wav" if output_format == "wav" else "audio/mpeg"
         return FileResponse(out_path, filename=os.path.basename(out_path), media_type=media_type)
         
+    except UploadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
     except subprocess.TimeoutExpired:
         return JSONResponse({"error": "Applio processing timeout"}, status_code=504)
     except Exception as e:
@@ -0,0 +1,166 @@
+# server/applio_client.py
+"""
+Streaming HTTP client for the Applio container.
+
+Requests are multipart-encoded on the fly: form fields are small, and the audio
+file is sent straight from disk in APPLIO_CHUNK_SIZE pieces, with the exact
+Content-Length computed up front. Responses are written to disk the same way, so
+memory per call stays O(chunk size) regardless of the WAV size. Connections are
+kept alive and reused across calls (up to APPLIO_POOL_SIZE idle connections).
+"""
+
+import http.client
+import os
+import queue
+import threading
+import urllib.parse
+import uuid
+from typing import Dict, Iterator, Optional
+
+CHUNK_SIZE = int(os.environ.get("APPLIO_CHUNK_SIZE", str(256 * 1024)))
+# Bytes of an error response body included in the raised message
+ERROR_BODY_BYTES = 2000
+
+
+class MultipartEncoder:
+    """multipart/form-data body that streams file parts from disk."""
+
+    def __init__(self, fields: Dict[str, str], files: Dict[str, str], boundary: Optional[str] = None,
+                 chunk_size: Optional[int] = None):
+        """
+        Args:
+            fields: {name: value} form fields
+            files: {name: path} file fields, sent as audio/wav
+            boundary: Multipart boundary (random by default)
+            chunk_size: Bytes read from each file per chunk
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self._parts = []
+        for name, value in fields.items():
+            header = (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n')
+            self._parts.append((header.encode() + str(value).encode() + b"\r\n", None))
+        for name, path in files.items():
+            header = (f'--{self.boundary}\r\n'
+                      f'Content-Disposition: form-data; name="{name}"; filename="{os.path.basename(path)}"\r\n'
+                      'Content-Type: audio/wav\r\n\r\n')
+            self._parts.append((header.encode(), path))
+        self._closing = f"--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    @property
+    def content_length(self) -> int:
+        total = len(self._closing)
+        for header, path in self._parts:
+            total += len(header)
+            if path is not None:
+                total += os.path.getsize(path) + 2
+        return total
+
+    def __iter__(self) -> Iterator[bytes]:
+        for header, path in self._parts:
+            yield header
+            if path is None:
+                continue
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                    yield chunk
+            yield b"\r\n"
+        yield self._closing
+
+
+class ApplioClient:
+    """Keep-alive connection pool to one Applio server."""
+
+    def __init__(self, base_url: str, pool_size: Optional[int] = None):
+        """
+        Args:
+            base_url: Applio server URL, e.g. http://applio:8001
+            pool_size: Idle connections kept open (APPLIO_POOL_SIZE env, default 4)
+        """
+        parts = urllib.parse.urlsplit(base_url)
+        self.base_url = base_url
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        if pool_size is None:
+            pool_size = int(os.environ.get("APPLIO_POOL_SIZE", "4"))
+        self._idle = queue.LifoQueue(maxsize=max(1, pool_size))
+
+    def _connect(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def _acquire(self, timeout):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect(timeout), False
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.timeout = timeout
+        return conn, True
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _send(self, conn, path, body: MultipartEncoder):
+        conn.putrequest("POST", path)
+        conn.putheader("Content-Type", body.content_type)
+        conn.putheader("Content-Length", str(body.content_length))
+        conn.endheaders()
+        for chunk in body:
+            conn.send(chunk)
+        return conn.getresponse()
+
+    def post_to_file(self, path: str, body: MultipartEncoder, out_path: str, timeout: Optional[float] = None):
+        """POST ``body`` to ``path`` and stream a 200 response into ``out_path``.
+
+        Raises RuntimeError for non-200 responses and OSError/HTTPException when
+        the server cannot be reached.
+        """
+        conn, reused = self._acquire(timeout)
+        try:
+            try:
+                response = self._send(conn, self.prefix + path, body)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection; retry once on a fresh one
+                conn.close()
+                conn = self._connect(timeout)
+                response = self._send(conn, self.prefix + path, body)
+
+            if response.status != 200:
+                detail = response.read(ERROR_BODY_BYTES).decode("utf-8", "replace")
+                raise RuntimeError(f"Applio server returned status {response.status}: {detail}")
+            with open(out_path, "wb") as out_file:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    out_file.write(chunk)
+        except BaseException:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url: str) -> ApplioClient:
+    """Return the shared client for ``base_url``."""
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = ApplioClient(base_url)
+        return client
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark: cold RVC CLI subprocess vs warm persistent worker.
+
+Usage:
+    python3 benchmarks/bench_rvc_worker.py --input song.wav --model <VOICE>
+    python3 benchmarks/bench_rvc_worker.py --input song.wav --model <VOICE> --runs 5
+
+Runs the same conversion N times through ``subprocess.run`` (what the server
+did before) and through an RVCWorkerPool, then prints per-run and mean
+latencies. The first worker run includes process start-up and model loads;
+later runs show the warm-path latency.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rvc_infer import RVCConverter  # noqa: E402
+from rvc_worker import RVCWorkerPool  # noqa: E402
+
+
+def build_cmd(converter, in_path, out_path, model):
+    if os.path.exists(converter.paths["webui_cli"]):
+        return converter._webui_call(in_path, out_path, rvc_model=model, pitch_detection_algorithm="rmvpe")
+    if os.path.exists(converter.paths["mangio"]):
+        return converter._mangio_call(in_path, out_path, rvc_model=model, pitch_detection_algorithm="rmvpe")
+    sys.exit("No known RVC CLI found in /rvc (expected infer_cli.py or inference.py)")
+
+
+def time_runs(label, runs, fn):
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+        print(f"  {label} run {i + 1}: {timings[-1]:.2f}s")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="Input WAV to convert")
+    parser.add_argument("--model", default=None, help="Voice model folder name under /models")
+    parser.add_argument("--runs", type=int, default=3, help="Conversions per mode (default: 3)")
+    args = parser.parse_args()
+
+    converter = RVCConverter()
+    out_dir = tempfile.mkdtemp(prefix="bench_rvc_")
+
+    def cold(i):
+        cmd = build_cmd(converter, args.input, os.path.join(out_dir, f"cold_{i}.wav"), args.model)
+        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    print("Cold subprocess per conversion:")
+    cold_times = time_runs("cold", args.runs, cold)
+
+    cli = build_cmd(converter, args.input, "", args.model)[1]
+    pool = RVCWorkerPool(cli, size=1)
+
+    def warm(i):
+        cmd = build_cmd(converter, args.input, os.path.join(out_dir, f"warm_{i}.wav"), args.model)
+        pool.run(cmd[2:])
+
+    print("Persistent worker:")
+    try:
+        warm_times = time_runs("worker", args.runs, warm)
+    finally:
+        pool.close()
+
+    print()
+    print(f"cold mean:            {statistics.mean(cold_times):.2f}s")
+    print(f"worker first run:     {warm_times[0]:.2f}s")
+    if len(warm_times) > 1:
+        print(f"worker warm mean:     {statistics.mean(warm_times[1:]):.2f}s")
+    print(f"outputs written to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
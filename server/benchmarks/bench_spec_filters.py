@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-bin filter loops vs vectorized gain vectors in spec_utils.
+
+Usage:
+    python3 benchmarks/bench_spec_filters.py
+    python3 benchmarks/bench_spec_filters.py --seconds 300 --params 4band_v2 --runs 5
+
+Builds random band spectrograms the size a track of --seconds produces with the
+given model params, then times the original Python loops of fft_lp_filter,
+fft_hp_filter and the combine_spectrograms pre-filter ramp against the current
+implementations (the same calls cmb_spectrogram_to_wave / combine_spectrograms make).
+"""
+
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uvr5_pack.lib_v5 import spec_utils  # noqa: E402
+from uvr5_pack.lib_v5.model_param_init import ModelParameters  # noqa: E402
+
+MODELPARAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uvr5_pack", "lib_v5", "modelparams")
+
+
+def legacy_lp(spec, bin_start, bin_stop):
+    g = 1.0
+    for b in range(bin_start, bin_stop):
+        g -= 1 / (bin_stop - bin_start)
+        spec[:, b, :] = g * spec[:, b, :]
+    spec[:, bin_stop:, :] *= 0
+    return spec
+
+
+def legacy_hp(spec, bin_start, bin_stop):
+    g = 1.0
+    for b in range(bin_start, bin_stop, -1):
+        g -= 1 / (bin_start - bin_stop)
+        spec[:, b, :] = g * spec[:, b, :]
+    spec[:, 0:bin_stop + 1, :] *= 0
+    return spec
+
+
+def legacy_pre_filter(spec, start, stop):
+    gp = 1
+    for b in range(start + 1, stop):
+        g = math.pow(10, -(b - start) * (3.5 - gp) / 20.0)
+        gp = g
+        spec[:, b, :] *= g
+    return spec
+
+
+def filter_pass(mp, specs, spec_c, lp, hp, pre):
+    """Apply every filter one separation applies, in place."""
+    bands_n = len(mp.param['band'])
+    for d, bp in mp.param['band'].items():
+        spec = specs[d]
+        if d == bands_n:
+            if bp['hpf_start'] > 0:
+                hp(spec, bp['hpf_start'], bp['hpf_stop'] - 1)
+        elif d == 1:
+            lp(spec, bp['lpf_start'], bp['lpf_stop'])
+        else:
+            hp(spec, bp['hpf_start'], bp['hpf_stop'] - 1)
+            lp(spec, bp['lpf_start'], bp['lpf_stop'])
+    pre(spec_c)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=300, help="Track length to simulate (default: 300)")
+    parser.add_argument("--params", default="4band_v2", help="Model params name under modelparams/ (default: 4band_v2)")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per implementation (default: 3)")
+    args = parser.parse_args()
+
+    mp = ModelParameters(os.path.join(MODELPARAMS, f"{args.params}.json"))
+    rng = np.random.default_rng(0)
+
+    def rand_spec(bins, frames):
+        shape = (2, bins, frames)
+        return (rng.standard_normal(shape, dtype=np.float32)
+                + 1j * rng.standard_normal(shape, dtype=np.float32)).astype(np.complex64)
+
+    specs = {}
+    for d, bp in mp.param['band'].items():
+        frames = int(args.seconds * bp['sr'] / bp['hl']) + 1
+        specs[d] = rand_spec(bp['n_fft'] // 2 + 1, frames)
+    top = mp.param['band'][len(mp.param['band'])]
+    spec_c = rand_spec(mp.param['bins'] + 1, int(args.seconds * top['sr'] / top['hl']) + 1)
+    start, stop = mp.param['pre_filter_start'], mp.param['pre_filter_stop']
+    print(f"{args.params}, {args.seconds:.0f}s: combined spectrogram {spec_c.shape}, "
+          f"{(spec_c.nbytes + sum(s.nbytes for s in specs.values())) / 2**20:.0f} MiB total")
+
+    def vectorized_pre(spec):
+        spec[:, start + 1:stop, :] *= spec_utils._pre_filter_gains(start, stop, spec.dtype)[None, :, None]
+
+    impls = {
+        "loop": (legacy_lp, legacy_hp, lambda spec: legacy_pre_filter(spec, start, stop)),
+        "vectorized": (spec_utils.fft_lp_filter, spec_utils.fft_hp_filter, vectorized_pre),
+    }
+    results = {}
+    for name, (lp, hp, pre) in impls.items():
+        timings = []
+        for _ in range(args.runs):
+            work = {d: s.copy() for d, s in specs.items()}
+            work_c = spec_c.copy()
+            t0 = time.perf_counter()
+            filter_pass(mp, work, work_c, lp, hp, pre)
+            timings.append(time.perf_counter() - t0)
+        results[name] = (work, work_c)
+        print(f"  {name:<11} mean {statistics.mean(timings) * 1000:8.1f} ms   best {min(timings) * 1000:8.1f} ms")
+
+    loop_specs, loop_c = results["loop"]
+    vec_specs, vec_c = results["vectorized"]
+    same = np.array_equal(loop_c, vec_c) and all(np.array_equal(loop_specs[d], vec_specs[d]) for d in specs)
+    print(f"outputs identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
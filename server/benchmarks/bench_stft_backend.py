@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: librosa vs torch STFT backend throughput per modelparams file.
+
+Usage:
+    python3 benchmarks/bench_stft_backend.py
+    python3 benchmarks/bench_stft_backend.py --seconds 240 --params 4band_v2 1band_sr44100_hl512 --runs 3
+
+For each params file, resamples --seconds of random stereo audio into its bands once,
+then times the band x channel STFTs (stft_bands) and the complex64 iSTFTs that
+cmb_spectrogram_to_wave runs (istft_bands) on the librosa and torch backends. Prints
+the median times, the torch speedup, and the max abs error of torch against librosa.
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+import librosa
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uvr5_pack.lib_v5 import stft_backend  # noqa: E402
+from uvr5_pack.lib_v5.model_param_init import ModelParameters  # noqa: E402
+
+MODELPARAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uvr5_pack", "lib_v5", "modelparams")
+
+
+def band_jobs(wave, mp):
+    """Resampled (channels, n_fft, hop) jobs per band, computed once so only the STFTs are timed."""
+    jobs = []
+    bands_n = len(mp.param["band"])
+    for d in range(bands_n, 0, -1):
+        bp = mp.param["band"][d]
+        if d != bands_n:
+            wave = librosa.resample(wave, orig_sr=mp.param["band"][d + 1]["sr"], target_sr=bp["sr"],
+                                    res_type=bp["res_type"])
+        jobs.append((wave, bp["n_fft"], bp["hl"]))
+    return jobs
+
+
+def median_time(fn, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), out
+
+
+def main():
+    names = sorted(os.path.basename(p)[:-5] for p in glob.glob(os.path.join(MODELPARAMS, "*.json")))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60.0, help="Audio length in seconds (default: 60)")
+    parser.add_argument("--params", nargs="+", default=names, help="Model params names (default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per configuration (default: 3)")
+    args = parser.parse_args()
+
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} threads, {args.seconds:.0f}s stereo")
+    print(f"{'params':<26} {'stft lib':>9} {'stft tch':>9} {'x':>5} {'istft lib':>10} {'istft tch':>10} {'x':>5} "
+          f"{'spec err':>9} {'wave err':>9}")
+    backends = {name: stft_backend.create(name) for name in stft_backend.BACKENDS}
+    rng = np.random.default_rng(0)
+
+    for name in args.params:
+        mp = ModelParameters(os.path.join(MODELPARAMS, name + ".json"))
+        wave = (rng.standard_normal((2, int(args.seconds * mp.param["sr"]))) * 0.1).astype(np.float32)
+        jobs = band_jobs(wave, mp)
+        specs = backends["librosa"].stft_bands(jobs)
+        # Synthesis inputs: the complex64 band spectrograms cmb_spectrogram_to_wave builds
+        ijobs = [(s, hop) for s, (_, _, hop) in zip(specs, jobs)]
+
+        row = {}
+        for key, backend in backends.items():
+            row[key, "stft"] = median_time(lambda: backend.stft_bands(jobs), args.runs)
+            row[key, "istft"] = median_time(lambda: backend.istft_bands(ijobs), args.runs)
+        spec_err = max(np.abs(a - b).max() for a, b in zip(row["librosa", "stft"][1], row["torch", "stft"][1]))
+        wave_err = max(np.abs(a - b).max() for a, b in zip(row["librosa", "istft"][1], row["torch", "istft"][1]))
+        t = {k: v[0] for k, v in row.items()}
+        print(f"{name:<26} {t['librosa', 'stft']:9.3f} {t['torch', 'stft']:9.3f} "
+              f"{t['librosa', 'stft'] / t['torch', 'stft']:5.2f} {t['librosa', 'istft']:10.3f} "
+              f"{t['torch', 'istft']:10.3f} {t['librosa', 'istft'] / t['torch', 'istft']:5.2f} "
+              f"{spec_err:9.1e} {wave_err:9.1e}")
+
+
+if __name__ == "__main__":
+    main()
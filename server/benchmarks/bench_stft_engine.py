@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: band x channel STFT/iSTFT throughput of the shared stft_engine pool.
+
+Usage:
+    python3 benchmarks/bench_stft_engine.py
+    python3 benchmarks/bench_stft_engine.py --seconds 240 --params 4band_v2 --threads 1 2 4 8 --runs 3
+
+Runs the analysis (wave_to_spectrogram_bands) and synthesis (cmb_spectrogram_to_wave)
+halves of a separation on --seconds of random stereo audio, first serially with the
+plain spec_utils functions one band and channel at a time, then through the pool at
+each --threads size. Prints the median time of each half and the speedup over serial.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import librosa
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uvr5_pack.lib_v5 import spec_utils, stft_engine  # noqa: E402
+from uvr5_pack.lib_v5.model_param_init import ModelParameters  # noqa: E402
+
+MODELPARAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uvr5_pack", "lib_v5", "modelparams")
+
+
+def serial_analysis(wave, mp):
+    specs = {}
+    bands_n = len(mp.param["band"])
+    for d in range(bands_n, 0, -1):
+        bp = mp.param["band"][d]
+        if d != bands_n:
+            wave = librosa.resample(wave, orig_sr=mp.param["band"][d + 1]["sr"], target_sr=bp["sr"],
+                                    res_type=bp["res_type"])
+        specs[d] = spec_utils.wave_to_spectrogram(wave, bp["hl"], bp["n_fft"], mp.param["mid_side"],
+                                                  mp.param["mid_side_b2"], mp.param["reverse"])
+    return specs
+
+
+def serial_synthesis(spec_m, mp):
+    # The pre-pool cmb_spectrogram_to_wave: one band at a time, channels back to back
+    stft_engine.set_max_workers(1)
+    try:
+        return spec_utils.cmb_spectrogram_to_wave(spec_m, mp)
+    finally:
+        stft_engine.set_max_workers(None)
+
+
+def median_time(fn, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=120.0, help="Audio length in seconds (default: 120)")
+    parser.add_argument("--params", default="4band_v2", help="Model params name in modelparams/ (default: 4band_v2)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8], help="Pool sizes to time")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per configuration (default: 3)")
+    args = parser.parse_args()
+
+    mp = ModelParameters(os.path.join(MODELPARAMS, args.params + ".json"))
+    rng = np.random.default_rng(0)
+    wave = (rng.standard_normal((2, int(args.seconds * mp.param["sr"]))) * 0.1).astype(np.float32)
+    spec_m = spec_utils.combine_spectrograms(serial_analysis(wave, mp), mp)
+
+    print(f"{args.params}: {len(mp.param['band'])} bands, {args.seconds:.0f}s stereo, {os.cpu_count()} CPUs")
+    t_ana = median_time(lambda: serial_analysis(wave, mp), args.runs)
+    t_syn = median_time(lambda: serial_synthesis(spec_m, mp), args.runs)
+    print(f"{'threads':<8} {'analysis s':>11} {'speedup':>8} {'synthesis s':>12} {'speedup':>8}")
+    print(f"{'serial':<8} {t_ana:11.3f} {1.0:8.2f} {t_syn:12.3f} {1.0:8.2f}")
+
+    for n in args.threads:
+        stft_engine.set_max_workers(n)
+        try:
+            a = median_time(lambda: spec_utils.wave_to_spectrogram_bands(wave, mp), args.runs)
+            s = median_time(lambda: spec_utils.cmb_spectrogram_to_wave(spec_m, mp), args.runs)
+        finally:
+            stft_engine.set_max_workers(None)
+        print(f"{n:<8} {a:11.3f} {t_ana / a:8.2f} {s:12.3f} {t_syn / s:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
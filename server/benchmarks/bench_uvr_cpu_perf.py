@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: UVR nets on CPU in fp32 NCHW vs the UVR_CPU_PERF performance mode.
+
+Usage:
+    python3 benchmarks/bench_uvr_cpu_perf.py
+    python3 benchmarks/bench_uvr_cpu_perf.py --variants nets nets_537238KB --windows 8 --bins 672
+
+For every nets variant, builds a CascadedASPPNet with random weights and
+BatchNorm statistics, then runs the same windows through uvr5_pack.utils.inference
+three ways: fp32 (the default path), perf mode in fp32 (folded BN, channels-last,
+inference_mode) and perf mode with bfloat16 autocast. Prints windows/s and the
+SDR of each perf-mode mask against fp32.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uvr5_pack.lib_v5.optimize import bf16_supported, prepare_cpu_model  # noqa: E402
+from uvr5_pack.utils import inference, make_padding  # noqa: E402
+
+VARIANTS = ["nets", "nets_33966KB", "nets_61968KB", "nets_123812KB", "nets_123821KB",
+            "nets_537227KB", "nets_537238KB"]
+WINDOW = 512
+
+
+def randomize_bn(model, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    for m in model.modules():
+        if isinstance(m, torch.nn.BatchNorm2d):
+            n = m.num_features
+            m.running_mean.copy_(torch.randn(n, generator=g) * 0.1)
+            m.running_var.copy_(torch.rand(n, generator=g) + 0.5)
+    return model.eval()
+
+
+def sdr(reference, estimate):
+    noise = np.sum((reference - estimate) ** 2)
+    return 10 * np.log10(np.sum(reference ** 2) / max(noise, 1e-20))
+
+
+def timed(spec, model, data):
+    t0 = time.perf_counter()
+    pred, _ = inference(spec, "cpu", model, None, data)
+    return pred, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, help="nets modules to run (default: all)")
+    parser.add_argument("--bins", type=int, default=672, help="Model bins, n_fft = 2 * bins (default: 672, 4band_v2)")
+    parser.add_argument("--windows", type=int, default=4, help="Inference windows per run (default: 4)")
+    parser.add_argument("--batch", type=int, default=4, help="Windows per forward pass (default: 4)")
+    args = parser.parse_args()
+
+    n_fft = args.bins * 2
+    offset = 128
+    _, _, roi = make_padding(0, WINDOW, offset)
+    rng = np.random.default_rng(0)
+    shape = (2, args.bins + 1, args.windows * roi)
+    spec = (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+    base = {"window_size": WINDOW, "tta": False, "batch_size": args.batch}
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} threads, native bf16: {bf16_supported()}, "
+          f"{args.windows} windows of {shape[1]}x{WINDOW}")
+    print(f"{'variant':<15} {'fp32 win/s':>11} {'perf win/s':>11} {'bf16 win/s':>11} {'perf SDR':>9} {'bf16 SDR':>9}")
+
+    for variant in args.variants:
+        nets = importlib.import_module(f"uvr5_pack.lib_v5.{variant}")
+        torch.manual_seed(0)
+        model = randomize_bn(nets.CascadedASPPNet(n_fft))
+        fast = randomize_bn(nets.CascadedASPPNet(n_fft))
+        fast.load_state_dict(model.state_dict())
+        fast = prepare_cpu_model(fast.eval())
+
+        inference(spec[:, :, :roi], "cpu", model, None, dict(base))  # warm-up
+        ref, t_ref = timed(spec, model, dict(base))
+        perf, t_perf = timed(spec, fast, dict(base, cpu_perf=True, bf16=False))
+        bf16, t_bf16 = timed(spec, fast, dict(base, cpu_perf=True, bf16=True))
+        print(f"{variant:<15} {args.windows / t_ref:11.2f} {args.windows / t_perf:11.2f} "
+              f"{args.windows / t_bf16:11.2f} {sdr(ref, perf):9.1f} {sdr(ref, bf16):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark: peak memory and time of the UVR post-inference path, legacy vs current.
+
+Usage:
+    python3 benchmarks/bench_uvr_mask_memory.py
+    python3 benchmarks/bench_uvr_mask_memory.py --seconds 360 --params 4band_v2 --mirroring
+
+Starts from a combined complex64 spectrogram of --seconds of random stereo audio and a
+random float32 magnitude prediction (the model itself is not run), then builds the
+instrument and vocal spectrograms and synthesizes both waves:
+
+    legacy    pred * exp(1j * angle(X)), complex128 band buffers in cmb_spectrogram_to_wave
+    current   spec_utils.with_phase_of(pred, X, |X|), complex64 band buffers
+
+Peak memory above the inputs is measured with tracemalloc (NumPy reports its buffers to
+it); the librosa STFT backend is used so the iSTFT buffers are counted too.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uvr5_pack.lib_v5 import spec_utils, stft_backend  # noqa: E402
+from uvr5_pack.lib_v5.model_param_init import ModelParameters  # noqa: E402
+from uvr5_pack.lib_v5.resample import resample  # noqa: E402
+
+MODELPARAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uvr5_pack", "lib_v5", "modelparams")
+
+
+def legacy_cmb_spectrogram_to_wave(spec_m, mp, extra_bins_h=None, extra_bins=None):
+    """cmb_spectrogram_to_wave as it was before: complex128 band buffers."""
+    bands_n = len(mp.param["band"])
+    offset = 0
+    jobs = []
+    for d in range(1, bands_n + 1):
+        bp = mp.param["band"][d]
+        spec_s = np.zeros(shape=(2, bp["n_fft"] // 2 + 1, spec_m.shape[2]), dtype=complex)
+        h = bp["crop_stop"] - bp["crop_start"]
+        spec_s[:, bp["crop_start"]:bp["crop_stop"], :] = spec_m[:, offset:offset + h, :]
+        offset += h
+        if d == bands_n:
+            if extra_bins_h:
+                max_bin = bp["n_fft"] // 2
+                spec_s[:, max_bin - extra_bins_h:max_bin, :] = extra_bins[:, :extra_bins_h, :]
+            if bp["hpf_start"] > 0:
+                spec_s = spec_utils.fft_hp_filter(spec_s, bp["hpf_start"], bp["hpf_stop"] - 1)
+        elif d == 1:
+            spec_s = spec_utils.fft_lp_filter(spec_s, bp["lpf_start"], bp["lpf_stop"])
+        else:
+            spec_s = spec_utils.fft_hp_filter(spec_s, bp["hpf_start"], bp["hpf_stop"] - 1)
+            spec_s = spec_utils.fft_lp_filter(spec_s, bp["lpf_start"], bp["lpf_stop"])
+        jobs.append((spec_s, bp["hl"]))
+        del spec_s
+
+    band_waves = stft_backend.get_backend().istft_bands(jobs)
+    del jobs
+    for d in range(1, bands_n + 1):
+        bp = mp.param["band"][d]
+        band_wave = spec_utils._join_channels(*band_waves[d - 1], mp.param["mid_side"], mp.param["mid_side_b2"],
+                                              mp.param["reverse"])
+        if d == bands_n:
+            wave = band_wave if bands_n == 1 else np.add(wave, band_wave)
+        else:
+            sr = mp.param["band"][d + 1]["sr"]
+            if d == 1:
+                wave = resample(band_wave, bp["sr"], sr, "sinc_fastest")
+            else:
+                wave = resample(np.add(wave, band_wave), bp["sr"], sr, "scipy")
+    return wave.T
+
+
+def legacy_mirroring(spec_m, input_high_end, mp):
+    mirror = np.flip(np.abs(spec_m[:, mp.param["pre_filter_start"] - 10 - input_high_end.shape[1]:
+                                   mp.param["pre_filter_start"] - 10, :]), 1)
+    mirror = mirror * np.exp(1.j * np.angle(input_high_end))
+    return np.where(np.abs(input_high_end) <= np.abs(mirror), input_high_end, mirror)
+
+
+def legacy(X_spec_m, pred, mp, high_end):
+    X_mag = np.abs(X_spec_m)
+    X_phase = np.exp(1.j * np.angle(X_spec_m))
+    del X_mag
+    y_spec_m = pred * X_phase
+    del X_phase
+    v_spec_m = X_spec_m - y_spec_m
+    waves = []
+    for spec_m in (y_spec_m, v_spec_m):
+        if high_end is None:
+            waves.append(legacy_cmb_spectrogram_to_wave(spec_m, mp))
+        else:
+            extra = legacy_mirroring(spec_m, high_end, mp)
+            waves.append(legacy_cmb_spectrogram_to_wave(spec_m, mp, high_end.shape[1], extra))
+    return waves
+
+
+def current(X_spec_m, pred, mp, high_end):
+    X_mag = np.abs(X_spec_m)
+    y_spec_m = spec_utils.with_phase_of(pred, X_spec_m, X_mag)
+    del X_mag
+    v_spec_m = X_spec_m - y_spec_m
+    waves = []
+    for spec_m in (y_spec_m, v_spec_m):
+        if high_end is None:
+            waves.append(spec_utils.cmb_spectrogram_to_wave(spec_m, mp))
+        else:
+            extra = spec_utils.mirroring("mirroring", spec_m, high_end, mp)
+            waves.append(spec_utils.cmb_spectrogram_to_wave(spec_m, mp, high_end.shape[1], extra))
+    return waves
+
+
+def measure(fn, *args):
+    gc.collect()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    out = fn(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] - base
+    return elapsed, peak, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=360.0, help="Track length in seconds (default: 360)")
+    parser.add_argument("--params", default="4band_v2", help="Model params name (default: 4band_v2)")
+    parser.add_argument("--mirroring", action="store_true", help="Include high_end_process=mirroring")
+    args = parser.parse_args()
+
+    stft_backend.set_backend("librosa")
+    mp = ModelParameters(os.path.join(MODELPARAMS, args.params + ".json"))
+    bp = mp.param["band"][1]
+    frames = int(args.seconds * bp["sr"] / bp["hl"]) + 1
+    rng = np.random.default_rng(0)
+    shape = (2, mp.param["bins"] + 1, frames)
+    X_spec_m = (rng.standard_normal(shape, dtype=np.float32)
+                + 1j * rng.standard_normal(shape, dtype=np.float32)).astype(np.complex64)
+    pred = np.abs(X_spec_m) * rng.random(shape, dtype=np.float32)
+    high_end = None
+    if args.mirroring:
+        top = mp.param["band"][len(mp.param["band"])]
+        h = (top["n_fft"] // 2 - top["crop_stop"]) + (mp.param["pre_filter_stop"] - mp.param["pre_filter_start"])
+        high_end = X_spec_m[:, -h:, :].copy()
+
+    print(f"{args.params}, {args.seconds:.0f}s, spectrogram {shape} complex64 "
+          f"({X_spec_m.nbytes / 2 ** 20:.0f} MiB){', mirroring' if args.mirroring else ''}")
+    tracemalloc.start()
+    results = {}
+    for name, fn in (("legacy", legacy), ("current", current)):
+        elapsed, peak, waves = measure(fn, X_spec_m, pred, mp, high_end)
+        results[name] = waves
+        print(f"{name:<8} {elapsed:8.2f}s  peak {peak / 2 ** 20:8.0f} MiB  wave {waves[0].dtype}")
+        del waves
+    tracemalloc.stop()
+    err = max(np.abs(a - b).max() for a, b in zip(results["legacy"], results["current"]))
+    print(f"max abs wave difference: {err:.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# server/demucs_engine.py
+"""
+In-process Demucs backend.
+
+Keeps pretrained Demucs models resident per model name and separates audio with
+``demucs.apply.apply_model``, so a warm server skips the CLI's interpreter start,
+torch import and weight load on every request. Stems are returned as NumPy arrays.
+Falls back to the ``demucs`` CLI (see rvc_infer.demucs_run) when the Python API
+is not importable or ``DEMUCS_BACKEND=cli`` is set.
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import ingest
+
+try:
+    import torch
+    from demucs.apply import apply_model
+    from demucs.audio import AudioFile, convert_audio
+    from demucs.pretrained import get_model
+    DEMUCS_API_AVAILABLE = True
+except ImportError:
+    DEMUCS_API_AVAILABLE = False
+
+
+def use_api() -> bool:
+    """Return True when separation should run in-process instead of via the CLI."""
+    backend = os.environ.get("DEMUCS_BACKEND", "auto").lower()
+    if backend == "cli":
+        return False
+    return DEMUCS_API_AVAILABLE
+
+
+class DemucsEngine:
+    """Separates audio with Demucs models held resident per model name."""
+
+    def __init__(self, device: Optional[str] = None):
+        """
+        Initialize the engine.
+
+        Args:
+            device: Torch device for inference (defaults to cuda when available)
+        """
+        self.device = device
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get_device(self) -> str:
+        if self.device is None:
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self.device
+
+    def get_model(self, name: str):
+        """Return the pretrained model ``name``, loading it on first use."""
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                model = get_model(name)
+                model.to(self._get_device())
+                model.eval()
+                self._models[name] = model
+            return model
+
+    def loaded_models(self):
+        with self._lock:
+            return sorted(self._models)
+
+    @staticmethod
+    def _load_track(in_path: str, samplerate: int, channels: int):
+        """Decode ``in_path`` to a (channels, samples) float tensor at the model rate."""
+        decoded = ingest.open_decoded(in_path)
+        if decoded is not None:
+            # Canonical float32 WAV from ingest.decode: no second decode
+            wav = torch.from_numpy(np.array(decoded.array().T))
+            return convert_audio(wav, decoded.samplerate, samplerate, channels)
+        try:
+            return AudioFile(in_path).read(streams=0, samplerate=samplerate, channels=channels)
+        except (FileNotFoundError, RuntimeError, OSError):
+            # ffmpeg unavailable or failed; decode with soundfile and resample in torch
+            import soundfile as sf
+            data, sr = sf.read(in_path, dtype="float32", always_2d=True)
+            wav = torch.from_numpy(data.T.copy())
+            return convert_audio(wav, sr, samplerate, channels)
+
+    def separate(
+        self,
+        in_path: str,
+        model: Optional[str] = None,
+        shifts: Optional[int] = None,
+        segment: Optional[float] = None,
+    ) -> Tuple[Dict[str, np.ndarray], int]:
+        """
+        Separate ``in_path`` into stems.
+
+        Args:
+            in_path: Input audio file path
+            model: Demucs model name (defaults to DEMUCS_MODEL env or htdemucs)
+            shifts: Number of random shifts (ensembles); None uses the Demucs default
+            segment: Segment length in seconds; None uses the model default
+
+        Returns:
+            Tuple of ({stem_name: float32 array of shape (channels, samples)}, samplerate)
+        """
+        name = model or os.environ.get("DEMUCS_MODEL", "htdemucs")
+        net = self.get_model(name)
+
+        wav = self._load_track(in_path, net.samplerate, net.audio_channels)
+        ref = wav.mean(0)
+        mean, std = ref.mean(), ref.std()
+        wav = (wav - mean) / (std + 1e-8)
+
+        with torch.no_grad():
+            sources = apply_model(
+                net, wav[None],
+                shifts=shifts or 1,
+                split=True,
+                overlap=0.25,
+                device=self._get_device(),
+                segment=segment,
+            )[0]
+        sources = sources * (std + 1e-8) + mean
+
+        stems = {
+            source: sources[i].cpu().numpy().astype(np.float32, copy=False)
+            for i, source in enumerate(net.sources)
+        }
+        return stems, net.samplerate
+
+
+def write_stems(stems: Dict[str, np.ndarray], samplerate: int, out_dir: str):
+    """Write stems as 16-bit WAVs (``<stem>.wav``), rescaling clipped stems like the CLI."""
+    import soundfile as sf
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, audio in stems.items():
+        peak = float(np.max(np.abs(audio))) if audio.size else 0.0
+        if peak > 1.0:
+            audio = audio / (1.01 * peak)
+        sf.write(os.path.join(out_dir, f"{name}.wav"), audio.T, samplerate, subtype="PCM_16")
+
+
+default_engine = DemucsEngine()
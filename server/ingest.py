@@ -0,0 +1,138 @@
+# server/ingest.py
+"""
+Decode-once audio ingestion.
+
+Before separation, the input is decoded a single time into a canonical float32
+WAV (original sample rate and channel count) in the request's scratch workspace.
+Every later reader gets that file: Demucs and UVR memory-map its data chunk
+instead of decoding again, and the Demucs CLI reads plain PCM. Files libsndfile
+can read are converted in blocks. Anything else (MP3/M4A/...) is converted by a
+single ffmpeg call, or by librosa/audioread when ffmpeg is not installed. Inputs
+that are already float32 WAVs are used as they are. INGEST_DECODE=0 hands the
+original file to every stage.
+"""
+
+import os
+import shutil
+import struct
+import subprocess
+from typing import Optional
+
+import numpy as np
+
+import scratch
+import wav_normalize
+
+BLOCK_FRAMES = 1 << 16
+
+
+def enabled() -> bool:
+    return os.environ.get("INGEST_DECODE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class DecodedAudio:
+    """A canonical float32 WAV and its layout."""
+
+    def __init__(self, path: str, samplerate: int, channels: int, frames: int, offset: int,
+                 source: Optional[str] = None):
+        self.path = path
+        self.samplerate = samplerate
+        self.channels = channels
+        self.frames = frames
+        self.offset = offset
+        self.source = source or path
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.samplerate
+
+    def array(self) -> np.ndarray:
+        """Read-only (frames, channels) float32 memmap of the samples."""
+        if self.frames == 0:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        return np.memmap(self.path, dtype=np.float32, mode="r", offset=self.offset,
+                         shape=(self.frames, self.channels))
+
+
+def open_decoded(path: str) -> Optional[DecodedAudio]:
+    """DecodedAudio for a file already in canonical form (float32 WAV), else None."""
+    try:
+        layout = wav_normalize.read_layout(path)
+    except (ValueError, OSError, struct.error):
+        return None
+    if not (layout.is_float and layout.bits == 32):
+        return None
+    return DecodedAudio(path, layout.sample_rate, layout.channels, layout.frames, layout.offset)
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Duration in seconds from the file header (libsndfile, then ffprobe); None if unknown."""
+    import soundfile as sf
+    try:
+        info = sf.info(path)
+        return info.frames / info.samplerate
+    except (RuntimeError, TypeError, sf.LibsndfileError):
+        pass
+    if shutil.which("ffprobe") is None:
+        return None
+    proc = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    try:
+        return float(proc.stdout.strip())
+    except ValueError:
+        return None
+
+
+def _decode_soundfile(in_path: str, out_path: str):
+    import soundfile as sf
+    with sf.SoundFile(in_path) as src:
+        with sf.SoundFile(out_path, "w", samplerate=src.samplerate, channels=src.channels,
+                          format="WAV", subtype="FLOAT") as dst:
+            for block in src.blocks(blocksize=BLOCK_FRAMES, dtype="float32", always_2d=True):
+                dst.write(block)
+
+
+def _decode_ffmpeg(in_path: str, out_path: str) -> bool:
+    if shutil.which("ffmpeg") is None:
+        return False
+    cmd = ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", in_path, "-map", "0:a:0", "-vn",
+           "-c:a", "pcm_f32le", "-f", "wav", out_path]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Could not decode {os.path.basename(in_path)}: {proc.stderr.strip()}")
+    return True
+
+
+def _decode_librosa(in_path: str, out_path: str):
+    import librosa
+    import soundfile as sf
+    wave, sr = librosa.load(in_path, sr=None, mono=False, dtype=np.float32)
+    sf.write(out_path, np.atleast_2d(wave).T, sr, format="WAV", subtype="FLOAT")
+
+
+def decode(in_path: str, workspace=None) -> DecodedAudio:
+    """Decode ``in_path`` to a canonical float32 WAV in ``workspace`` (see scratch.py)."""
+    import soundfile as sf
+
+    existing = open_decoded(in_path)
+    if existing is not None:
+        return existing
+
+    out_path = scratch.mkstemp(workspace, suffix=".wav", prefix="decoded_")
+    try:
+        try:
+            _decode_soundfile(in_path, out_path)
+        except (RuntimeError, TypeError, sf.LibsndfileError):
+            if not _decode_ffmpeg(in_path, out_path):
+                _decode_librosa(in_path, out_path)
+        decoded = open_decoded(out_path)
+        if decoded is None:
+            raise RuntimeError(f"Could not decode {os.path.basename(in_path)}")
+    except BaseException:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+    decoded.source = in_path
+    return decoded
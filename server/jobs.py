@@ -0,0 +1,205 @@
+# server/jobs.py
+"""
+Background job subsystem for long-running conversions.
+
+``POST /jobs`` submits work to a bounded thread pool and returns a job id at once;
+clients poll ``GET /jobs/{id}`` for the current stage and percent and fetch the
+output from ``GET /jobs/{id}/result``. The blocking /convert and /uvr endpoints run
+through the same manager, so every request shares one set of limits.
+
+Stages that contend for the same hardware are throttled independently of the
+executor size: ``separate`` and ``rvc`` hold a GPU slot (JOBS_GPU_CONCURRENCY,
+default 1), ``normalize`` and ``archive`` hold a CPU slot (JOBS_CPU_CONCURRENCY,
+default the CPU count). ``upload`` and ``applio`` (remote) are not throttled.
+
+Progress only moves forward. Stages that run concurrently can be reported under
+one name through the job's ``aliases`` ({stage: reported stage}); throttling still
+uses the real stage name.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+STAGE_RESOURCES = {
+    "separate": "gpu",
+    "rvc": "gpu",
+    "normalize": "cpu",
+    "archive": "cpu",
+}
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobResult:
+    """Output of a finished job: one file, or ``entries`` ({arcname: path}) served as a zip."""
+
+    def __init__(self, path: Optional[str] = None, filename: Optional[str] = None,
+                 media_type: str = "application/octet-stream", headers: Optional[Dict[str, str]] = None,
+                 entries: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.filename = filename or os.path.basename(path)
+        self.media_type = media_type
+        self.headers = headers or {}
+        self.entries = entries
+
+
+class Job:
+    """State of one submitted job; updated by the worker thread, read by the API."""
+
+    def __init__(self, task: str, stages: List[str], workspace=None, aliases: Optional[Dict[str, str]] = None):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.stages = list(stages)
+        self.aliases = dict(aliases or {})
+        self.status = QUEUED
+        self.stage = None
+        self.percent = 0.0
+        self.error = None
+        self.result = None
+        self.stats = {}
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        # scratch.ScratchWorkspace owning the job's files, removed when the job expires
+        self.workspace = workspace
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "task": self.task,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": self.stages,
+            "percent": round(self.percent, 1),
+            "error": self.error,
+            "stats": dict(self.stats),
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """Runs jobs on a bounded executor and throttles stages per resource class."""
+
+    def __init__(self, max_workers: Optional[int] = None, gpu_concurrency: Optional[int] = None,
+                 cpu_concurrency: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Initialize the manager.
+
+        Args:
+            max_workers: Jobs running at once (JOBS_MAX_WORKERS env, default 4)
+            gpu_concurrency: GPU stages running at once (JOBS_GPU_CONCURRENCY env, default 1)
+            cpu_concurrency: CPU stages running at once (JOBS_CPU_CONCURRENCY env, default CPU count)
+            ttl: Seconds finished jobs stay queryable (JOBS_TTL_SECONDS env, default 3600)
+        """
+        if max_workers is None:
+            max_workers = int(os.environ.get("JOBS_MAX_WORKERS", "4"))
+        if gpu_concurrency is None:
+            gpu_concurrency = int(os.environ.get("JOBS_GPU_CONCURRENCY", "1"))
+        if cpu_concurrency is None:
+            cpu_concurrency = int(os.environ.get("JOBS_CPU_CONCURRENCY", str(os.cpu_count() or 1)))
+        if ttl is None:
+            ttl = float(os.environ.get("JOBS_TTL_SECONDS", "3600"))
+        self.max_workers = max(1, max_workers)
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._limits = {
+            "gpu": threading.BoundedSemaphore(max(1, gpu_concurrency)),
+            "cpu": threading.BoundedSemaphore(max(1, cpu_concurrency)),
+        }
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def stage_hook(self, job: Job):
+        """Return a ``stage(name)`` context manager that reports progress for ``job``
+        and holds the stage's resource slot while the block runs."""
+
+        @contextmanager
+        def stage(name):
+            shown = job.aliases.get(name, name)
+            with self._lock:
+                if shown not in job.stages:
+                    job.stages.append(shown)
+                index = job.stages.index(shown)
+                # Concurrent stages start out of order; never report going backwards
+                if job.stage is None or index >= job.stages.index(job.stage):
+                    job.stage = shown
+                    job.percent = max(job.percent, 100.0 * index / len(job.stages))
+            limit = self._limits.get(STAGE_RESOURCES.get(name))
+            if limit is None:
+                yield
+                return
+            with limit:
+                yield
+
+        return stage
+
+    def submit(self, task: str, fn: Callable[[Job], JobResult], stages: List[str], workspace=None,
+               aliases: Optional[Dict[str, str]] = None) -> Job:
+        """Queue ``fn(job)`` and return the job; ``fn`` returns the JobResult."""
+        job = Job(task, stages, workspace, aliases)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], JobResult]) -> JobResult:
+        job.status = RUNNING
+        try:
+            job.result = fn(job)
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+            raise
+        else:
+            job.status = DONE
+            job.percent = 100.0
+            return job.result
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id: str):
+        """Forget a finished job and remove its workspace (blocking endpoints, once
+        their response has been sent)."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None and job.workspace is not None:
+            job.workspace.cleanup()
+
+    def prune(self):
+        """Drop jobs finished more than ``ttl`` seconds ago and remove their workspaces.
+
+        Runs on every submit and from the scratch reaper's sweep (see main.py), so
+        results expire on an idle server too.
+        """
+        with self._lock:
+            self._prune()
+
+    def _prune(self):
+        now = time.time()
+        expired = [jid for jid, job in self._jobs.items() if job.finished and now - job.finished > self.ttl]
+        for jid in expired:
+            job = self._jobs.pop(jid)
+            if job.workspace is not None:
+                job.workspace.cleanup()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {status: sum(1 for j in jobs if j.status == status) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
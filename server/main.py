@@ -1,20 +1,170 @@
 # server/main.py
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.responses import FileResponse, JSONResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
 from typing import Optional
-import tempfile, os, shutil
+import os
+import asyncio
+import logging
 import urllib.request
 import json
-from rvc_infer import RVCConverter
+from rvc_infer import RVCConverter, uvr_model_pool
+from jobs import JobManager, JobResult, DONE, FAILED
+from zipstream import zip_response
+from wav_normalize import MODES as NORMALIZE_MODES
+from uploads import UploadError, max_upload_bytes, receive_input
+from scratch import ScratchReaper, ScratchWorkspace
 from stemxtract_client import StemXtractClient
 
-app = FastAPI(title="RVC Local Service (Pinned + UVR)", version="0.3.0")
+logger = logging.getLogger(__name__)
+
+job_manager = JobManager()
+# Each sweep first expires finished jobs, so their workspaces go even when no new job arrives
+scratch_reaper = ScratchReaper(on_sweep=[job_manager.prune])
+
+
+def _preload_uvr():
+    """Load the default UVR model (and its TorchScript trace) before the first request."""
+    try:
+        uvr_model_pool.get()
+    except Exception:
+        logger.exception("UVR preload failed")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    scratch_reaper.start()
+    if os.environ.get("UVR_PRELOAD", "0") == "1":
+        # In the background so the server accepts requests while the model loads
+        asyncio.get_running_loop().run_in_executor(None, _preload_uvr)
+    yield
+    scratch_reaper.stop()
+
+
+app = FastAPI(title="RVC Local Service (Pinned + UVR)", version="0.3.0", lifespan=lifespan)
 converter = RVCConverter()
 
+
+# Room for multipart boundaries and form fields on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse bodies over MAX_UPLOAD_MB from Content-Length before reading them."""
+    limit = max_upload_bytes()
+    length = request.headers.get("content-length")
+    if limit and length and length.isdigit() and int(length) > limit + MULTIPART_OVERHEAD:
+        return JSONResponse({"error": f"Upload exceeds the {limit // (1024 * 1024)} MB limit"}, status_code=413)
+    return await call_next(request)
+
+
+def _input_error(e: UploadError):
+    return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+
+def _normalize_mode_error(mode):
+    return JSONResponse(
+        {"error": f"Unknown normalize_mode '{mode}' (expected one of {', '.join(NORMALIZE_MODES)})"},
+        status_code=422
+    )
+
+
+# Applio runs concurrently with RVC and normalization; report them as one stage
+APPLIO_OVERLAP_STAGE = "rvc+applio"
+
+
+def _convert_stages(separate, applio_enabled, applio_model, normalize):
+    stages = ["upload"]
+    if separate or (applio_enabled and applio_model):
+        stages.append("separate")
+    if applio_enabled and applio_model:
+        stages.append(APPLIO_OVERLAP_STAGE)
+        return stages
+    stages.append("rvc")
+    if normalize:
+        stages.append("normalize")
+    return stages
+
+
+def _convert_aliases(applio_enabled, applio_model):
+    if applio_enabled and applio_model:
+        return {name: APPLIO_OVERLAP_STAGE for name in ("rvc", "normalize", "applio")}
+    return {}
+
+
+def _run_convert(job, **params):
+    """Job body for /convert: run the pipeline and package its output."""
+    result = converter.convert(
+        stage_hook=job_manager.stage_hook(job), stats=job.stats, workspace=job.workspace, **params
+    )
+    output_format = params.get("output_format")
+
+    # Result is always a tuple (rvc_output, applio_output)
+    out_path, applio_out_path = result
+    headers = {}
+    if "separation_cache" in job.stats:
+        headers["X-Cache"] = job.stats["separation_cache"]
+    timings = job.stats.get("timings")
+    if timings:
+        headers["Server-Timing"] = ", ".join(f"{name};dur={secs * 1000:.1f}" for name, secs in timings.items())
+
+    # If Applio output exists, stream a zip with both files under descriptive names
+    if applio_out_path:
+        entries = {
+            f"rvc_output.{output_format}": out_path,
+            f"applio_output.{output_format}": applio_out_path,
+        }
+        return JobResult(filename="rvc_applio_outputs.zip", media_type="application/zip",
+                         headers=headers, entries=entries)
+
+    return JobResult(out_path, os.path.basename(out_path),
+                     "audio/wav" if out_path.endswith(".wav") else "audio/mpeg", headers)
+
+
+def _run_uvr(job, **params):
+    """Job body for /uvr: separate all stems into a zip archive."""
+    stems = converter.uvr(
+        stage_hook=job_manager.stage_hook(job), archive=False, workspace=job.workspace, **params
+    )
+    archive_name = "uvr_stems.zip" if params.get("use_uvr") else "demucs_stems.zip"
+    return JobResult(filename=archive_name, media_type="application/zip", entries=stems)
+
+
+def _uvr_params(model, shifts, segment, use_uvr, uvr_model_path):
+    # Apply sensible defaults
+    model = model or 'htdemucs'
+    shifts = shifts if shifts is not None else 1
+    # segment remains None (Demucs default) if not provided or 0/0.0
+    if segment is not None and segment == 0:
+        segment = None
+    return dict(model=model, shifts=shifts, segment=segment, use_uvr=use_uvr, uvr_model_path=uvr_model_path)
+
+
+def _result_response(result: JobResult, background: Optional[BackgroundTask] = None):
+    if result.entries is not None:
+        return zip_response(result.entries, result.filename, headers=result.headers, background=background)
+    return FileResponse(result.path, filename=result.filename, media_type=result.media_type,
+                        headers=result.headers, background=background)
+
+
+async def _run_and_respond(job):
+    """Await a job submitted by a blocking endpoint and send its result; the job and
+    its scratch workspace are removed once the response has been sent."""
+    try:
+        # Wait without blocking the event loop; other requests keep being served
+        result = await asyncio.wrap_future(job.future)
+    except Exception as e:
+        job_manager.remove(job.id)
+        return JSONResponse({"error": str(e)}, status_code=500)
+    return _result_response(result, background=BackgroundTask(job_manager.remove, job.id))
+
 @app.post("/convert")
 async def convert_audio(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    input_path: Optional[str] = Form(None),  # server-local file inside UPLOAD_ALLOWED_DIRS
     rvc_model: Optional[str] = Form(None),
     output_format: Optional[str] = Form("wav"),
     # RVC params
@@ -28,66 +178,65 @@ async def convert_audio(
     separator: Optional[str] = Form("demucs"),  # 'demucs' or 'uvr'
     stem: Optional[str] = Form("vocals"),  # 'vocals' or 'other'
     demucs_model: Optional[str] = Form(None),
+    shifts: Optional[int] = Form(None),  # Demucs shifts (default: Demucs default)
+    segment: Optional[float] = Form(None),  # Demucs segment seconds (default: model default)
     # Applio processing
     applio_enabled: Optional[bool] = Form(False),
     applio_model: Optional[str] = Form(None),
     uvr_model_path: Optional[str] = Form(None),
     # Post-process
     normalize: Optional[bool] = Form(True),
-    target_db: Optional[float] = Form(-0.1)
+    target_db: Optional[float] = Form(-0.1),
+    normalize_mode: Optional[str] = Form("peak")  # 'peak', 'rms' (dBFS) or 'lufs'
 ):
+    if normalize_mode not in NORMALIZE_MODES:
+        return _normalize_mode_error(normalize_mode)
+    workspace = ScratchWorkspace()
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1] or ".wav") as tmp_in:
-            data = await file.read()
-            tmp_in.write(data)
-            in_path = tmp_in.name
-
-        result = converter.convert(
-            in_path=in_path,
-            rvc_model=rvc_model,
-            output_format=output_format,
-            pitch_change_all=pitch_change_all,
-            index_rate=index_rate,
-            filter_radius=filter_radius,
-            rms_mix_rate=rms_mix_rate,
-            pitch_detection_algorithm=pitch_detection_algorithm,
-            separate=separate,
-            separator=separator,
-            stem=stem,
-            demucs_model=demucs_model,
-            applio_enabled=applio_enabled,
-            applio_model=applio_model,
-            uvr_model_path=uvr_model_path,
-            normalize=normalize,
-            target_db=target_db
+        in_path, _ = await receive_input(file, input_path, workspace)
+    except UploadError as e:
+        workspace.cleanup()
+        return _input_error(e)
+    try:
+        job = job_manager.submit(
+            "convert",
+            lambda job: _run_convert(
+                job,
+                in_path=in_path,
+                rvc_model=rvc_model,
+                output_format=output_format,
+                pitch_change_all=pitch_change_all,
+                index_rate=index_rate,
+                filter_radius=filter_radius,
+                rms_mix_rate=rms_mix_rate,
+                pitch_detection_algorithm=pitch_detection_algorithm,
+                separate=separate,
+                separator=separator,
+                stem=stem,
+                demucs_model=demucs_model,
+                shifts=shifts,
+                segment=segment,
+                applio_enabled=applio_enabled,
+                applio_model=applio_model,
+                uvr_model_path=uvr_model_path,
+                normalize=normalize,
+                target_db=target_db,
+                normalize_mode=normalize_mode
+            ),
+            _convert_stages(separate, applio_enabled, applio_model, normalize),
+            workspace=workspace,
+            aliases=_convert_aliases(applio_enabled, applio_model)
         )
-        
-        # Result is always a tuple (rvc_output, applio_output)
-        out_path, applio_out_path = result
-            
-        # If Applio output exists, create a zip with both files
-        if applio_out_path:
-            zip_dir = tempfile.mkdtemp()
-            # Copy files with descriptive names
-            rvc_dest = os.path.join(zip_dir, f"rvc_output.{output_format}")
-            applio_dest = os.path.join(zip_dir, f"applio_output.{output_format}")
-            shutil.copy2(out_path, rvc_dest)
-            shutil.copy2(applio_out_path, applio_dest)
-            
-            # Create zip using a secure temporary file
-            zip_tmp_dir = tempfile.mkdtemp()
-            base = os.path.join(zip_tmp_dir, 'rvc_applio_outputs')
-            zip_path = shutil.make_archive(base, 'zip', zip_dir)
-            return FileResponse(zip_path, filename="rvc_applio_outputs.zip", media_type="application/zip")
-        
-        return FileResponse(out_path, filename=os.path.basename(out_path), media_type="audio/wav" if out_path.endswith(".wav") else "audio/mpeg")
     except Exception as e:
+        workspace.cleanup()
         return JSONResponse({"error": str(e)}, status_code=500)
+    return await _run_and_respond(job)
 
 
 @app.post("/uvr")
 async def uvr_audio(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    input_path: Optional[str] = Form(None),
     model: Optional[str] = Form(None),
     shifts: Optional[int] = Form(None),
     segment: Optional[float] = Form(None),
@@ -101,30 +250,116 @@ async def uvr_audio(
         shifts: 1 - Number of random shifts for equivariant stabilization
         segment: None - Segment size in seconds (uses Demucs default if not specified)
     """
+    workspace = ScratchWorkspace()
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1] or ".wav") as tmp_in:
-            data = await file.read()
-            tmp_in.write(data)
-            in_path = tmp_in.name
-
-        # Apply sensible defaults
-        model = model or 'htdemucs'
-        shifts = shifts if shifts is not None else 1
-        # segment remains None (Demucs default) if not provided or 0/0.0
-        if segment is not None and segment == 0:
-            segment = None
-
-        zip_path = converter.uvr(
-            in_path=in_path,
-            model=model,
-            shifts=shifts,
-            segment=segment,
-            use_uvr=use_uvr,
-            uvr_model_path=uvr_model_path
-        )
-        return FileResponse(zip_path, filename=os.path.basename(zip_path), media_type="application/zip")
+        in_path, _ = await receive_input(file, input_path, workspace)
+    except UploadError as e:
+        workspace.cleanup()
+        return _input_error(e)
+    try:
+        params = _uvr_params(model, shifts, segment, use_uvr, uvr_model_path)
+        job = job_manager.submit("uvr", lambda job: _run_uvr(job, in_path=in_path, **params),
+                                 ["upload", "separate", "archive"], workspace=workspace)
     except Exception as e:
+        workspace.cleanup()
         return JSONResponse({"error": str(e)}, status_code=500)
+    return await _run_and_respond(job)
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: Optional[UploadFile] = File(None),
+    input_path: Optional[str] = Form(None),
+    task: Optional[str] = Form("convert"),  # 'convert' or 'uvr'
+    # convert params
+    rvc_model: Optional[str] = Form(None),
+    output_format: Optional[str] = Form("wav"),
+    pitch_change_all: Optional[float] = Form(0.0),
+    index_rate: Optional[float] = Form(0.5),
+    filter_radius: Optional[int] = Form(3),
+    rms_mix_rate: Optional[float] = Form(0.25),
+    pitch_detection_algorithm: Optional[str] = Form("rmvpe"),
+    separate: Optional[bool] = Form(False),
+    separator: Optional[str] = Form("demucs"),
+    stem: Optional[str] = Form("vocals"),
+    demucs_model: Optional[str] = Form(None),
+    applio_enabled: Optional[bool] = Form(False),
+    applio_model: Optional[str] = Form(None),
+    normalize: Optional[bool] = Form(True),
+    target_db: Optional[float] = Form(-0.1),
+    normalize_mode: Optional[str] = Form("peak"),
+    # uvr params
+    model: Optional[str] = Form(None),
+    shifts: Optional[int] = Form(None),
+    segment: Optional[float] = Form(None),
+    use_uvr: Optional[bool] = Form(False),
+    uvr_model_path: Optional[str] = Form(None)
+):
+    """Submit a /convert or /uvr job and return its id without waiting for the result.
+
+    Poll GET /jobs/{id} for stage and percent, then fetch GET /jobs/{id}/result.
+    """
+    if task not in ("convert", "uvr"):
+        return JSONResponse({"error": f"Unknown task '{task}' (expected 'convert' or 'uvr')"}, status_code=422)
+    if normalize_mode not in NORMALIZE_MODES:
+        return _normalize_mode_error(normalize_mode)
+    # The workspace lives until the job expires (JOBS_TTL_SECONDS)
+    workspace = ScratchWorkspace()
+    try:
+        in_path, _ = await receive_input(file, input_path, workspace)
+    except UploadError as e:
+        workspace.cleanup()
+        return _input_error(e)
+
+    if task == "uvr":
+        params = _uvr_params(model, shifts, segment, use_uvr, uvr_model_path)
+        job = job_manager.submit("uvr", lambda job: _run_uvr(job, in_path=in_path, **params),
+                                 ["upload", "separate", "archive"], workspace=workspace)
+    else:
+        params = dict(
+            in_path=in_path, rvc_model=rvc_model, output_format=output_format,
+            pitch_change_all=pitch_change_all, index_rate=index_rate, filter_radius=filter_radius,
+            rms_mix_rate=rms_mix_rate, pitch_detection_algorithm=pitch_detection_algorithm,
+            separate=separate, separator=separator, stem=stem, demucs_model=demucs_model,
+            shifts=shifts, segment=segment, applio_enabled=applio_enabled, applio_model=applio_model, uvr_model_path=uvr_model_path,
+            normalize=normalize, target_db=target_db, normalize_mode=normalize_mode
+        )
+        job = job_manager.submit(
+            "convert", lambda job: _run_convert(job, **params),
+            _convert_stages(separate, applio_enabled, applio_model, normalize),
+            workspace=workspace,
+            aliases=_convert_aliases(applio_enabled, applio_model)
+        )
+    return JSONResponse(job.to_dict(), status_code=202)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report a job's status, current stage and percent complete."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Stream a finished job's output file."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    if job.status == FAILED:
+        return JSONResponse({"error": job.error}, status_code=500)
+    if job.status != DONE:
+        return JSONResponse({"error": "Job not finished", "status": job.status, "stage": job.stage}, status_code=409)
+    return _result_response(job.result)
+
+@app.get("/scratch/stats")
+async def scratch_stats():
+    """Disk usage of the scratch root and the reaper's counters."""
+    return JSONResponse(scratch_reaper.stats())
+
+@app.get("/uvr/models/loaded")
+async def list_loaded_uvr_models():
+    """List UVR models resident in the process-wide model pool, with cache counters."""
+    return JSONResponse({"models": uvr_model_pool.loaded(), "stats": uvr_model_pool.stats()})
 
 @app.get("/models")
 async def list_models():
@@ -169,7 +404,8 @@ async def list_applio_models():
 
 @app.post("/stemxtract/process")
 async def stemxtract_process(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    input_path: Optional[str] = Form(None),
     stemxtract_server: Optional[str] = Form("http://192.168.2.12:60000"),
     task: Optional[str] = Form("remove_vocals"),
     model_name: Optional[str] = Form("htdemucs"),
@@ -192,13 +428,11 @@ async def stemxtract_process(
     
     Returns a zip file containing the final output and individual stems.
     """
-    in_path = None
+    # Owns the spooled upload; shared input_path files are never touched
+    workspace = ScratchWorkspace()
     try:
-        # Save uploaded file to temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1] or ".wav") as tmp_in:
-            data = await file.read()
-            tmp_in.write(data)
-            in_path = tmp_in.name
+        # Spool the upload (or resolve the shared path) to a local file
+        in_path, _ = await receive_input(file, input_path, workspace)
 
         # Initialize StemXtract client
         client = StemXtractClient(server_url=stemxtract_server)
@@ -226,8 +460,7 @@ async def stemxtract_process(
         # Result is a tuple: (final_output, processing_time, drums, bass, other, vocals)
         final_output_path, processing_time, drums_path, bass_path, other_path, vocals_path = result
         
-        # Create a zip file with all outputs
-        zip_dir = tempfile.mkdtemp()
+        # Stream a zip of all outputs straight from the result files, skipping missing ones
         output_files = {
             'final_output.wav': final_output_path,
             'drums.wav': drums_path,
@@ -235,36 +468,22 @@ async def stemxtract_process(
             'other.wav': other_path,
             'vocals.wav': vocals_path
         }
-        
-        # Copy files to zip directory, skipping None values
-        for name, src_path in output_files.items():
-            if src_path and os.path.exists(src_path):
-                dest = os.path.join(zip_dir, name)
-                shutil.copy2(src_path, dest)
-        
-        # Create zip file
-        zip_tmp_dir = tempfile.mkdtemp()
-        base = os.path.join(zip_tmp_dir, 'stemxtract_outputs')
-        zip_path = shutil.make_archive(base, 'zip', zip_dir)
-        
-        # Clean up temporary directories (keep zip for response)
-        shutil.rmtree(zip_dir, ignore_errors=True)
-        
-        return FileResponse(
-            zip_path, 
-            filename="stemxtract_outputs.zip", 
-            media_type="application/zip",
-            headers={"X-Processing-Time": str(processing_time)}
+        entries = {
+            name: src_path for name, src_path in output_files.items()
+            if src_path and os.path.exists(src_path)
+        }
+        return zip_response(
+            entries,
+            "stemxtract_outputs.zip",
+            headers={"X-Processing-Time": str(processing_time)},
+            background=BackgroundTask(workspace.cleanup)
         )
+    except UploadError as e:
+        workspace.cleanup()
+        return _input_error(e)
     except Exception as e:
+        workspace.cleanup()
         return JSONResponse({"error": str(e)}, status_code=500)
-    finally:
-        # Clean up input file in all cases
-        if in_path and os.path.exists(in_path):
-            try:
-                os.remove(in_path)
-            except Exception:
-                pass  # Ignore cleanup errors
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000)
@@ -1,63 +1,72 @@
 # server/rvc_infer.py
-import os, tempfile, subprocess, contextlib, wave, numpy as np, shutil
-import urllib.request
-import urllib.parse
-import torch, warnings, librosa, importlib, hashlib, math
+import os, subprocess, contextlib, numpy as np
+import http.client
+import threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+import torch, warnings, librosa, importlib, math
 from scipy.io import wavfile
+import applio_client
+import scratch
+import demucs_engine
+import ingest
+import rvc_worker
+from separation_cache import SeparationCache
+import wav_normalize
+import zipstream
 warnings.filterwarnings("ignore")
 
-def peak_normalize_wav(path, target_db=-0.1):
-    with contextlib.closing(wave.open(path, 'rb')) as wf:
-        n_channels = wf.getnchannels()
-        sampwidth = wf.getsampwidth()
-        framerate = wf.getframerate()
-        n_frames = wf.getnframes()
-        audio = wf.readframes(n_frames)
-    if sampwidth != 2:
-        return
-    samples = np.frombuffer(audio, dtype=np.int16).astype(np.float32)
-    peak = np.max(np.abs(samples)) / 32768.0
-    if peak == 0:
-        return
-    target_amp = 10 ** (target_db / 20.0)
-    gain = target_amp / peak
-    samples = np.clip(samples * gain, -32768, 32767).astype(np.int16)
-    with contextlib.closing(wave.open(path, 'wb')) as wf:
-        wf.setnchannels(n_channels)
-        wf.setsampwidth(2)
-        wf.setframerate(framerate)
-        wf.writeframes(samples.tobytes())
-
-def demucs_run(in_path, model=None, shifts=None, segment=None):
-    """Run Demucs once and return the output directory containing all stems."""
-    tmp_out = tempfile.mkdtemp()
+def _demucs_shifts(shifts):
+    try:
+        s = int(shifts)
+    except (TypeError, ValueError):
+        return None
+    return s if s > 0 else None
+
+
+def _demucs_segment(segment):
+    try:
+        seg = float(segment)
+    except (TypeError, ValueError):
+        return None
+    return seg if seg > 0 else None
+
+
+def demucs_run(in_path, model=None, shifts=None, segment=None, workspace=None):
+    """Run Demucs once and return the output directory containing all stems.
+
+    Uses the resident in-process engine when the demucs Python API is available,
+    otherwise shells out to the ``demucs`` CLI. Both produce the same
+    ``<tmp>/<model>/<track>/<stem>.wav`` layout, inside ``workspace`` when given.
+    """
+    tmp_out = scratch.mkdtemp(workspace, "demucs_")
     model_name = model or os.environ.get("DEMUCS_MODEL", "htdemucs")
+    shifts = _demucs_shifts(shifts)
+    segment = _demucs_segment(segment)
+    base = os.path.splitext(os.path.basename(in_path))[0]
+    out_dir = os.path.join(tmp_out, model_name, base)
+
+    if demucs_engine.use_api():
+        stems, samplerate = demucs_engine.default_engine.separate(
+            in_path, model=model_name, shifts=shifts, segment=segment
+        )
+        demucs_engine.write_stems(stems, samplerate, out_dir)
+        return out_dir
+
     cmd = ["demucs", "-n", model_name, "-o", tmp_out, in_path]
     if shifts is not None:
-        try:
-            s = int(shifts)
-            if s > 0:
-                cmd += ["--shifts", str(s)]
-        except (TypeError, ValueError):
-            pass
+        cmd += ["--shifts", str(shifts)]
     if segment is not None:
-        try:
-            seg = float(segment)
-            if seg > 0:
-                cmd += ["--segment", str(seg)]
-        except (TypeError, ValueError):
-            pass
+        cmd += ["--segment", str(segment)]
     subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-    base = os.path.splitext(os.path.basename(in_path))[0]
-    out_dir = os.path.join(tmp_out, model_name, base)
     if not os.path.isdir(out_dir):
         raise FileNotFoundError(f"Demucs output directory missing: {out_dir}")
     return out_dir
 
 
-def demucs_separate(in_path, stem='vocals', model=None, shifts=None, segment=None):
+def demucs_separate(in_path, stem='vocals', model=None, shifts=None, segment=None, workspace=None):
     """Run Demucs (htdemucs) and return path to requested stem wav."""
-    out_dir = demucs_run(in_path, model=model, shifts=shifts, segment=segment)
+    out_dir = demucs_run(in_path, model=model, shifts=shifts, segment=segment, workspace=workspace)
     stem_name = "vocals" if stem not in ["drums","bass","other"] else stem
     stem_path = os.path.join(out_dir, f"{stem_name}.wav")
     if not os.path.exists(stem_path):
@@ -70,8 +79,11 @@ class UVRSeparator:
     
     def __init__(self, model_path=None, device=None, is_half=True):
         from uvr5_pack.lib_v5 import spec_utils
-        from uvr5_pack.utils import _get_name_params, inference
-        from uvr5_pack.lib_v5.model_param_init import ModelParameters
+        from uvr5_pack.model_index import model_index
+        from uvr5_pack.lib_v5.model_param_init import get_model_params
+        from uvr5_pack.lib_v5.optimize import (bf16_supported, cpu_perf_enabled, fold_batchnorm, fold_bn_enabled,
+                                               inference_context, prepare_cpu_model)
+        from uvr5_pack.lib_v5.compiled import CompiledUVRNet, compiled_dir_for, torchscript_enabled
         
         self.model_path = model_path or os.environ.get("UVR_MODEL_PATH", "/uvr5_weights/2_HP-UVR.pth")
         self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
@@ -83,39 +95,75 @@ class UVRSeparator:
             'window_size': 512,
             'agg': 10,
             'high_end_process': 'mirroring',
+            'batch_size': os.environ.get("UVR_BATCH_SIZE", "auto"),
         }
         
-        nn_arch_sizes = [31191, 33966, 61968, 123821, 123812, 537238]
-        model_size = math.ceil(os.stat(self.model_path).st_size / 1024)
-        nn_architecture = '{}KB'.format(min(nn_arch_sizes, key=lambda x: abs(x - model_size)))
-        
-        nets = importlib.import_module(
-            'uvr5_pack.lib_v5.nets' + f'_{nn_architecture}'.replace('_{}KB'.format(nn_arch_sizes[0]), ''),
-            package=None
-        )
-        
-        model_hash = hashlib.md5(open(self.model_path, 'rb').read()).hexdigest()
-        param_name, model_params_d = _get_name_params(self.model_path, model_hash)
+        # md5, nets variant and params file come from the sidecar index after the first load
+        info = model_index.resolve(self.model_path)
+        nets = importlib.import_module(info['nets'], package=None)
         
-        mp = ModelParameters(model_params_d)
+        mp = get_model_params(info['params'])
         model = nets.CascadedASPPNet(mp.param['bins'] * 2)
         cpk = torch.load(self.model_path, map_location='cpu')
         model.load_state_dict(cpk)
         model.eval()
+
+        # Fold BatchNorm into the convs before any dtype change, so the folding math runs in fp32
+        self.fold_bn = fold_bn_enabled()
+        if self.fold_bn:
+            model = fold_batchnorm(model)
+
+        # Opt-in CPU performance mode (UVR_CPU_PERF=1): folded BN, channels-last, bf16 autocast
+        self.cpu_perf = self.device == 'cpu' and cpu_perf_enabled()
+        if self.cpu_perf:
+            model = prepare_cpu_model(model)
+            self.data['cpu_perf'] = True
+            self.data['bf16'] = bf16_supported()
         
         if self.is_half:
             model = model.half().to(self.device)
         else:
             model = model.to(self.device)
+
+        # TorchScript trace per window size, cached next to the weights (UVR_TORCHSCRIPT=0 disables)
+        self.compile_error = None
+        if torchscript_enabled():
+            split_bin = mp.param['band'][1]['crop_stop']
+            if self.cpu_perf:
+                mode = 'perf-bf16' if self.data.get('bf16') else 'perf'
+            else:
+                mode = 'fused' if self.fold_bn else 'eager'
+            key = '{}-sb{}-{}-{}-{}'.format(info['md5'], split_bin, str(self.device).split(':')[0], self.dtype, mode)
+            compiled = CompiledUVRNet(
+                model, split_bin, key, compiled_dir_for(self.model_path),
+                context=lambda: inference_context(self.cpu_perf, self.data.get('bf16'))
+            )
+            try:
+                compiled.compiled(self.data['window_size'])
+                model = compiled
+            except Exception as e:
+                # Tracing is an optimization; the eager net still works
+                self.compile_error = str(e)
         
         self.mp = mp
         self.model = model
+
+    @property
+    def dtype(self):
+        return 'float16' if self.is_half else 'float32'
+
+    @property
+    def nbytes(self):
+        """Approximate resident size of the loaded weights and buffers."""
+        tensors = list(self.model.parameters()) + list(self.model.buffers())
+        return int(sum(t.numel() * t.element_size() for t in tensors))
     
     def separate(self, music_file, vocal_path=None, instrument_path=None):
-        """Separate audio into vocals and instruments."""
-        from uvr5_pack.lib_v5 import spec_utils
-        from uvr5_pack.utils import inference
-        
+        """Separate audio into vocals and instruments.
+
+        Tracks longer than ``UVR_STREAM_MIN_SECONDS`` (default 300) are processed
+        in overlapping chunks by :meth:`separate_streaming` to bound memory.
+        """
         if vocal_path is None and instrument_path is None:
             raise ValueError("At least one output path must be specified")
         
@@ -124,87 +172,396 @@ class UVRSeparator:
             os.makedirs(os.path.dirname(vocal_path), exist_ok=True)
         if instrument_path:
             os.makedirs(os.path.dirname(instrument_path), exist_ok=True)
+
+        decoded = ingest.open_decoded(music_file)
+        duration = decoded.duration if decoded is not None else _audio_duration(music_file)
+        stream_min = float(os.environ.get("UVR_STREAM_MIN_SECONDS", "300"))
+        if duration > stream_min:
+            return self.separate_streaming(music_file, vocal_path=vocal_path, instrument_path=instrument_path)
         
-        X_wave, X_spec_s = {}, {}
-        bands_n = len(self.mp.param['band'])
+        from uvr5_pack.lib_v5.resample import resample
+
+        bp = self.mp.param['band'][len(self.mp.param['band'])]
+        if decoded is not None:
+            # Canonical float32 input (see ingest.py): read the samples straight from the memmap
+            X_wave, native_sr = np.ascontiguousarray(decoded.array().T), decoded.samplerate
+            if X_wave.shape[0] == 1:
+                X_wave = X_wave[0]
+        else:
+            # Decode at the native rate; the cached resampler skips files already at the top band rate
+            X_wave, native_sr = librosa.core.load(music_file, sr=None, mono=False, dtype=np.float32)
+        X_wave = resample(X_wave, native_sr, bp['sr'], bp['res_type'])
+        if X_wave.ndim == 1:
+            X_wave = np.asfortranarray([X_wave, X_wave])
+
+        wav_vocals, wav_instrument = self._separate_wave(
+            X_wave[:2], vocals=vocal_path is not None, instrument=instrument_path is not None
+        )
+        if instrument_path:
+            wavfile.write(instrument_path, self.mp.param['sr'], _to_int16(wav_instrument))
+        if vocal_path:
+            wavfile.write(vocal_path, self.mp.param['sr'], _to_int16(wav_vocals))
         
-        for d in range(bands_n, 0, -1):
-            bp = self.mp.param['band'][d]
-            if d == bands_n:
-                X_wave[d], _ = librosa.core.load(
-                    music_file, bp['sr'], False, dtype=np.float32, res_type=bp['res_type']
-                )
-                if X_wave[d].ndim == 1:
-                    X_wave[d] = np.asfortranarray([X_wave[d], X_wave[d]])
-            else:
-                X_wave[d] = librosa.core.resample(
-                    X_wave[d + 1], self.mp.param['band'][d + 1]['sr'], bp['sr'], res_type=bp['res_type']
-                )
-            
-            X_spec_s[d] = spec_utils.wave_to_spectrogram_mt(
-                X_wave[d], bp['hl'], bp['n_fft'], self.mp.param['mid_side'],
-                self.mp.param['mid_side_b2'], self.mp.param['reverse']
+        return vocal_path, instrument_path
+
+    def _spectrogram_peak(self, X_wave):
+        """Peak magnitude of the combined spectrogram the model would see for ``X_wave``."""
+        from uvr5_pack.lib_v5 import spec_utils
+
+        X_spec_m = spec_utils.combine_spectrograms(spec_utils.wave_to_spectrogram_bands(X_wave, self.mp), self.mp)
+        return float(np.abs(X_spec_m).max())
+
+    def _separate_wave(self, X_wave, vocals=True, instrument=True, coef=None):
+        """Separate a stereo wave sampled at the top band rate.
+
+        Returns (vocals, instrument) as (samples, 2) float arrays at ``mp.param['sr']``;
+        an output that was not requested is None. ``coef`` overrides the level the
+        model input is normalized by (see uvr5_pack.utils.inference).
+        """
+        from uvr5_pack.lib_v5 import spec_utils
+        from uvr5_pack.utils import inference
+
+        # All band x channel STFTs run in the shared stft_engine pool
+        X_spec_s = spec_utils.wave_to_spectrogram_bands(X_wave, self.mp)
+        bands_n = len(self.mp.param['band'])
+        bp = self.mp.param['band'][bands_n]
+        if self.data['high_end_process'] != 'none':
+            input_high_end_h = (bp['n_fft'] // 2 - bp['crop_stop']) + (
+                self.mp.param['pre_filter_stop'] - self.mp.param['pre_filter_start']
             )
-            
-            if d == bands_n and self.data['high_end_process'] != 'none':
-                input_high_end_h = (bp['n_fft'] // 2 - bp['crop_stop']) + (
-                    self.mp.param['pre_filter_stop'] - self.mp.param['pre_filter_start']
-                )
-                input_high_end = X_spec_s[d][:, bp['n_fft'] // 2 - input_high_end_h:bp['n_fft'] // 2, :]
+            input_high_end = X_spec_s[bands_n][:, bp['n_fft'] // 2 - input_high_end_h:bp['n_fft'] // 2, :]
+        del X_wave
         
         X_spec_m = spec_utils.combine_spectrograms(X_spec_s, self.mp)
+        del X_spec_s
         aggresive_set = float(self.data['agg'] / 100)
         aggressiveness = {'value': aggresive_set, 'split_bin': self.mp.param['band'][1]['crop_stop']}
         
         with torch.no_grad():
-            pred, X_mag, X_phase = inference(X_spec_m, self.device, self.model, aggressiveness, self.data)
+            pred, X_mag = inference(X_spec_m, self.device, self.model, aggressiveness, self.data, coef=coef)
         
         if self.data['postprocess']:
             pred_inv = np.clip(X_mag - pred, 0, np.inf)
             pred = spec_utils.mask_silence(pred, pred_inv)
         
-        y_spec_m = pred * X_phase
+        # Trig-free mask application; everything stays complex64 through the iSTFTs
+        y_spec_m = spec_utils.with_phase_of(pred, X_spec_m, X_mag)
+        del pred, X_mag
         v_spec_m = X_spec_m - y_spec_m
-        
-        if instrument_path:
+
+        def to_wave(spec_m):
             if self.data['high_end_process'].startswith('mirroring'):
                 input_high_end_ = spec_utils.mirroring(
-                    self.data['high_end_process'], y_spec_m, input_high_end, self.mp
-                )
-                wav_instrument = spec_utils.cmb_spectrogram_to_wave(
-                    y_spec_m, self.mp, input_high_end_h, input_high_end_
+                    self.data['high_end_process'], spec_m, input_high_end, self.mp
                 )
-            else:
-                wav_instrument = spec_utils.cmb_spectrogram_to_wave(y_spec_m, self.mp)
-            
-            wavfile.write(
-                instrument_path, self.mp.param['sr'],
-                (np.array(wav_instrument) * 32768).astype("int16")
-            )
-        
+                return spec_utils.cmb_spectrogram_to_wave(spec_m, self.mp, input_high_end_h, input_high_end_)
+            return spec_utils.cmb_spectrogram_to_wave(spec_m, self.mp)
+
+        wav_instrument = to_wave(y_spec_m) if instrument else None
+        wav_vocals = to_wave(v_spec_m) if vocals else None
+        return wav_vocals, wav_instrument
+
+    def _stream_alignment(self, native_sr):
+        """Sample granularity (at the top band rate) that keeps chunk edges on STFT hops
+        of every band and on whole samples of the native input rate."""
+        top_sr = self.mp.param['band'][len(self.mp.param['band'])]['sr']
+        align = top_sr // math.gcd(top_sr, native_sr)
+        for bp in self.mp.param['band'].values():
+            hop = bp['hl'] * top_sr / bp['sr']
+            if hop == int(hop):
+                align = align * int(hop) // math.gcd(align, int(hop))
+        return align
+
+    def separate_streaming(self, music_file, vocal_path=None, instrument_path=None,
+                           chunk_seconds=None, overlap_seconds=None):
+        """Separate a long track in overlapping chunks with constant memory.
+
+        Each chunk is separated independently; consecutive chunk outputs are
+        cross-faded linearly across the overlap and appended to the output files,
+        so only one chunk (plus the overlap tail) is held in memory at a time.
+        The overlap defaults to the model's ``offset`` context in top-band frames.
+
+        The nets are not scale-invariant, so a first pass (STFTs only) finds the
+        track's peak spectrogram magnitude and every chunk is normalized by it,
+        as in a whole-track pass.
+        """
+        import soundfile as sf
+
+        bands_n = len(self.mp.param['band'])
+        bp = self.mp.param['band'][bands_n]
+        top_sr = bp['sr']
+        reader = _ChunkReader(music_file)
+        align = self._stream_alignment(reader.samplerate)
+
+        def aligned(n):
+            return max(align, int(math.ceil(n / align)) * align)
+
+        chunk_seconds = chunk_seconds or float(os.environ.get("UVR_CHUNK_SECONDS", "30"))
+        if overlap_seconds is None:
+            overlap = aligned(self.model.offset * bp['hl'])
+        else:
+            overlap = aligned(overlap_seconds * top_sr)
+        chunk = max(aligned(chunk_seconds * top_sr), 2 * overlap)
+        step = chunk - overlap
+        total = int(math.ceil(reader.frames * top_sr / reader.samplerate))
+
+        def chunks():
+            """(start, length) of each chunk, in top-band samples."""
+            start = 0
+            while start < total:
+                length = min(chunk, total - start)
+                yield start, length
+                start += step if start + length < total else length
+
+        coef = max(self._spectrogram_peak(reader.read(start, length, top_sr, bp['res_type']))
+                   for start, length in chunks())
+
+        writers = {}
         if vocal_path:
-            if self.data['high_end_process'].startswith('mirroring'):
-                input_high_end_ = spec_utils.mirroring(
-                    self.data['high_end_process'], v_spec_m, input_high_end, self.mp
-                )
-                wav_vocals = spec_utils.cmb_spectrogram_to_wave(
-                    v_spec_m, self.mp, input_high_end_h, input_high_end_
-                )
-            else:
-                wav_vocals = spec_utils.cmb_spectrogram_to_wave(v_spec_m, self.mp)
-            
-            wavfile.write(
-                vocal_path, self.mp.param['sr'],
-                (np.array(wav_vocals) * 32768).astype("int16")
-            )
-        
+            writers['vocals'] = sf.SoundFile(vocal_path, 'w', samplerate=self.mp.param['sr'], channels=2, subtype='PCM_16')
+        if instrument_path:
+            writers['instrument'] = sf.SoundFile(instrument_path, 'w', samplerate=self.mp.param['sr'], channels=2, subtype='PCM_16')
+        tails = {name: None for name in writers}
+        fade_in = np.linspace(0.0, 1.0, overlap, endpoint=False, dtype=np.float32)[:, None]
+
+        try:
+            for start, length in chunks():
+                X_wave = reader.read(start, length, top_sr, bp['res_type'])
+                outputs = dict(zip(('vocals', 'instrument'), self._separate_wave(
+                    X_wave, vocals='vocals' in writers, instrument='instrument' in writers, coef=coef
+                )))
+                last = start + length >= total
+                for name, writer in writers.items():
+                    wav = _fit_length(outputs[name], length)
+                    if tails[name] is not None:
+                        n = len(tails[name])
+                        wav[:n] = tails[name] * (1.0 - fade_in[:n]) + wav[:n] * fade_in[:n]
+                    if last:
+                        writer.write(_to_int16(wav))
+                    else:
+                        writer.write(_to_int16(wav[:step]))
+                        tails[name] = wav[step:].copy()
+        finally:
+            for writer in writers.values():
+                writer.close()
+
         return vocal_path, instrument_path
 
 
-def uvr_separate(in_path, stem='vocals', model_path=None):
+def _to_int16(wav):
+    return (np.clip(np.asarray(wav), -1.0, 32767 / 32768) * 32768).astype("int16")
+
+
+def _fit_length(wav, length):
+    """Trim or zero-pad a (samples, channels) wave to exactly ``length`` samples."""
+    wav = np.asarray(wav, dtype=np.float32)
+    if len(wav) >= length:
+        return wav[:length].copy()
+    return np.pad(wav, ((0, length - len(wav)), (0, 0)))
+
+
+def _audio_duration(path):
+    """Duration in seconds, probed from the file header where possible."""
+    duration = ingest.probe_duration(path)
+    if duration is None:
+        return librosa.get_duration(path=path)
+    return duration
+
+
+class _ChunkReader:
+    """Random-access stereo reader returning chunks resampled to a target rate.
+
+    Forward reads share one StreamingResampler, so chunk edges are resampled
+    exactly as in a whole-file conversion; seeking backwards restarts it.
+    """
+
+    def __init__(self, path):
+        import soundfile as sf
+        self.path = path
+        self._decoded = ingest.open_decoded(path)
+        if self._decoded is not None:
+            self._file = None
+            self.samplerate = self._decoded.samplerate
+            self.frames = self._decoded.frames
+            self._samples = self._decoded.array()
+            self._stream = None
+            return
+        try:
+            self._file = sf.SoundFile(path)
+            self.samplerate = self._file.samplerate
+            self.frames = self._file.frames
+        except (RuntimeError, TypeError, sf.LibsndfileError):
+            # Formats libsndfile cannot read are decoded per chunk through librosa/audioread
+            self._file = None
+            self.samplerate = librosa.get_samplerate(path)
+            self.frames = int(round(librosa.get_duration(path=path) * self.samplerate))
+        self._stream = None
+
+    def _read_native(self, n_start, n_len):
+        """(2, <= n_len) float32 frames at the file's own rate."""
+        if self._decoded is not None:
+            wave = np.array(self._samples[n_start:n_start + n_len].T)
+        elif self._file is not None:
+            self._file.seek(n_start)
+            wave = self._file.read(n_len, dtype='float32', always_2d=True).T
+        else:
+            wave, _ = librosa.core.load(
+                self.path, sr=None, mono=False, dtype=np.float32,
+                offset=n_start / self.samplerate, duration=n_len / self.samplerate
+            )
+            wave = np.atleast_2d(wave)
+        if wave.shape[0] == 1:
+            wave = np.concatenate([wave, wave])
+        return np.asfortranarray(wave[:2])
+
+    def read(self, start, length, sr, res_type):
+        """Read ``length`` samples starting at ``start`` (both in units of ``sr``)."""
+        from uvr5_pack.lib_v5.resample import StreamingResampler, quality_for, resample
+
+        if self.samplerate == sr:
+            return _fit_length(self._read_native(start, length).T, length).T
+        if quality_for(res_type) is None:
+            n_start = start * self.samplerate // sr
+            n_len = int(math.ceil(length * self.samplerate / sr))
+            wave = resample(self._read_native(n_start, n_len), self.samplerate, sr, res_type)
+            return _fit_length(wave.T, length).T
+
+        stream = self._stream
+        if stream is None or stream['key'] != (sr, res_type) or start < stream['out_start']:
+            stream = self._stream = {
+                'key': (sr, res_type),
+                'resampler': StreamingResampler(self.samplerate, sr, res_type),
+                'out': np.zeros((2, 0), dtype=np.float32),
+                'out_start': 0,
+                'in_pos': 0,
+                'eof': False,
+            }
+        end = start + length
+        while stream['out_start'] + stream['out'].shape[1] < end and not stream['eof']:
+            missing = end - stream['out_start'] - stream['out'].shape[1]
+            n_len = max(1 << 16, int(math.ceil(missing * self.samplerate / sr)) + 1024)
+            block = self._read_native(stream['in_pos'], n_len)
+            stream['in_pos'] += block.shape[1]
+            parts = [stream['resampler'].process(block)]
+            if block.shape[1] < n_len:
+                stream['eof'] = True
+                parts.append(stream['resampler'].flush())
+            stream['out'] = np.concatenate([stream['out']] + parts, axis=1)
+        # Drop output before this chunk; later chunks only start at or after it
+        stream['out'] = stream['out'][:, max(0, start - stream['out_start']):]
+        stream['out_start'] = max(start, stream['out_start'])
+        wave = stream['out'][:, :length]
+        return _fit_length(wave.T, length).T
+
+
+class UVRModelPool:
+    """Process-wide cache of loaded UVR separators.
+
+    Separators are keyed by (model_path, device, dtype) and evicted in LRU order
+    once the summed weight size exceeds ``max_bytes`` (``UVR_POOL_MAX_MB`` env,
+    default 2048). A single model larger than the budget is still kept resident.
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("UVR_POOL_MAX_MB", "2048")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(model_path=None, device=None, is_half=True):
+        model_path = os.path.abspath(model_path or os.environ.get("UVR_MODEL_PATH", "/uvr5_weights/2_HP-UVR.pth"))
+        device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        dtype = 'float16' if is_half and device == 'cuda' else 'float32'
+        return (model_path, device, dtype)
+
+    def get(self, model_path=None, device=None, is_half=True):
+        """Return a resident UVRSeparator, loading it on first use."""
+        key = self._key(model_path, device, is_half)
+        with self._lock:
+            separator = self._lookup(key)
+            if separator is not None:
+                return separator
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Load outside the pool lock so warm requests for other models are not blocked.
+        with load_lock:
+            with self._lock:
+                separator = self._lookup(key)
+                if separator is not None:
+                    return separator
+                self.misses += 1
+            separator = UVRSeparator(model_path=key[0], device=key[1], is_half=key[2] == 'float16')
+            with self._lock:
+                self._entries[key] = {
+                    'separator': separator,
+                    'nbytes': separator.nbytes,
+                    'loaded_at': time.time(),
+                    'last_used': time.time(),
+                }
+                self._evict()
+                self._load_locks.pop(key, None)
+            return separator
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        entry['last_used'] = time.time()
+        self.hits += 1
+        return entry['separator']
+
+    def _evict(self):
+        total = sum(e['nbytes'] for e in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry['nbytes']
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def loaded(self):
+        """List resident models, least recently used first."""
+        with self._lock:
+            return [
+                {
+                    'model_path': key[0],
+                    'device': key[1],
+                    'dtype': key[2],
+                    'bytes': entry['nbytes'],
+                    'loaded_at': entry['loaded_at'],
+                    'last_used': entry['last_used'],
+                }
+                for key, entry in self._entries.items()
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'models': len(self._entries),
+                'bytes': sum(e['nbytes'] for e in self._entries.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+
+uvr_model_pool = UVRModelPool()
+
+
+def uvr_separate(in_path, stem='vocals', model_path=None, workspace=None):
     """Run UVR separation and return path to requested stem wav."""
-    tmp_out = tempfile.mkdtemp()
-    separator = UVRSeparator(model_path=model_path)
+    tmp_out = scratch.mkdtemp(workspace, "uvr_")
+    separator = uvr_model_pool.get(model_path=model_path)
     
     vocal_path = os.path.join(tmp_out, "vocals.wav")
     instrument_path = os.path.join(tmp_out, "instrument.wav")
@@ -228,10 +585,15 @@ class RVCConverter:
         }
         # Applio server URL (environment variable or default)
         self.applio_server = os.environ.get("APPLIO_SERVER", "http://applio:8001")
+        self.separation_cache = SeparationCache()
+        # Applio calls overlapping local RVC conversions (APPLIO_CONCURRENCY, default 4)
+        self._applio_executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("APPLIO_CONCURRENCY", "4")), thread_name_prefix="applio"
+        )
 
-    def _webui_call(self, in_path, out_path, **kw):
+    def _webui_call(self, src_path, out_path, **kw):
         args = ["python", self.paths["webui_cli"],
-                "--input", in_path,
+                "--input", src_path,
                 "--output", out_path]
         voice = kw.get("rvc_model")
         if voice:
@@ -254,9 +616,9 @@ class RVCConverter:
             args += ["--f0-method", str(kw["pitch_detection_algorithm"])]
         return args
 
-    def _mangio_call(self, in_path, out_path, **kw):
+    def _mangio_call(self, src_path, out_path, **kw):
         args = ["python", self.paths["mangio"],
-                "--input_path", in_path,
+                "--input_path", src_path,
                 "--output_path", out_path]
         voice = kw.get("rvc_model")
         if voice:
@@ -281,46 +643,17 @@ class RVCConverter:
 
     def _process_with_applio(self, vocal_path, **kw):
         """Process separated vocals through Applio container via HTTP and return the output path."""
-        import json
-        from urllib.error import URLError, HTTPError
-        import uuid
-        
         output_format = kw.get("output_format", "wav")
         normalize = kw.get("normalize", True)
         target_db = kw.get("target_db", -0.1)
 
-        # Prepare multipart form data with proper boundary
-        boundary = uuid.uuid4().hex
-        
-        # Read the audio file
-        with open(vocal_path, 'rb') as f:
-            audio_data = f.read()
-        
-        # Build multipart form data
-        body = []
-        
-        # Add file
-        body.append(f'--{boundary}')
-        body.append(f'Content-Disposition: form-data; name="file"; filename="{os.path.basename(vocal_path)}"')
-        body.append('Content-Type: audio/wav')
-        body.append('')
-        body.append(audio_data.decode('latin1'))  # Binary data
-        
-        # Add model_name
+        fields = {}
         model_name = kw.get("applio_model") if kw.get("applio_model") else kw.get("rvc_model")
         if model_name:
-            body.append(f'--{boundary}')
-            body.append('Content-Disposition: form-data; name="model_name"')
-            body.append('')
-            body.append(model_name)
-        
-        # Add pitch
+            fields["model_name"] = model_name
         if kw.get("pitch_change_all") is not None:
-            body.append(f'--{boundary}')
-            body.append('Content-Disposition: form-data; name="pitch"')
-            body.append('')
-            body.append(str(int(kw["pitch_change_all"])))
-        
+            fields["pitch"] = str(int(kw["pitch_change_all"]))
+
         # Add other parameters
         params = {
             'index_rate': kw.get("index_rate"),
@@ -329,57 +662,135 @@ class RVCConverter:
             'f0_method': kw.get("pitch_detection_algorithm"),
             'output_format': output_format
         }
-        
         for param_name, param_value in params.items():
             if param_value is not None:
-                body.append(f'--{boundary}')
-                body.append(f'Content-Disposition: form-data; name="{param_name}"')
-                body.append('')
-                body.append(str(param_value))
-        
-        body.append(f'--{boundary}--')
-        body_str = '\r\n'.join(str(b) if not isinstance(b, bytes) else b.decode('latin1') for b in body)
-        body_bytes = body_str.encode('latin1')
-        
+                fields[param_name] = str(param_value)
+
+        # The vocal file is streamed from disk in chunks, never held in memory whole
+        body = applio_client.MultipartEncoder(fields, {"file": vocal_path})
+
         # Make HTTP request to Applio container with configurable timeout
         timeout = int(os.environ.get("APPLIO_TIMEOUT", "120"))  # Default 2 minutes
-        
+        tmp_dir = scratch.mkdtemp(kw.get("workspace"), "applio_")
+        applio_out = os.path.join(tmp_dir, "applio_out." + ("wav" if output_format == "wav" else "mp3"))
+
         try:
-            req = urllib.request.Request(
-                f"{self.applio_server}/convert",
-                data=body_bytes,
-                headers={
-                    'Content-Type': f'multipart/form-data; boundary={boundary}',
-                    'Content-Length': str(len(body_bytes))
-                },
-                method='POST'
-            )
-            
-            with urllib.request.urlopen(req, timeout=timeout) as response:
-                if response.status != 200:
-                    raise RuntimeError(f"Applio server returned status {response.status}")
-                
-                # Save response to file
-                tmp_dir = tempfile.mkdtemp()
-                applio_out = os.path.join(tmp_dir, "applio_out." + ("wav" if output_format == "wav" else "mp3"))
-                
-                with open(applio_out, 'wb') as out_file:
-                    out_file.write(response.read())
-                
-        except (URLError, HTTPError) as e:
+            applio_client.get_client(self.applio_server).post_to_file("/convert", body, applio_out, timeout=timeout)
+        except (OSError, http.client.HTTPException) as e:
             raise RuntimeError(f"Failed to connect to Applio server at {self.applio_server}: {e}")
         except Exception as e:
             raise RuntimeError(f"Applio processing failed: {e}")
 
         if normalize and applio_out.endswith(".wav"):
             try:
-                peak_normalize_wav(applio_out, target_db)
+                wav_normalize.normalize_wav(applio_out, target_db, kw.get("normalize_mode", "peak"))
             except (ValueError, OSError, RuntimeError):
                 # Normalization failed, continue without it
                 pass
 
         return applio_out
 
+    @staticmethod
+    @contextlib.contextmanager
+    def _stage(kw, name):
+        """Enter pipeline stage ``name`` through the caller's ``stage_hook`` (see jobs.py)
+        and record its wall time in ``stats["timings"]``."""
+        hook = kw.get("stage_hook")
+        stats = kw.get("stats")
+        start = time.perf_counter()
+        try:
+            with hook(name) if hook is not None else contextlib.nullcontext():
+                yield
+        finally:
+            if stats is not None:
+                stats.setdefault("timings", {})[name] = time.perf_counter() - start
+
+    @staticmethod
+    def _decode_input(in_path, workspace=None, stats=None):
+        """Decode ``in_path`` once for the separators (see ingest.py).
+
+        The time lands in ``stats["timings"]["decode"]`` inside the enclosing
+        stage. Inputs that cannot be decoded here are passed on unchanged.
+        """
+        if not ingest.enabled():
+            return in_path
+        start = time.perf_counter()
+        try:
+            path = ingest.decode(in_path, workspace).path
+        except Exception:
+            return in_path
+        if stats is not None:
+            stats.setdefault("timings", {})["decode"] = time.perf_counter() - start
+        return path
+
+    def _run_rvc(self, cmd):
+        """Execute an RVC CLI command, on a warm worker when enabled (RVC_WORKERS)."""
+        pool = rvc_worker.get_pool(cmd[1])
+        if pool is not None:
+            timeout = os.environ.get("RVC_WORKER_TIMEOUT")
+            try:
+                pool.run(cmd[2:], timeout=float(timeout) if timeout else None)
+            except RuntimeError as e:
+                raise RuntimeError(f"RVC CLI failed: {e}")
+            return
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"RVC CLI failed: {proc.stderr or proc.stdout}")
+
+    def _separate(self, **kw):
+        """Run the requested separator exactly once.
+
+        Returns (stem_path, vocal_path): the stem fed to RVC and the vocal stem
+        Applio consumes, both taken from the same separator output.
+        """
+        in_path = kw["in_path"]
+        separator = kw.get("separator") or "demucs"  # Default to demucs for backward compatibility
+        stem = kw.get("stem") or "vocals"
+        stats = kw.get("stats")
+
+        cache_key = None
+        if self.separation_cache.enabled:
+            if separator == "uvr":
+                model = kw.get("uvr_model_path") or os.environ.get("UVR_MODEL_PATH", "/uvr5_weights/2_HP-UVR.pth")
+                settings = {}
+            else:
+                model = kw.get("demucs_model") or os.environ.get("DEMUCS_MODEL", "htdemucs")
+                # Normalized as demucs_run applies them, so equivalent requests share an entry
+                settings = {"shifts": _demucs_shifts(kw.get("shifts")), "segment": _demucs_segment(kw.get("segment"))}
+            cache_key = self.separation_cache.key(
+                in_path, separator=separator, model=model, stem=stem, **settings
+            )
+            cached = self.separation_cache.get(cache_key, kw.get("workspace"))
+            if cached is not None:
+                if stats is not None:
+                    stats["separation_cache"] = "hit"
+                return cached["stem"], cached["vocals"]
+
+        # Cache keys stay on the upload; the separator reads the decoded copy
+        in_path = self._decode_input(in_path, kw.get("workspace"), stats)
+        if separator == "uvr":
+            stem_path, out_dir = uvr_separate(
+                in_path, stem=stem, model_path=kw.get("uvr_model_path"), workspace=kw.get("workspace")
+            )
+        else:
+            stem_path, out_dir = demucs_separate(
+                in_path, stem=stem, model=kw.get("demucs_model"), shifts=kw.get("shifts"),
+                segment=kw.get("segment"), workspace=kw.get("workspace")
+            )
+
+        vocal_path = os.path.join(out_dir, "vocals.wav")
+        if not os.path.exists(vocal_path):
+            vocal_path = stem_path
+
+        if cache_key is not None:
+            if stats is not None:
+                stats["separation_cache"] = "miss"
+            cached = self.separation_cache.put(
+                cache_key, {"stem": stem_path, "vocals": vocal_path}, kw.get("workspace")
+            )
+            return cached["stem"], cached["vocals"]
+        return stem_path, vocal_path
+
     def convert(self, **kw):
         in_path = kw["in_path"]
         output_format = kw.get("output_format","wav")
@@ -393,18 +804,10 @@ class RVCConverter:
         work_input = in_path
         separated_vocal_path = None
         if kw.get("separate"):
-            work_input, _ = demucs_separate(in_path, stem=kw.get("stem","vocals"), model=kw.get("demucs_model"))
-            separated_vocal_path = work_input
-            separator = kw.get("separator", "demucs")  # Default to demucs for backward compatibility
-            stem = kw.get("stem", "vocals")
-            
-            if separator == "uvr":
-                model_path = kw.get("uvr_model_path")
-                work_input, _ = uvr_separate(in_path, stem=stem, model_path=model_path)
-            else:
-                work_input, _ = demucs_separate(in_path, stem=stem, model=kw.get("demucs_model"))
+            with self._stage(kw, "separate"):
+                work_input, separated_vocal_path = self._separate(**kw)
 
-        tmp_dir = tempfile.mkdtemp()
+        tmp_dir = scratch.mkdtemp(kw.get("workspace"), "rvc_")
         out_path = os.path.join(tmp_dir, "rvc_out." + ("wav" if output_format=="wav" else "mp3"))
 
         if os.path.exists(self.paths["webui_cli"]):
@@ -414,25 +817,40 @@ class RVCConverter:
         else:
             raise RuntimeError("No known RVC CLI found in /rvc (expected infer_cli.py or inference.py)")
 
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if proc.returncode != 0 or not os.path.exists(out_path):
-            raise RuntimeError(f"RVC CLI failed: {proc.stderr or proc.stdout}")
+        # Applio runs on its own container from the same separated vocal, so it is
+        # started now and overlaps the local RVC stage instead of following it
+        applio_future = None
+        if kw.get("applio_enabled") and separated_vocal_path and kw.get("applio_model"):
+            applio_future = self._applio_executor.submit(self._applio_stage, separated_vocal_path, **kw)
 
-        if normalize and out_path.endswith(".wav"):
-            try:
-                peak_normalize_wav(out_path, target_db)
-            except Exception:
-                pass
+        try:
+            with self._stage(kw, "rvc"):
+                self._run_rvc(cmd)
+            if not os.path.exists(out_path):
+                raise RuntimeError(f"RVC CLI failed: no output written to {out_path}")
 
-        # Process through Applio if enabled and vocal was separated
-        applio_out_path = None
-        if kw.get("applio_enabled") and separated_vocal_path and kw.get("applio_model"):
-            applio_out_path = self._process_with_applio(separated_vocal_path, **kw)
+            if normalize and out_path.endswith(".wav"):
+                with self._stage(kw, "normalize"):
+                    try:
+                        wav_normalize.normalize_wav(out_path, target_db, kw.get("normalize_mode", "peak"))
+                    except Exception:
+                        pass
+        except BaseException:
+            # Don't leave the Applio call running past a failed request
+            if applio_future is not None:
+                futures_wait([applio_future])
+            raise
+        applio_out_path = applio_future.result() if applio_future is not None else None
 
         # Always return a tuple (rvc_output, applio_output) where applio_output may be None
         return (out_path, applio_out_path)
 
-    def uvr(self, in_path, model=None, shifts=None, segment=None, use_uvr=False, uvr_model_path=None):
+    def _applio_stage(self, vocal_path, **kw):
+        with self._stage(kw, "applio"):
+            return self._process_with_applio(vocal_path, **kw)
+
+    def uvr(self, in_path, model=None, shifts=None, segment=None, use_uvr=False, uvr_model_path=None,
+            stage_hook=None, archive=True, workspace=None):
         """Separate all stems and return a zip archive path.
         
         Args:
@@ -442,32 +860,37 @@ class RVCConverter:
             segment: Demucs segment parameter (for backward compatibility)
             use_uvr: If True, use UVR separator instead of Demucs
             uvr_model_path: Path to UVR model weights
+            stage_hook: Optional ``stage(name)`` context manager factory for progress reporting
+            archive: If False, skip the zip and return {archive name: stem path} for streaming
+            workspace: ScratchWorkspace that owns the stems and archive (see scratch.py)
         """
+        kw = {"stage_hook": stage_hook}
         if use_uvr:
             # Use UVR separation
-            tmp_out = tempfile.mkdtemp()
-            separator = UVRSeparator(model_path=uvr_model_path)
+            tmp_out = scratch.mkdtemp(workspace, "uvr_")
+            separator = uvr_model_pool.get(model_path=uvr_model_path)
             
             vocal_path = os.path.join(tmp_out, "vocals.wav")
             instrument_path = os.path.join(tmp_out, "instrument.wav")
             
-            separator.separate(in_path, vocal_path=vocal_path, instrument_path=instrument_path)
-            
-            # Create zip archive with secure temporary file
-            fd, temp_path = tempfile.mkstemp(suffix='', prefix='uvr_archive_')
-            os.close(fd)
-            os.remove(temp_path)
-            archive_path = shutil.make_archive(temp_path, 'zip', tmp_out)
-            if not os.path.exists(archive_path):
-                raise FileNotFoundError("Failed to create UVR zip archive")
-            return archive_path
+            with self._stage(kw, "separate"):
+                in_path = self._decode_input(in_path, workspace)
+                separator.separate(in_path, vocal_path=vocal_path, instrument_path=instrument_path)
+            stems = {"vocals.wav": vocal_path, "instrument.wav": instrument_path}
+            prefix = 'uvr_archive_'
         else:
             # Use Demucs (original behavior)
-            out_dir = demucs_run(in_path, model=model, shifts=shifts, segment=segment)
-            fd, temp_path = tempfile.mkstemp(suffix='', prefix='demucs_archive_')
-            os.close(fd)
-            os.remove(temp_path)
-            archive_path = shutil.make_archive(temp_path, 'zip', out_dir)
-            if not os.path.exists(archive_path):
-                raise FileNotFoundError("Failed to create UVR zip archive")
-            return archive_path
+            with self._stage(kw, "separate"):
+                in_path = self._decode_input(in_path, workspace)
+                out_dir = demucs_run(in_path, model=model, shifts=shifts, segment=segment, workspace=workspace)
+            stems = zipstream.dir_entries(out_dir)
+            prefix = 'demucs_archive_'
+
+        if not archive:
+            return stems
+
+        # Create zip archive with secure temporary file
+        archive_path = scratch.mkstemp(workspace, suffix='.zip', prefix=prefix)
+        with self._stage(kw, "archive"):
+            zipstream.write_zip(stems, archive_path)
+        return archive_path
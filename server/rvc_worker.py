@@ -0,0 +1,243 @@
+# server/rvc_worker.py
+"""
+Persistent RVC inference workers.
+
+Running ``python /rvc/infer_cli.py ...`` per conversion pays Python start-up, the
+torch import and HuBERT/RMVPE/voice-model loads on every request. A worker is a
+long-lived interpreter that executes the same CLI in-process for each job, so
+imports stay warm and checkpoints loaded through ``torch.load`` (voice models,
+RMVPE) and fairseq's ``load_model_ensemble_and_task`` (HuBERT) are memoized
+between jobs.
+
+Jobs use the argument lists built by ``RVCConverter._webui_call`` /
+``_mangio_call`` as their schema and are exchanged as JSON lines over the
+worker's stdin/stdout pipes:
+
+    -> {"argv": ["--input", "...", "--output", "...", ...]}
+    <- {"ok": true} | {"ok": false, "error": "..."}
+
+Run as ``python rvc_worker.py <cli_path>`` to start a worker by hand.
+"""
+
+import io
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
+
+# Number of checkpoints kept resident inside each worker process
+CHECKPOINT_CACHE_SIZE = int(os.environ.get("RVC_WORKER_CACHE_MODELS", "4"))
+# Tail of CLI output returned with a failed job
+ERROR_TAIL_CHARS = 4000
+
+
+class _CheckpointCache:
+    """Small LRU memo for checkpoint loaders, keyed by file identity and arguments."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def wrap(self, loader):
+        def cached(path, *args, **kwargs):
+            if not isinstance(path, str) or not os.path.isfile(path) or self.size <= 0:
+                return loader(path, *args, **kwargs)
+            st = os.stat(path)
+            key = (loader.__qualname__, os.path.abspath(path), st.st_size, st.st_mtime_ns,
+                   repr(args), repr(sorted(kwargs.items())))
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            value = loader(path, *args, **kwargs)
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            return value
+        cached.__wrapped__ = loader
+        return cached
+
+
+def _install_checkpoint_cache():
+    cache = _CheckpointCache(CHECKPOINT_CACHE_SIZE)
+    try:
+        import torch
+        torch.load = cache.wrap(torch.load)
+    except ImportError:
+        pass
+    try:
+        from fairseq import checkpoint_utils
+
+        def load_ensemble(filenames, *args, **kwargs):
+            # fairseq takes a list of paths; memoize the common single-checkpoint case
+            if isinstance(filenames, (list, tuple)) and len(filenames) == 1:
+                return cached_single(filenames[0], *args, **kwargs)
+            return original(filenames, *args, **kwargs)
+
+        original = checkpoint_utils.load_model_ensemble_and_task
+        cached_single = cache.wrap(lambda path, *a, **kw: original([path], *a, **kw))
+        checkpoint_utils.load_model_ensemble_and_task = load_ensemble
+    except ImportError:
+        pass
+
+
+def _run_job(cli_path, argv):
+    """Execute the CLI once in this interpreter, as ``python cli_path argv...`` would."""
+    import runpy
+
+    output = io.StringIO()
+    saved_argv = sys.argv
+    sys.argv = [cli_path] + list(argv)
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            runpy.run_path(cli_path, run_name="__main__")
+        return {"ok": True}
+    except SystemExit as e:
+        if e.code in (None, 0):
+            return {"ok": True}
+        # sys.exit("message") prints the message, like the interpreter would
+        status = e.code if isinstance(e.code, str) else f"exit status {e.code}"
+        return {"ok": False, "error": (output.getvalue() + status)[-ERROR_TAIL_CHARS:]}
+    except BaseException:
+        return {"ok": False, "error": (output.getvalue() + traceback.format_exc())[-ERROR_TAIL_CHARS:]}
+    finally:
+        sys.argv = saved_argv
+
+
+def serve(cli_path, stdin=None, stdout=None):
+    """Worker main loop: read JSON jobs from stdin, reply with one JSON line per job."""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    cli_dir = os.path.dirname(os.path.abspath(cli_path))
+    if cli_dir not in sys.path:
+        sys.path.insert(0, cli_dir)
+    _install_checkpoint_cache()
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            reply = _run_job(cli_path, job["argv"])
+        except (ValueError, KeyError) as e:
+            reply = {"ok": False, "error": f"Malformed job: {e}"}
+        stdout.write(json.dumps(reply) + "\n")
+        stdout.flush()
+
+
+class RVCWorker:
+    """Handle to one worker process executing jobs for a single CLI script."""
+
+    def __init__(self, cli_path, python="python"):
+        self.cli_path = cli_path
+        self.python = python
+        self.proc = None
+        self.jobs_run = 0
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            [self.python, os.path.abspath(__file__), self.cli_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        self.jobs_run = 0
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    def run(self, argv, timeout=None):
+        """Send one job and wait for its reply. Raises RuntimeError on failure."""
+        if not self.alive():
+            self.start()
+        try:
+            self.proc.stdin.write(json.dumps({"argv": list(argv)}) + "\n")
+            self.proc.stdin.flush()
+            ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+            line = self.proc.stdout.readline() if ready else None
+        except (BrokenPipeError, OSError) as e:
+            self.stop()
+            raise RuntimeError(f"RVC worker died: {e}")
+        if line is None:
+            self.stop()
+            raise RuntimeError(f"RVC worker timed out after {timeout}s")
+        if not line:
+            self.stop()
+            raise RuntimeError("RVC worker exited unexpectedly")
+        self.jobs_run += 1
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error") or "RVC worker job failed")
+
+
+class RVCWorkerPool:
+    """Fixed-size pool of workers for one CLI script; workers start lazily."""
+
+    def __init__(self, cli_path, size=1, python="python"):
+        self.cli_path = cli_path
+        self.size = max(1, int(size))
+        self._idle = queue.LifoQueue()
+        for _ in range(self.size):
+            self._idle.put(RVCWorker(cli_path, python=python))
+
+    def run(self, argv, timeout=None):
+        worker = self._idle.get()
+        try:
+            worker.run(argv, timeout=timeout)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().stop()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(cli_path):
+    """Return the shared worker pool for ``cli_path`` or None when workers are disabled.
+
+    ``RVC_WORKERS`` sets the pool size: 0 (default) runs one subprocess per job, ``auto``
+    sizes the pool to JOBS_GPU_CONCURRENCY so concurrent conversions do not queue.
+    """
+    size = os.environ.get("RVC_WORKERS", "0").strip().lower()
+    if size == "auto":
+        size = os.environ.get("JOBS_GPU_CONCURRENCY", "1")
+    size = int(size)
+    if size <= 0:
+        return None
+    with _pools_lock:
+        pool = _pools.get(cli_path)
+        if pool is None:
+            pool = _pools[cli_path] = RVCWorkerPool(cli_path, size=size)
+        return pool
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: rvc_worker.py <cli_path>")
+    # Keep the protocol channel private: anything else writing to fd 1 (C extensions,
+    # child processes) lands on stderr instead of corrupting the JSON stream.
+    protocol_out = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    serve(sys.argv[1], stdout=protocol_out)
@@ -0,0 +1,219 @@
+# server/scratch.py
+"""
+Scratch space for request intermediates.
+
+Every request gets a ScratchWorkspace, a directory under SCRATCH_DIR (default
+<tmp>/rvc_scratch) that owns its upload, separator outputs, RVC/Applio results
+and archives. The API removes the workspace in a background task once the
+response has been sent (jobs: when the job expires). A ScratchReaper thread
+sweeps the scratch root every SCRATCH_REAP_INTERVAL seconds and removes
+workspaces older than SCRATCH_MAX_AGE_SECONDS, then the oldest ones until the
+total is under SCRATCH_MAX_MB, covering crashed or abandoned requests.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+# Entries younger than this are never reaped for size (they may belong to a running request)
+MIN_REAP_AGE_SECONDS = 60
+
+# Paths of workspaces not yet cleaned up; the reaper leaves them alone
+_live = set()
+_live_lock = threading.Lock()
+
+
+def scratch_root() -> str:
+    return os.environ.get("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "rvc_scratch"))
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class ScratchWorkspace:
+    """Directory owning one request's intermediate files."""
+
+    def __init__(self, root: Optional[str] = None):
+        root = root or scratch_root()
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f"ws-{uuid.uuid4().hex}")
+        os.makedirs(self.path)
+        self.closed = False
+        with _live_lock:
+            _live.add(self.path)
+
+    def mkdtemp(self, prefix: str = "") -> str:
+        """Create a fresh subdirectory of the workspace."""
+        return tempfile.mkdtemp(prefix=prefix, dir=self.path)
+
+    def mkstemp(self, suffix: str = "", prefix: str = "") -> str:
+        """Create an empty file in the workspace and return its path."""
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=self.path)
+        os.close(fd)
+        return path
+
+    def size(self) -> int:
+        return _tree_size(self.path)
+
+    def cleanup(self):
+        """Remove the workspace and everything in it. Safe to call repeatedly."""
+        self.closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        with _live_lock:
+            _live.discard(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+def mkdtemp(workspace: Optional[ScratchWorkspace] = None, prefix: str = "") -> str:
+    """Directory for intermediates: inside ``workspace`` when given, else under the
+    scratch root where the reaper still finds it."""
+    if workspace is not None:
+        return workspace.mkdtemp(prefix)
+    root = scratch_root()
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=root)
+
+
+def mkstemp(workspace: Optional[ScratchWorkspace] = None, suffix: str = "", prefix: str = "") -> str:
+    """Empty file for intermediates, placed like :func:`mkdtemp`."""
+    if workspace is not None:
+        return workspace.mkstemp(suffix, prefix)
+    root = scratch_root()
+    os.makedirs(root, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=root)
+    os.close(fd)
+    return path
+
+
+class ScratchReaper:
+    """Enforces age and size quotas on the scratch root."""
+
+    def __init__(self, root: Optional[str] = None, max_age: Optional[float] = None,
+                 max_bytes: Optional[int] = None, interval: Optional[float] = None,
+                 on_sweep: Optional[List[Callable[[], None]]] = None):
+        """
+        Initialize the reaper.
+
+        Args:
+            root: Scratch root (SCRATCH_DIR env)
+            max_age: Seconds before an entry is removed (SCRATCH_MAX_AGE_SECONDS env, default 3600)
+            max_bytes: Total size budget (SCRATCH_MAX_MB env, default 10240; 0 = unlimited)
+            interval: Seconds between sweeps (SCRATCH_REAP_INTERVAL env, default 300)
+            on_sweep: Callables run at the start of every sweep (e.g. JobManager.prune)
+        """
+        if max_age is None:
+            max_age = float(os.environ.get("SCRATCH_MAX_AGE_SECONDS", "3600"))
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("SCRATCH_MAX_MB", "10240")) * 1024 * 1024)
+        if interval is None:
+            interval = float(os.environ.get("SCRATCH_REAP_INTERVAL", "300"))
+        self.root = root or scratch_root()
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.on_sweep = list(on_sweep or [])
+        self.reaped = 0
+        self.reaped_bytes = 0
+        self.last_sweep = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return entries
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                mtime = os.lstat(path).st_mtime
+            except OSError:
+                continue
+            size = _tree_size(path) if os.path.isdir(path) else os.lstat(path).st_size
+            entries.append((mtime, size, path))
+        return sorted(entries)
+
+    def _remove(self, path, size):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                return
+        self.reaped += 1
+        self.reaped_bytes += size
+
+    def sweep(self) -> Dict[str, int]:
+        """Remove expired entries, then the oldest ones while over the size budget."""
+        for hook in self.on_sweep:
+            hook()
+        with self._lock:
+            now = time.time()
+            with _live_lock:
+                live = set(_live)
+            kept = []
+            for mtime, size, path in self._entries():
+                if path in live:
+                    continue
+                if now - mtime > self.max_age:
+                    self._remove(path, size)
+                else:
+                    kept.append((mtime, size, path))
+            total = sum(size for _, size, _ in kept)
+            for mtime, size, path in kept:
+                if not self.max_bytes or total <= self.max_bytes:
+                    break
+                if now - mtime < MIN_REAP_AGE_SECONDS:
+                    break
+                self._remove(path, size)
+                total -= size
+            self.last_sweep = now
+            return self.stats()
+
+    def stats(self) -> Dict[str, int]:
+        entries = self._entries()
+        return {
+            "root": self.root,
+            "entries": len(entries),
+            "live_workspaces": len(_live),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "max_age_seconds": self.max_age,
+            "reaped": self.reaped,
+            "reaped_bytes": self.reaped_bytes,
+            "last_sweep": self.last_sweep,
+        }
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sweep()
+
+    def start(self):
+        """Start the periodic sweep thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="scratch-reaper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
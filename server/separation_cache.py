@@ -0,0 +1,210 @@
+# server/separation_cache.py
+"""
+Content-addressed disk cache for separated stems.
+
+Entries are keyed by the SHA-256 of the input audio plus the separator settings
+(separator, model, shifts, segment, stem), so re-running /convert on the same clip
+with different RVC parameters only pays for the RVC stage. The cache is bounded
+by total size and evicts least recently used entries first. Hits are hardlinked
+into the requesting workspace, so evicting an entry never removes stems an
+in-flight conversion is still reading.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+import scratch
+
+HASH_BLOCK_SIZE = 1024 * 1024
+MANIFEST = "manifest.json"
+STAGING_PREFIX = ".staging-"
+
+
+def file_sha256(path: str) -> str:
+    """Hash a file in streamed blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class SeparationCache:
+    """Size-bounded LRU cache of separator outputs on local disk."""
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            root: Cache directory (SEPARATION_CACHE_DIR env, default <tmp>/rvc_separation_cache)
+            max_bytes: Size budget (SEPARATION_CACHE_MAX_MB env, default 4096); 0 disables caching
+        """
+        if root is None:
+            root = os.environ.get(
+                "SEPARATION_CACHE_DIR", os.path.join(tempfile.gettempdir(), "rvc_separation_cache")
+            )
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("SEPARATION_CACHE_MAX_MB", "4096")) * 1024 * 1024)
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if self.enabled:
+            self._sweep_staging()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, in_path: str, **settings) -> str:
+        """Build the cache key for ``in_path`` separated with ``settings``."""
+        h = hashlib.sha256()
+        h.update(file_sha256(in_path).encode())
+        h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    @staticmethod
+    def _link(src: str, dest: str):
+        try:
+            os.link(src, dest)
+        except OSError:
+            # Cross-device: copy (a vanished source still raises FileNotFoundError)
+            shutil.copyfile(src, dest)
+
+    def _checkout(self, files: Dict[str, str], workspace) -> Optional[Dict[str, str]]:
+        """Link ``files`` into ``workspace``; None if the entry was evicted meanwhile."""
+        dest_dir = scratch.mkdtemp(workspace, "cached_")
+        linked = {}
+        out = {}
+        try:
+            for name, src in files.items():
+                dest = linked.get(src)
+                if dest is None:
+                    dest = os.path.join(dest_dir, os.path.basename(src))
+                    self._link(src, dest)
+                    linked[src] = dest
+                out[name] = dest
+        except FileNotFoundError:
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            return None
+        return out
+
+    def get(self, key: str, workspace=None) -> Optional[Dict[str, str]]:
+        """Return {name: path} for a cached entry, or None on a miss.
+
+        With ``workspace`` (see scratch.py) the paths are links inside it rather
+        than the cache's own files.
+        """
+        manifest_path = os.path.join(self._entry_dir(key), MANIFEST)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        files = {name: os.path.join(self._entry_dir(key), fname) for name, fname in manifest["files"].items()}
+        if not all(os.path.exists(p) for p in files.values()):
+            return None
+        # Manifest mtime records last use for LRU eviction
+        try:
+            os.utime(manifest_path)
+        except FileNotFoundError:
+            return None
+        if workspace is None:
+            return files
+        return self._checkout(files, workspace)
+
+    def put(self, key: str, files: Dict[str, str], workspace=None) -> Dict[str, str]:
+        """Store ``files`` ({name: source path}) under ``key`` and return the cached
+        paths, linked into ``workspace`` when given (see :meth:`get`)."""
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f"{STAGING_PREFIX}{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        stored = {}
+        manifest = {"files": {}, "bytes": 0, "created": time.time()}
+        for name, src in files.items():
+            # The same source may back several names (e.g. stem=vocals); store it once
+            fname = stored.get(src)
+            if fname is None:
+                fname = f"{name}{os.path.splitext(src)[1]}"
+                dest = os.path.join(staging, fname)
+                self._link(src, dest)
+                stored[src] = fname
+                manifest["bytes"] += os.path.getsize(dest)
+            manifest["files"][name] = fname
+        with open(os.path.join(staging, MANIFEST), "w") as f:
+            json.dump(manifest, f)
+
+        entry = self._entry_dir(key)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # Another request stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+        return self.get(key, workspace) or files
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for name in os.listdir(self.root):
+            if name.startswith(STAGING_PREFIX):
+                continue
+            manifest_path = os.path.join(self.root, name, MANIFEST)
+            try:
+                with open(manifest_path) as f:
+                    size = json.load(f)["bytes"]
+                entries.append((os.path.getmtime(manifest_path), size, name))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def _sweep_staging(self):
+        """Remove staging directories left by an interrupted put(); recent ones may
+        belong to a put() still running and are kept (see scratch.MIN_REAP_AGE_SECONDS)."""
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        now = time.time()
+        for name in names:
+            if not name.startswith(STAGING_PREFIX):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) < scratch.MIN_REAP_AGE_SECONDS:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its budget, and
+        stale staging directories."""
+        with self._lock:
+            self._sweep_staging()
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                total -= size
+
+    def stats(self) -> Dict[str, int]:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
@@ -3,10 +3,15 @@ Test suite for RVC API endpoints
 Tests both /convert and /uvr endpoints with various scenarios
 """
 import sys
+import io
 import pytest
 import os
 import tempfile
+import shutil
+import threading
+import time
 import wave
+import zipfile
 import numpy as np
 from unittest.mock import Mock, patch, MagicMock
 
@@ -17,6 +22,7 @@ sys.modules['librosa.core'] = MagicMock()
 sys.modules['scipy'] = MagicMock()
 sys.modules['scipy.io'] = MagicMock()
 sys.modules['scipy.io.wavfile'] = MagicMock()
+sys.modules['scipy.signal'] = MagicMock()
 sys.modules['uvr5_pack'] = MagicMock()
 sys.modules['uvr5_pack.lib_v5'] = MagicMock()
 sys.modules['uvr5_pack.lib_v5.spec_utils'] = MagicMock()
@@ -24,9 +30,14 @@ sys.modules['uvr5_pack.utils'] = MagicMock()
 sys.modules['uvr5_pack.lib_v5.model_param_init'] = MagicMock()
 sys.modules['gradio_client'] = MagicMock()
 
+# Keep the on-disk separation cache out of unit tests unless a test opts in
+os.environ.setdefault('SEPARATION_CACHE_MAX_MB', '0')
+
 from fastapi.testclient import TestClient
-from main import app
-from rvc_infer import RVCConverter
+from main import app, job_manager
+import rvc_infer
+from rvc_infer import RVCConverter, UVRModelPool
+from separation_cache import SeparationCache
 
 
 @pytest.fixture
@@ -231,7 +242,7 @@ class TestUVREndpoint:
         """Test UVR endpoint with Demucs (default)"""
         mock_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
         mock_zip.close()
-        mock_uvr.return_value = mock_zip.name
+        mock_uvr.return_value = {"vocals.wav": mock_zip.name}
         
         try:
             with open(sample_audio_file, 'rb') as f:
@@ -259,7 +270,7 @@ class TestUVREndpoint:
         """Test UVR endpoint with UVR separator"""
         mock_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
         mock_zip.close()
-        mock_uvr.return_value = mock_zip.name
+        mock_uvr.return_value = {"vocals.wav": mock_zip.name}
         
         try:
             with open(sample_audio_file, 'rb') as f:
@@ -286,7 +297,7 @@ class TestUVREndpoint:
         """Test UVR endpoint applies sensible defaults when no parameters are provided"""
         mock_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
         mock_zip.close()
-        mock_uvr.return_value = mock_zip.name
+        mock_uvr.return_value = {"vocals.wav": mock_zip.name}
         
         try:
             with open(sample_audio_file, 'rb') as f:
@@ -311,7 +322,7 @@ class TestUVREndpoint:
         """Test UVR endpoint converts segment=0 to None (Demucs default)"""
         mock_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
         mock_zip.close()
-        mock_uvr.return_value = mock_zip.name
+        mock_uvr.return_value = {"vocals.wav": mock_zip.name}
         
         try:
             with open(sample_audio_file, 'rb') as f:
@@ -337,7 +348,7 @@ class TestUVREndpoint:
         """Test UVR endpoint converts segment=0.0 (float) to None (Demucs default)"""
         mock_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
         mock_zip.close()
-        mock_uvr.return_value = mock_zip.name
+        mock_uvr.return_value = {"vocals.wav": mock_zip.name}
         
         try:
             with open(sample_audio_file, 'rb') as f:
@@ -363,7 +374,7 @@ class TestUVREndpoint:
         """Test UVR endpoint with Demucs-specific parameters"""
         mock_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
         mock_zip.close()
-        mock_uvr.return_value = mock_zip.name
+        mock_uvr.return_value = {"vocals.wav": mock_zip.name}
         
         try:
             with open(sample_audio_file, 'rb') as f:
@@ -473,6 +484,555 @@ class TestRVCConverter:
                     os.remove(mock_stem_file.name)
 
 
+class TestDemucsBackend:
+    """Test cases for the in-process Demucs engine and CLI fallback"""
+
+    @patch('rvc_infer.subprocess.run')
+    @patch('rvc_infer.demucs_engine.use_api', return_value=True)
+    def test_demucs_run_uses_resident_engine(self, mock_use_api, mock_subprocess):
+        """With the Python API available, stems are written without spawning the CLI"""
+        stems = {
+            'vocals': np.zeros((2, 441), dtype=np.float32),
+            'drums': np.full((2, 441), 0.5, dtype=np.float32),
+        }
+        with patch('rvc_infer.demucs_engine.default_engine') as mock_engine:
+            mock_engine.separate.return_value = (stems, 44100)
+            out_dir = rvc_infer.demucs_run("/tmp/song.wav", model="htdemucs", shifts="2", segment=0)
+
+        try:
+            assert not mock_subprocess.called
+            mock_engine.separate.assert_called_once_with(
+                "/tmp/song.wav", model="htdemucs", shifts=2, segment=None
+            )
+            assert out_dir.endswith(os.path.join("htdemucs", "song"))
+            assert sorted(os.listdir(out_dir)) == ['drums.wav', 'vocals.wav']
+        finally:
+            shutil.rmtree(os.path.dirname(os.path.dirname(out_dir)), ignore_errors=True)
+
+    @patch('rvc_infer.os.path.isdir', return_value=True)
+    @patch('rvc_infer.subprocess.run')
+    @patch('rvc_infer.demucs_engine.use_api', return_value=False)
+    def test_demucs_run_falls_back_to_cli(self, mock_use_api, mock_subprocess, mock_isdir):
+        """Without the Python API the demucs CLI is used with validated flags"""
+        rvc_infer.demucs_run("/tmp/song.wav", model="htdemucs_ft", shifts=3, segment="7.5")
+
+        cmd = mock_subprocess.call_args[0][0]
+        assert cmd[:3] == ["demucs", "-n", "htdemucs_ft"]
+        assert cmd[cmd.index("--shifts") + 1] == "3"
+        assert cmd[cmd.index("--segment") + 1] == "7.5"
+
+
+class TestSeparationStage:
+    """Regression tests: each request runs its separator exactly once"""
+
+    @staticmethod
+    def _run_convert(**kw):
+        with patch('rvc_infer.subprocess.run'), patch('os.path.exists') as mock_exists:
+            mock_exists.return_value = False  # No RVC CLI exists
+            with pytest.raises(RuntimeError, match="No known RVC CLI found"):
+                RVCConverter().convert(in_path="/tmp/in.wav", separate=True, **kw)
+
+    @patch('rvc_infer.uvr_separate')
+    @patch('rvc_infer.demucs_separate')
+    def test_demucs_runs_once(self, mock_demucs, mock_uvr):
+        """Demucs separation is invoked once per request"""
+        mock_demucs.return_value = ("/tmp/demucs_out/vocals.wav", "/tmp/demucs_out")
+
+        self._run_convert(separator="demucs", stem="vocals")
+
+        assert mock_demucs.call_count == 1
+        assert mock_uvr.call_count == 0
+
+    @patch('rvc_infer.uvr_separate')
+    @patch('rvc_infer.demucs_separate')
+    def test_uvr_does_not_run_demucs(self, mock_demucs, mock_uvr):
+        """UVR separation does not pay for an extra Demucs pass"""
+        mock_uvr.return_value = ("/tmp/uvr_out/vocals.wav", "/tmp/uvr_out")
+
+        self._run_convert(separator="uvr", stem="vocals", uvr_model_path="/models/uvr.pth")
+
+        assert mock_uvr.call_count == 1
+        assert mock_demucs.call_count == 0
+
+    @patch('rvc_infer.uvr_separate')
+    @patch('rvc_infer.demucs_separate')
+    def test_applio_reuses_separated_vocals(self, mock_demucs, mock_uvr):
+        """Applio receives the vocal stem from the same separator run"""
+        mock_demucs.return_value = ("/tmp/demucs_out/other.wav", "/tmp/demucs_out")
+        converter = RVCConverter()
+
+        with patch('os.path.exists', side_effect=lambda p: p == "/tmp/demucs_out/vocals.wav"):
+            stem_path, vocal_path = converter._separate(in_path="/tmp/in.wav", separator="demucs", stem="other")
+
+        assert stem_path == "/tmp/demucs_out/other.wav"
+        assert vocal_path == "/tmp/demucs_out/vocals.wav"
+        assert mock_demucs.call_count == 1
+        assert mock_uvr.call_count == 0
+
+
+class TestConcurrentApplio:
+    """RVC and Applio run side by side on the same separated vocals"""
+
+    @staticmethod
+    def _converter(tmp_path, rvc_delay, applio_delay, rvc_error=None):
+        cli = tmp_path / "infer_cli.py"
+        cli.write_text("")
+        converter = RVCConverter()
+        converter.paths = {"webui_cli": str(cli), "mangio": str(tmp_path / "missing.py")}
+        converter._separate = Mock(return_value=(str(tmp_path / "stem.wav"), str(tmp_path / "vocals.wav")))
+
+        def run_rvc(cmd):
+            time.sleep(rvc_delay)
+            if rvc_error:
+                raise RuntimeError(rvc_error)
+            with open(cmd[cmd.index("--output") + 1], "wb") as f:
+                f.write(b"RIFF")
+
+        def applio(vocal_path, **kw):
+            time.sleep(applio_delay)
+            return str(tmp_path / "applio_out.wav")
+
+        converter._run_rvc = run_rvc
+        converter._process_with_applio = Mock(side_effect=applio)
+        return converter
+
+    def test_stages_overlap_and_are_timed(self, tmp_path):
+        converter = self._converter(tmp_path, rvc_delay=0.3, applio_delay=0.3)
+        stats = {}
+
+        start = time.perf_counter()
+        out_path, applio_out = converter.convert(
+            in_path="/tmp/in.wav", applio_enabled=True, applio_model="voice", normalize=False, stats=stats
+        )
+        elapsed = time.perf_counter() - start
+
+        assert os.path.exists(out_path)
+        assert applio_out == str(tmp_path / "applio_out.wav")
+        assert converter._process_with_applio.call_args[0][0] == str(tmp_path / "vocals.wav")
+        assert elapsed < 0.55
+        assert set(stats["timings"]) == {"separate", "rvc", "applio"}
+        assert stats["timings"]["rvc"] >= 0.3
+        assert stats["timings"]["applio"] >= 0.3
+
+    def test_rvc_failure_waits_for_applio(self, tmp_path):
+        converter = self._converter(tmp_path, rvc_delay=0.0, applio_delay=0.2, rvc_error="RVC CLI failed: boom")
+        stats = {}
+
+        with pytest.raises(RuntimeError, match="boom"):
+            converter.convert(in_path="/tmp/in.wav", applio_enabled=True, applio_model="voice",
+                              normalize=False, stats=stats)
+        assert "applio" in stats["timings"]
+
+    @patch.object(RVCConverter, 'convert')
+    def test_server_timing_header(self, mock_convert, client, sample_audio_file, tmp_path):
+        out = tmp_path / "rvc_out.wav"
+        out.write_bytes(b"RIFF")
+
+        def convert(**kw):
+            kw['stats']['timings'] = {'rvc': 1.5, 'applio': 2.0}
+            return (str(out), None)
+
+        mock_convert.side_effect = convert
+        with open(sample_audio_file, 'rb') as f:
+            response = client.post("/convert", files={"file": ("test.wav", f, "audio/wav")})
+
+        assert response.status_code == 200
+        assert response.headers['server-timing'] == "rvc;dur=1500.0, applio;dur=2000.0"
+
+
+class TestSeparationCacheIntegration:
+    """Test cases for reusing cached stems across /convert requests"""
+
+    @pytest.fixture
+    def cached_converter(self, tmp_path):
+        converter = RVCConverter()
+        converter.separation_cache = SeparationCache(root=str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+        return converter
+
+    @staticmethod
+    def _fake_demucs(tmp_path):
+        def run(in_path, stem='vocals', model=None, shifts=None, segment=None, workspace=None):
+            out_dir = tempfile.mkdtemp(dir=str(tmp_path))
+            for name in ("vocals", "other"):
+                with open(os.path.join(out_dir, f"{name}.wav"), "wb") as f:
+                    f.write(name.encode())
+            return os.path.join(out_dir, f"{stem}.wav"), out_dir
+        return run
+
+    @patch('rvc_infer.demucs_separate')
+    def test_second_request_hits_cache(self, mock_demucs, cached_converter, sample_audio_file, tmp_path):
+        """Re-separating the same audio with the same settings skips the separator"""
+        mock_demucs.side_effect = self._fake_demucs(tmp_path)
+
+        first_stats, second_stats = {}, {}
+        first = cached_converter._separate(in_path=sample_audio_file, separator="demucs", stem="other", stats=first_stats)
+        second = cached_converter._separate(in_path=sample_audio_file, separator="demucs", stem="other", stats=second_stats)
+
+        assert mock_demucs.call_count == 1
+        assert first_stats['separation_cache'] == 'miss'
+        assert second_stats['separation_cache'] == 'hit'
+        assert second == first
+        with open(second[0], 'rb') as f:
+            assert f.read() == b"other"
+        with open(second[1], 'rb') as f:
+            assert f.read() == b"vocals"
+
+    @patch('rvc_infer.demucs_separate')
+    def test_different_stem_misses_cache(self, mock_demucs, cached_converter, sample_audio_file, tmp_path):
+        """Changing a separator setting produces a different cache entry"""
+        mock_demucs.side_effect = self._fake_demucs(tmp_path)
+
+        cached_converter._separate(in_path=sample_audio_file, separator="demucs", stem="vocals")
+        cached_converter._separate(in_path=sample_audio_file, separator="demucs", stem="other")
+
+        assert mock_demucs.call_count == 2
+
+    @patch('rvc_infer.demucs_separate')
+    def test_demucs_settings_reach_separator_and_key(self, mock_demucs, cached_converter, sample_audio_file, tmp_path):
+        """shifts/segment are passed to Demucs and keyed as Demucs applies them"""
+        mock_demucs.side_effect = self._fake_demucs(tmp_path)
+
+        cached_converter._separate(in_path=sample_audio_file, separator="demucs", stem="vocals")
+        cached_converter._separate(in_path=sample_audio_file, separator="demucs", stem="vocals", shifts=0, segment=0)
+        assert mock_demucs.call_count == 1
+
+        cached_converter._separate(in_path=sample_audio_file, separator="demucs", stem="vocals", shifts=2, segment=7.5)
+        assert mock_demucs.call_count == 2
+        assert mock_demucs.call_args[1]['shifts'] == 2
+        assert mock_demucs.call_args[1]['segment'] == 7.5
+
+    @patch.object(RVCConverter, 'convert')
+    def test_convert_reports_cache_header(self, mock_convert, client, sample_audio_file):
+        """The /convert response carries X-Cache when separation ran"""
+        mock_output = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
+        mock_output.close()
+
+        def fake_convert(**kw):
+            kw['stats']['separation_cache'] = 'hit'
+            return (mock_output.name, None)
+        mock_convert.side_effect = fake_convert
+
+        try:
+            with open(sample_audio_file, 'rb') as f:
+                response = client.post(
+                    "/convert",
+                    files={"file": ("test.wav", f, "audio/wav")},
+                    data={"separate": "true"}
+                )
+            assert response.status_code == 200
+            assert response.headers['X-Cache'] == 'hit'
+        finally:
+            if os.path.exists(mock_output.name):
+                os.remove(mock_output.name)
+
+
+class TestUVRModelPool:
+    """Test cases for the resident UVR model pool"""
+
+    @staticmethod
+    def _fake_separator(nbytes):
+        def factory(model_path=None, device=None, is_half=True):
+            sep = Mock()
+            sep.model_path = model_path
+            sep.nbytes = nbytes
+            return sep
+        return factory
+
+    def test_preload_failure_is_logged(self, caplog):
+        """A failed UVR_PRELOAD load is reported through logging with its traceback"""
+        import main
+        with patch.object(main.uvr_model_pool, 'get', side_effect=RuntimeError("no weights")):
+            with caplog.at_level('ERROR', logger='main'):
+                main._preload_uvr()
+        assert "UVR preload failed" in caplog.text
+        assert caplog.records[-1].exc_info is not None
+
+    @patch('rvc_infer.UVRSeparator')
+    def test_pool_reuses_loaded_model(self, mock_separator):
+        """Second request for the same model is served from the pool"""
+        mock_separator.side_effect = self._fake_separator(100)
+        pool = UVRModelPool(max_bytes=1000)
+
+        first = pool.get(model_path="/models/a.pth", device="cpu")
+        second = pool.get(model_path="/models/a.pth", device="cpu")
+
+        assert first is second
+        assert mock_separator.call_count == 1
+        stats = pool.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['evictions'] == 0
+
+    @patch('rvc_infer.UVRSeparator')
+    def test_pool_keys_by_device_and_dtype(self, mock_separator):
+        """Same weights on a different device are loaded separately"""
+        mock_separator.side_effect = self._fake_separator(100)
+        pool = UVRModelPool(max_bytes=1000)
+
+        pool.get(model_path="/models/a.pth", device="cpu")
+        pool.get(model_path="/models/a.pth", device="cuda", is_half=True)
+        pool.get(model_path="/models/a.pth", device="cuda", is_half=False)
+
+        assert mock_separator.call_count == 3
+        dtypes = sorted((m['device'], m['dtype']) for m in pool.loaded())
+        assert dtypes == [('cpu', 'float32'), ('cuda', 'float16'), ('cuda', 'float32')]
+
+    @patch('rvc_infer.UVRSeparator')
+    def test_pool_evicts_least_recently_used(self, mock_separator):
+        """Models are evicted in LRU order once the memory budget is exceeded"""
+        mock_separator.side_effect = self._fake_separator(400)
+        pool = UVRModelPool(max_bytes=1000)
+
+        pool.get(model_path="/models/a.pth", device="cpu")
+        pool.get(model_path="/models/b.pth", device="cpu")
+        pool.get(model_path="/models/a.pth", device="cpu")  # a is now most recent
+        pool.get(model_path="/models/c.pth", device="cpu")
+
+        loaded = [os.path.basename(m['model_path']) for m in pool.loaded()]
+        assert loaded == ['a.pth', 'c.pth']
+        assert pool.stats()['evictions'] == 1
+
+    @patch('main.uvr_model_pool')
+    def test_loaded_models_endpoint(self, mock_pool, client):
+        """Test /uvr/models/loaded lists resident models and counters"""
+        mock_pool.loaded.return_value = [{'model_path': '/uvr5_weights/2_HP-UVR.pth', 'device': 'cpu', 'dtype': 'float32'}]
+        mock_pool.stats.return_value = {'hits': 3, 'misses': 1, 'evictions': 0}
+
+        response = client.get("/uvr/models/loaded")
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body['models'][0]['model_path'] == '/uvr5_weights/2_HP-UVR.pth'
+        assert body['stats']['hits'] == 3
+
+
+class TestJobsEndpoint:
+    """Test cases for the /jobs background job API"""
+
+    def _wait(self, client, job_id):
+        for _ in range(200):
+            body = client.get(f"/jobs/{job_id}").json()
+            if body['status'] in ('done', 'failed'):
+                return body
+            time.sleep(0.01)
+        raise AssertionError("job did not finish")
+
+    @patch.object(RVCConverter, 'uvr')
+    def test_uvr_job_lifecycle(self, mock_uvr, client, sample_audio_file, tmp_path):
+        """Test POST /jobs returns an id and the result is downloadable once done"""
+        vocals = tmp_path / "vocals.wav"
+        vocals.write_bytes(b"RIFF" + os.urandom(1000))
+        mock_uvr.return_value = {"vocals.wav": str(vocals)}
+
+        with open(sample_audio_file, 'rb') as f:
+            response = client.post("/jobs", files={"file": ("test.wav", f, "audio/wav")},
+                                   data={"task": "uvr", "use_uvr": "true"})
+        assert response.status_code == 202
+        job_id = response.json()['id']
+
+        body = self._wait(client, job_id)
+        assert body['status'] == 'done'
+        assert body['percent'] == 100.0
+        assert mock_uvr.call_args[1]['use_uvr'] is True
+        assert callable(mock_uvr.call_args[1]['stage_hook'])
+
+        result = client.get(f"/jobs/{job_id}/result")
+        assert result.status_code == 200
+        assert result.headers['content-type'] == 'application/zip'
+        with zipfile.ZipFile(io.BytesIO(result.content)) as zf:
+            assert zf.read("vocals.wav") == vocals.read_bytes()
+
+    @patch.object(RVCConverter, 'convert')
+    def test_convert_job_reports_stage(self, mock_convert, client, sample_audio_file, tmp_path):
+        """Test progress is visible while a conversion is running"""
+        out = tmp_path / "rvc_out.wav"
+        out.write_bytes(b"RIFF")
+        release = threading.Event()
+
+        def convert(**kw):
+            with kw['stage_hook']("rvc"):
+                release.wait(5)
+            return (str(out), None)
+
+        mock_convert.side_effect = convert
+        with open(sample_audio_file, 'rb') as f:
+            job_id = client.post("/jobs", files={"file": ("test.wav", f, "audio/wav")},
+                                 data={"task": "convert", "normalize": "false"}).json()['id']
+
+        for _ in range(200):
+            body = client.get(f"/jobs/{job_id}").json()
+            if body['stage'] == 'rvc':
+                break
+            time.sleep(0.01)
+        assert body['status'] == 'running'
+        assert body['stages'] == ['upload', 'rvc']
+        assert body['percent'] == 50.0
+        assert client.get(f"/jobs/{job_id}/result").status_code == 409
+
+        release.set()
+        assert self._wait(client, job_id)['status'] == 'done'
+        assert client.get(f"/jobs/{job_id}/result").status_code == 200
+
+    @patch.object(RVCConverter, 'convert')
+    def test_convert_job_merges_applio_overlap(self, mock_convert, client, sample_audio_file, tmp_path):
+        """Test RVC and the concurrent Applio call are reported as one stage"""
+        out = tmp_path / "rvc_out.wav"
+        out.write_bytes(b"RIFF")
+
+        def convert(**kw):
+            stage = kw['stage_hook']
+            with stage("applio"), stage("rvc"):
+                pass
+            with stage("normalize"):
+                pass
+            return (str(out), None)
+
+        mock_convert.side_effect = convert
+        with open(sample_audio_file, 'rb') as f:
+            job_id = client.post("/jobs", files={"file": ("test.wav", f, "audio/wav")},
+                                 data={"task": "convert", "applio_enabled": "true",
+                                       "applio_model": "voice"}).json()['id']
+
+        body = self._wait(client, job_id)
+        assert body['status'] == 'done'
+        assert body['stages'] == ['upload', 'separate', 'rvc+applio']
+        assert body['stage'] == 'rvc+applio'
+
+    @patch.object(RVCConverter, 'convert', side_effect=RuntimeError("RVC CLI failed: boom"))
+    def test_failed_job(self, mock_convert, client, sample_audio_file):
+        """Test a failing job reports its error"""
+        with open(sample_audio_file, 'rb') as f:
+            job_id = client.post("/jobs", files={"file": ("test.wav", f, "audio/wav")}).json()['id']
+
+        body = self._wait(client, job_id)
+        assert body['status'] == 'failed'
+        assert 'boom' in body['error']
+        result = client.get(f"/jobs/{job_id}/result")
+        assert result.status_code == 500
+
+    def test_unknown_job_and_task(self, client, sample_audio_file):
+        """Test unknown ids return 404 and unknown tasks are rejected"""
+        assert client.get("/jobs/missing").status_code == 404
+        assert client.get("/jobs/missing/result").status_code == 404
+        with open(sample_audio_file, 'rb') as f:
+            response = client.post("/jobs", files={"file": ("test.wav", f, "audio/wav")}, data={"task": "bogus"})
+        assert response.status_code == 422
+
+    @patch.object(RVCConverter, 'convert')
+    def test_normalize_mode(self, mock_convert, client, sample_audio_file, tmp_path):
+        """Test normalize_mode is passed to the converter and validated"""
+        out = tmp_path / "rvc_out.wav"
+        out.write_bytes(b"RIFF")
+        mock_convert.return_value = (str(out), None)
+
+        with open(sample_audio_file, 'rb') as f:
+            job_id = client.post("/jobs", files={"file": ("test.wav", f, "audio/wav")},
+                                 data={"normalize_mode": "lufs", "target_db": "-16"}).json()['id']
+        assert self._wait(client, job_id)['status'] == 'done'
+        assert mock_convert.call_args[1]['normalize_mode'] == 'lufs'
+        assert mock_convert.call_args[1]['target_db'] == -16.0
+
+        with open(sample_audio_file, 'rb') as f:
+            response = client.post("/convert", files={"file": ("test.wav", f, "audio/wav")},
+                                   data={"normalize_mode": "loud"})
+        assert response.status_code == 422
+
+
+class TestUploadInput:
+    """Test upload limits and shared input paths on the audio endpoints"""
+
+    def test_oversized_upload_rejected(self, client, monkeypatch):
+        """Test bodies over MAX_UPLOAD_MB are refused with 413"""
+        monkeypatch.setenv('MAX_UPLOAD_MB', '0.01')
+        payload = b"\x00" * (200 * 1024)
+        with patch.object(RVCConverter, 'uvr') as mock_uvr:
+            response = client.post("/uvr", files={"file": ("big.wav", payload, "audio/wav")})
+        assert response.status_code == 413
+        assert not mock_uvr.called
+
+    @patch.object(RVCConverter, 'uvr')
+    def test_input_path_skips_upload(self, mock_uvr, client, sample_audio_file, tmp_path, monkeypatch):
+        """Test a shared input_path is handed to the separator unchanged"""
+        mock_uvr.return_value = {"vocals.wav": sample_audio_file}
+        monkeypatch.setenv('UPLOAD_ALLOWED_DIRS', os.path.dirname(sample_audio_file))
+
+        response = client.post("/uvr", data={"input_path": sample_audio_file})
+
+        assert response.status_code == 200
+        assert mock_uvr.call_args[1]['in_path'] == os.path.realpath(sample_audio_file)
+
+    def test_input_path_outside_allowed_dirs(self, client, sample_audio_file, tmp_path, monkeypatch):
+        """Test input_path outside UPLOAD_ALLOWED_DIRS is refused"""
+        monkeypatch.setenv('UPLOAD_ALLOWED_DIRS', str(tmp_path))
+        response = client.post("/convert", data={"input_path": sample_audio_file})
+        assert response.status_code == 403
+
+    @patch('main.StemXtractClient')
+    def test_stemxtract_keeps_shared_input(self, mock_client, client, sample_audio_file, monkeypatch):
+        """Test /stemxtract/process does not delete a caller's shared file"""
+        mock_client.return_value.process_track.side_effect = RuntimeError("offline")
+        monkeypatch.setenv('UPLOAD_ALLOWED_DIRS', os.path.dirname(sample_audio_file))
+
+        response = client.post("/stemxtract/process", data={"input_path": sample_audio_file})
+
+        assert response.status_code == 500
+        assert os.path.exists(sample_audio_file)
+
+
+class TestScratchWorkspace:
+    """Test per-request scratch workspaces are removed after the response"""
+
+    @patch.object(RVCConverter, 'uvr')
+    def test_uvr_workspace_removed_after_response(self, mock_uvr, client, sample_audio_file):
+        """Test the workspace holding the spooled upload and stems is deleted once sent"""
+        seen = {}
+
+        def fake_uvr(**kw):
+            workspace = seen['workspace'] = kw['workspace']
+            stem = workspace.mkstemp(suffix='.wav')
+            with open(stem, 'wb') as f:
+                f.write(b"stem")
+            assert os.path.dirname(kw['in_path']) == workspace.path
+            return {"vocals.wav": stem}
+        mock_uvr.side_effect = fake_uvr
+        jobs_before = set(job_manager._jobs)
+
+        with open(sample_audio_file, 'rb') as f:
+            response = client.post("/uvr", files={"file": ("test.wav", f, "audio/wav")})
+
+        assert response.status_code == 200
+        assert zipfile.ZipFile(io.BytesIO(response.content)).read("vocals.wav") == b"stem"
+        assert not os.path.exists(seen['workspace'].path)
+        # The blocking endpoint's job is not kept around with a result whose files are gone
+        assert set(job_manager._jobs) <= jobs_before
+
+    @patch.object(RVCConverter, 'uvr')
+    def test_workspace_removed_on_failure(self, mock_uvr, client, sample_audio_file):
+        """Test a failed request does not leave its workspace behind"""
+        seen = {}
+
+        def fake_uvr(**kw):
+            seen['workspace'] = kw['workspace']
+            raise RuntimeError("separator crashed")
+        mock_uvr.side_effect = fake_uvr
+        jobs_before = set(job_manager._jobs)
+
+        with open(sample_audio_file, 'rb') as f:
+            response = client.post("/uvr", files={"file": ("test.wav", f, "audio/wav")})
+
+        assert response.status_code == 500
+        assert not os.path.exists(seen['workspace'].path)
+        assert set(job_manager._jobs) <= jobs_before
+
+    def test_scratch_stats(self, client):
+        """Test GET /scratch/stats reports usage and quotas"""
+        response = client.get("/scratch/stats")
+        assert response.status_code == 200
+        data = response.json()
+        for key in ("root", "entries", "bytes", "max_bytes", "max_age_seconds", "reaped"):
+            assert key in data
+
+
 class TestAPIIntegration:
     """Integration tests for API endpoints"""
     
@@ -17,6 +17,7 @@ sys.modules['librosa.core'] = MagicMock()
 sys.modules['scipy'] = MagicMock()
 sys.modules['scipy.io'] = MagicMock()
 sys.modules['scipy.io.wavfile'] = MagicMock()
+sys.modules['scipy.signal'] = MagicMock()
 sys.modules['uvr5_pack'] = MagicMock()
 sys.modules['uvr5_pack.lib_v5'] = MagicMock()
 sys.modules['uvr5_pack.lib_v5.spec_utils'] = MagicMock()
@@ -0,0 +1,106 @@
+# server/uploads.py
+"""
+Upload intake for the audio endpoints.
+
+Uploads are copied to a spool file in fixed-size chunks instead of being read
+into memory whole, and rejected as soon as they exceed MAX_UPLOAD_MB (default
+1024). Clients that share a volume with the server can skip the upload and pass
+``input_path`` instead; such paths must resolve inside one of the directories in
+UPLOAD_ALLOWED_DIRS (``os.pathsep``-separated, empty by default = disabled).
+"""
+
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Input could not be accepted; ``status_code`` is the HTTP status to report."""
+
+    status_code = 400
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+
+class MissingInput(UploadError):
+    status_code = 422
+
+
+class InputPathNotAllowed(UploadError):
+    status_code = 403
+
+
+def max_upload_bytes() -> int:
+    """Upload size limit in bytes; 0 means unlimited."""
+    return int(float(os.environ.get("MAX_UPLOAD_MB", "1024")) * 1024 * 1024)
+
+
+def allowed_input_dirs() -> List[str]:
+    dirs = os.environ.get("UPLOAD_ALLOWED_DIRS", "")
+    return [os.path.realpath(d) for d in dirs.split(os.pathsep) if d]
+
+
+def _too_large(limit: int) -> UploadTooLarge:
+    return UploadTooLarge(f"Upload exceeds the {limit // (1024 * 1024)} MB limit")
+
+
+async def spool_upload(file, max_bytes: Optional[int] = None, directory: Optional[str] = None) -> str:
+    """Copy an UploadFile to a temporary file (in ``directory`` if given) chunk by chunk
+    and return its path.
+
+    Raises UploadTooLarge (and removes the partial file) once ``max_bytes`` is exceeded.
+    """
+    if max_bytes is None:
+        max_bytes = max_upload_bytes()
+    if max_bytes and file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    suffix = os.path.splitext(file.filename or "")[1] or ".wav"
+    written = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as tmp_in:
+        try:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if max_bytes and written > max_bytes:
+                    raise _too_large(max_bytes)
+                tmp_in.write(chunk)
+        except BaseException:
+            tmp_in.close()
+            os.remove(tmp_in.name)
+            raise
+    return tmp_in.name
+
+
+def resolve_input_path(path: str) -> str:
+    """Validate a server-local ``input_path`` and return its real path."""
+    roots = allowed_input_dirs()
+    if not roots:
+        raise InputPathNotAllowed("input_path is disabled (set UPLOAD_ALLOWED_DIRS to enable it)")
+    real = os.path.realpath(path)
+    if not any(os.path.commonpath([real, root]) == root for root in roots):
+        raise InputPathNotAllowed(f"input_path must be inside one of: {', '.join(roots)}")
+    if not os.path.isfile(real):
+        raise UploadError(f"input_path not found: {path}")
+    return real
+
+
+async def receive_input(file=None, input_path: Optional[str] = None, workspace=None) -> Tuple[str, bool]:
+    """Return (path, owned) for an endpoint's audio input.
+
+    Uploads are spooled into ``workspace`` (a scratch.ScratchWorkspace) when given.
+    ``owned`` is True for spooled uploads, which the caller may delete; shared
+    ``input_path`` files are never owned.
+    """
+    if file is not None:
+        directory = workspace.path if workspace is not None else None
+        return await spool_upload(file, directory=directory), True
+    if input_path:
+        return resolve_input_path(input_path), False
+    raise MissingInput("Either file or input_path is required")
@@ -0,0 +1,162 @@
+'''
+TorchScript export of the lib_v5 nets.
+
+CompiledUVRNet wraps a loaded CascadedASPPNet and runs ``predict`` through a
+torch.jit.trace of the net, one per window size, so the per-window Python
+slicing, torch.cat and aggressiveness torch.pow run as a single graph. Traces
+are saved under UVR_COMPILED_DIR (default: .uvr_compiled next to the weights),
+named by the caller's key (weight md5 and mode), bin count, window size, trace
+format and torch version, and loaded instead of re-traced on later starts. The loaded
+graph shares its tensors with the eager net, so weights are resident once.
+UVR_TORCHSCRIPT=0 disables the export.
+'''
+import contextlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import warnings
+
+import torch
+from torch import nn
+
+logger = logging.getLogger(__name__)
+
+# Bump when the traced wrapper changes so stale artifacts are not loaded
+TRACE_FORMAT = 1
+
+
+def torchscript_enabled():
+    return os.environ.get('UVR_TORCHSCRIPT', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def compiled_dir_for(model_path):
+    return os.environ.get('UVR_COMPILED_DIR') or os.path.join(os.path.dirname(os.path.abspath(model_path)),
+                                                              '.uvr_compiled')
+
+
+class _Predictor(nn.Module):
+    '''Traceable predict(): aggressiveness is a tensor input, split_bin is fixed.'''
+
+    def __init__(self, net, split_bin):
+        super(_Predictor, self).__init__()
+        self.net = net
+        self.split_bin = split_bin
+
+    def forward(self, x, value):
+        return self.net.predict(x, {'split_bin': self.split_bin, 'value': value})
+
+
+class CompiledUVRNet(nn.Module):
+    '''Drop-in for a CascadedASPPNet in uvr5_pack.utils.inference (offset, predict, state_dict).'''
+
+    def __init__(self, net, split_bin, key, cache_dir=None, context=None):
+        '''
+        net: eager CascadedASPPNet in eval mode, already on its device and dtype
+        split_bin: aggressiveness split bin the traces are specialised for
+        key: identifies weights and mode in artifact names (e.g. md5-device-dtype)
+        cache_dir: where artifacts are kept (None = trace in memory only)
+        context: callable returning the context the net runs under (e.g. bf16 autocast)
+        '''
+        super(CompiledUVRNet, self).__init__()
+        self.net = net
+        self.offset = net.offset
+        self.split_bin = split_bin
+        self.key = key
+        self.cache_dir = cache_dir
+        self._context = context or torch.no_grad
+        self._traced = {}
+        self._lock = threading.Lock()
+        self.traced = 0
+        self.loaded = 0
+
+    def artifact_path(self, window_size):
+        if self.cache_dir is None:
+            return None
+        torch_version = re.sub(r'[^0-9A-Za-z.]', '_', torch.__version__)
+        # The graph bakes in the bin count and window size along with the weights
+        name = '{}-b{}-w{}-v{}-torch{}.pt'.format(self.key, self.net.output_bin, window_size, TRACE_FORMAT,
+                                                  torch_version)
+        return os.path.join(self.cache_dir, name)
+
+    def _tensors(self, module, prefix=''):
+        named = dict(module.named_parameters())
+        named.update(module.named_buffers())
+        return {prefix + k: v for k, v in named.items()}
+
+    def _load(self, path):
+        param = next(self.net.parameters())
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', FutureWarning)
+                loaded = torch.jit.load(path, map_location=param.device)
+        except Exception as e:
+            logger.warning('Ignoring unreadable UVR trace %s: %s', path, e)
+            return None
+        ours = self._tensors(self.net, 'net.')
+        theirs = self._tensors(loaded)
+        if set(ours) != set(theirs) or any(theirs[k].shape != ours[k].shape for k in ours):
+            return None
+        # Point the graph at the eager tensors instead of keeping a second copy
+        for k, t in theirs.items():
+            t.data = ours[k].data
+        return loaded
+
+    def _trace(self, window_size):
+        param = next(self.net.parameters())
+        example = torch.rand(1, 2, self.net.output_bin, window_size, device=param.device, dtype=param.dtype)
+        if param.dim() == 4 and param.is_contiguous(memory_format=torch.channels_last):
+            example = example.contiguous(memory_format=torch.channels_last)
+        value = torch.tensor(0.1, device=param.device)
+        with warnings.catch_warnings(), self._context():
+            warnings.simplefilter('ignore', torch.jit.TracerWarning)
+            warnings.simplefilter('ignore', FutureWarning)
+            return torch.jit.trace(_Predictor(self.net, self.split_bin), (example, value), check_trace=False)
+
+    @staticmethod
+    def _save(traced, path):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix='.pt', dir=os.path.dirname(path))
+            os.close(fd)
+        except OSError:
+            return
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', FutureWarning)
+                torch.jit.save(traced, tmp)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning('Could not save UVR trace %s: %s', path, e)
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+
+    def compiled(self, window_size):
+        '''Traced predictor for ``window_size``, loading or creating its artifact.'''
+        with self._lock:
+            traced = self._traced.get(window_size)
+            if traced is not None:
+                return traced
+            path = self.artifact_path(window_size)
+            if path and os.path.exists(path):
+                traced = self._load(path)
+                if traced is not None:
+                    self.loaded += 1
+            if traced is None:
+                traced = self._trace(window_size)
+                self.traced += 1
+                if path:
+                    self._save(traced, path)
+            self._traced[window_size] = traced
+            return traced
+
+    def predict(self, x_mag, aggressiveness=None):
+        if not aggressiveness or aggressiveness['split_bin'] != self.split_bin:
+            return self.net.predict(x_mag, aggressiveness)
+        traced = self.compiled(x_mag.shape[3])
+        value = torch.tensor(float(aggressiveness['value']), device=x_mag.device)
+        return traced(x_mag, value)
+
+    def forward(self, x, aggressiveness=None):
+        return self.net(x, aggressiveness)
@@ -1,3 +1,4 @@
+import functools
 import json
 import os
 import pathlib
@@ -57,4 +58,17 @@ class ModelParameters(object):
             
         for k in ['mid_side', 'mid_side_b', 'mid_side_b2', 'stereo_w', 'stereo_n', 'reverse']:
             if not k in self.param:
-                self.param[k] = False
\ No newline at end of file
+                self.param[k] = False
+
+
+@functools.lru_cache(maxsize=None)
+def _load_model_params(real_path):
+    return ModelParameters(real_path)
+
+
+def get_model_params(config_path):
+    '''
+    Shared ModelParameters for config_path, parsed once per process.
+    Callers must treat the returned param dict as read-only.
+    '''
+    return _load_model_params(os.path.realpath(config_path))
@@ -0,0 +1,101 @@
+'''
+Inference-time transforms for the lib_v5 nets.
+
+BatchNorm is folded into the preceding convolutions when a model is loaded
+(UVR_FOLD_BN=0 keeps the separate BN ops). CPU performance mode
+(UVR_CPU_PERF=1, off by default) folds even when UVR_FOLD_BN=0, stores the model
+channels-last and runs inference under torch.inference_mode with bfloat16
+autocast when the CPU has native bf16 (UVR_CPU_BF16=auto|1|0).
+'''
+import contextlib
+import os
+
+import torch
+from torch import nn
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def fold_bn_enabled():
+    return _env_flag('UVR_FOLD_BN', '1')
+
+
+def cpu_perf_enabled():
+    return _env_flag('UVR_CPU_PERF', '0')
+
+
+def bf16_supported():
+    '''True when bfloat16 autocast should be used on this CPU.'''
+    setting = os.environ.get('UVR_CPU_BF16', 'auto').strip().lower()
+    if setting != 'auto':
+        return setting in ('1', 'true', 'yes', 'on')
+    probes = ('_is_avx512_bf16_supported', '_is_amx_tile_supported')
+    return any(getattr(torch.cpu, probe, lambda: False)() for probe in probes)
+
+
+def fold_conv_bn(conv, bn):
+    '''Conv2d computing conv followed by bn (running statistics), with a bias.'''
+    fused = nn.Conv2d(
+        conv.in_channels, conv.out_channels,
+        kernel_size=conv.kernel_size,
+        stride=conv.stride,
+        padding=conv.padding,
+        dilation=conv.dilation,
+        groups=conv.groups,
+        bias=True,
+        padding_mode=conv.padding_mode,
+    ).to(device=conv.weight.device, dtype=conv.weight.dtype)
+
+    with torch.no_grad():
+        var = bn.running_var.float()
+        scale = torch.rsqrt(var + bn.eps)
+        if bn.weight is not None:
+            scale = scale * bn.weight.float()
+        shift = -bn.running_mean.float() * scale
+        if bn.bias is not None:
+            shift = shift + bn.bias.float()
+        if conv.bias is not None:
+            shift = shift + conv.bias.float() * scale
+        fused.weight.copy_(conv.weight.float() * scale.reshape(-1, 1, 1, 1))
+        fused.bias.copy_(shift)
+    return fused
+
+
+def fold_batchnorm(model):
+    '''
+    Fold every BatchNorm2d that directly follows a Conv2d in an nn.Sequential
+    (Conv2DBNActiv / SeperableConv2DBNActiv in every layers variant) into that
+    conv. The model must be in eval mode; it is modified in place and returned.
+    '''
+    if model.training:
+        raise ValueError('fold_batchnorm needs a model in eval mode')
+    for module in model.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        names = list(module._modules)
+        for first, second in zip(names, names[1:]):
+            conv, bn = module._modules[first], module._modules[second]
+            if (isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d)
+                    and bn.track_running_stats and bn.running_var is not None):
+                module._modules[first] = fold_conv_bn(conv, bn)
+                module._modules[second] = nn.Identity()
+    return model
+
+
+def prepare_cpu_model(model):
+    '''Apply the performance-mode transforms to a model in eval mode (folding is a no-op if already done).'''
+    model = fold_batchnorm(model)
+    return model.to(memory_format=torch.channels_last)
+
+
+def inference_context(perf, bf16=None):
+    '''Grad-free context for a forward pass; perf adds inference_mode and bf16 autocast.'''
+    if not perf:
+        return torch.no_grad()
+    stack = contextlib.ExitStack()
+    stack.enter_context(torch.inference_mode())
+    if bf16 if bf16 is not None else bf16_supported():
+        stack.enter_context(torch.autocast('cpu', dtype=torch.bfloat16))
+    return stack
@@ -0,0 +1,157 @@
+'''
+Cached polyphase resampling for the multi-band analysis and synthesis.
+
+Every conversion runs through scipy.signal's polyphase FIR with a Kaiser-windowed
+sinc kernel that is designed once per (sr_in, sr_out, quality, dtype) and cached.
+The res_type names used in modelparams and spec_utils map to a quality:
+
+    polyphase                               scipy's resample_poly design (identical output)
+    kaiser_fast, sinc_fastest, soxr_lq      16 zero crossings, rolloff 0.85 (resampy kaiser_fast)
+    sinc_medium, scipy, soxr_mq             32 zero crossings, rolloff 0.90
+    kaiser_best, sinc_best, soxr_hq/vhq     64 zero crossings, rolloff 0.9476 (resampy kaiser_best)
+
+scipy's FFT resampler is replaced by the medium kernel: in-band output stays within
+~100 dB of it, and unlike the FFT it can be streamed and does not wrap around.
+
+Conversions between equal rates return the input unchanged; other res_type names
+(and fractional rates) fall back to librosa.resample. StreamingResampler produces
+the same samples as a one-shot call, block by block.
+'''
+import math
+from functools import lru_cache
+
+import librosa
+import numpy as np
+from scipy import signal
+
+# quality: (zero crossings per side, cutoff relative to the lower Nyquist, Kaiser beta)
+QUALITIES = {
+    'polyphase': (10, 1.0, 5.0),
+    'fast': (16, 0.85, 8.555504641634386),
+    'medium': (32, 0.90, 10.0),
+    'best': (64, 0.9475937167399596, 14.769656459379492),
+}
+
+RES_TYPES = {
+    'polyphase': 'polyphase',
+    'kaiser_fast': 'fast',
+    'sinc_fastest': 'fast',
+    'soxr_lq': 'fast',
+    'sinc_medium': 'medium',
+    'soxr_mq': 'medium',
+    'kaiser_best': 'best',
+    'sinc_best': 'best',
+    'scipy': 'medium',
+    'soxr_hq': 'best',
+    'soxr_vhq': 'best',
+}
+
+
+def quality_for(res_type):
+    '''Cached-kernel quality for a librosa res_type name, or None if it is not mapped.'''
+    return RES_TYPES.get(res_type)
+
+
+@lru_cache(maxsize=None)
+def ratio(sr_in, sr_out):
+    '''(up, down) in lowest terms.'''
+    g = math.gcd(sr_in, sr_out)
+    return sr_out // g, sr_in // g
+
+
+@lru_cache(maxsize=128)
+def kernel(sr_in, sr_out, quality, dtype='float32'):
+    '''Low-pass FIR at the upsampled rate (unit DC gain, read-only).'''
+    zeros, rolloff, beta = QUALITIES[quality]
+    up, down = ratio(sr_in, sr_out)
+    max_rate = max(up, down)
+    half_len = zeros * max_rate
+    h = signal.firwin(2 * half_len + 1, rolloff / max_rate, window=('kaiser', beta)).astype(dtype)
+    h.flags.writeable = False
+    return h
+
+
+def _is_rate(sr):
+    return float(sr).is_integer() and sr > 0
+
+
+def _float_dtype(dtype):
+    return np.dtype(dtype) if np.dtype(dtype) in (np.float32, np.float64) else np.dtype(np.float32)
+
+
+def resample(y, orig_sr, target_sr, res_type='polyphase'):
+    '''Resample y along its last axis; a drop-in for librosa.resample on these res_types.'''
+    if orig_sr == target_sr:
+        return y
+    quality = quality_for(res_type)
+    if quality is None or not (_is_rate(orig_sr) and _is_rate(target_sr)):
+        return librosa.resample(y, orig_sr=orig_sr, target_sr=target_sr, res_type=res_type)
+    orig_sr, target_sr = int(orig_sr), int(target_sr)
+    y = np.asarray(y)
+    up, down = ratio(orig_sr, target_sr)
+    h = kernel(orig_sr, target_sr, quality, _float_dtype(y.dtype).name)
+    return np.asarray(signal.resample_poly(y, up, down, axis=-1, window=h), dtype=y.dtype)
+
+
+class StreamingResampler(object):
+    '''
+    Block-wise resampler for (channels, samples) input. process() returns every
+    output sample whose filter support has been seen; flush() returns the rest.
+    The concatenated output equals resample() on the whole input.
+    '''
+
+    def __init__(self, orig_sr, target_sr, res_type='polyphase', channels=2, dtype=np.float32):
+        quality = quality_for(res_type)
+        if quality is None:
+            raise ValueError('No cached kernel for res_type {!r}'.format(res_type))
+        if not (_is_rate(orig_sr) and _is_rate(target_sr)):
+            raise ValueError('Sample rates must be positive integers')
+        self.orig_sr, self.target_sr = int(orig_sr), int(target_sr)
+        self.up, self.down = ratio(self.orig_sr, self.target_sr)
+        self.channels = channels
+        self.dtype = _float_dtype(dtype)
+        h = kernel(self.orig_sr, self.target_sr, quality, self.dtype.name) * self.up
+        self._half_len = (len(h) - 1) // 2
+        # Same centering as scipy.signal.resample_poly
+        pre = self.down - self._half_len % self.down
+        self._h = np.concatenate([np.zeros(pre, dtype=h.dtype), h])
+        self._pre_remove = (self._half_len + pre) // self.down
+        self._buf = np.zeros((channels, 0), dtype=self.dtype)
+        self._base = 0
+        self._n_in = 0
+        self._next = 0
+
+    @property
+    def identity(self):
+        return self.up == self.down
+
+    def _emit(self, m_end, buf):
+        if m_end <= self._next:
+            return np.zeros((self.channels, 0), dtype=self.dtype)
+        y = signal.upfirdn(self._h, buf, self.up, self.down, axis=-1)
+        off = self._pre_remove - self._base * self.up // self.down
+        out = np.asarray(y[:, self._next + off:m_end + off], dtype=self.dtype)
+        self._next = m_end
+        # Keep only the input the next output still needs, from a multiple of down
+        n_min = max(0, -(-(self._next * self.down - self._half_len) // self.up))
+        base = max(self._base, n_min // self.down * self.down)
+        self._buf = self._buf[:, base - self._base:]
+        self._base = base
+        return out
+
+    def process(self, block):
+        block = np.asarray(block, dtype=self.dtype)
+        if self.identity:
+            return block
+        self._buf = np.concatenate([self._buf, block], axis=1)
+        self._n_in += block.shape[1]
+        m_end = max(0, -(-(self._n_in * self.up - self._half_len) // self.down))
+        return self._emit(m_end, self._buf)
+
+    def flush(self):
+        if self.identity:
+            return np.zeros((self.channels, 0), dtype=self.dtype)
+        total = -(-self._n_in * self.up // self.down)
+        # The input is zero past its end, as in a one-shot call
+        pad = np.zeros((self.channels, self._half_len // self.up + self.down + 1), dtype=self.dtype)
+        return self._emit(total, np.concatenate([self._buf, pad], axis=1))
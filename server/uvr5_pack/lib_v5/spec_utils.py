@@ -3,6 +3,11 @@ import numpy  as  np
 import soundfile  as  sf
 from tqdm import tqdm
 import json,math ,hashlib
+from collections import deque
+from functools import lru_cache
+
+from uvr5_pack.lib_v5.resample import resample
+from uvr5_pack.lib_v5.stft_backend import get_backend
 
 def crop_center(h1, h2):
     h1_shape = h1.size()
@@ -22,7 +27,7 @@ def crop_center(h1, h2):
     return h1
 
 
-def wave_to_spectrogram(wave, hop_length, n_fft, mid_side=False, mid_side_b2=False, reverse=False):
+def _split_channels(wave, mid_side=False, mid_side_b2=False, reverse=False):
     if reverse:
         wave_left = np.flip(np.asfortranarray(wave[0]))
         wave_right = np.flip(np.asfortranarray(wave[1]))
@@ -35,43 +40,37 @@ def wave_to_spectrogram(wave, hop_length, n_fft, mid_side=False, mid_side_b2=Fal
     else:
         wave_left = np.asfortranarray(wave[0])
         wave_right = np.asfortranarray(wave[1])
+    return wave_left, wave_right
 
-    spec_left = librosa.stft(wave_left, n_fft, hop_length=hop_length)
-    spec_right = librosa.stft(wave_right, n_fft, hop_length=hop_length)
-    
-    spec = np.asfortranarray([spec_left, spec_right])
 
-    return spec
+def wave_to_spectrogram(wave, hop_length, n_fft, mid_side=False, mid_side_b2=False, reverse=False):
+    return get_backend().stft(_split_channels(wave, mid_side, mid_side_b2, reverse), n_fft, hop_length)
    
    
 def wave_to_spectrogram_mt(wave, hop_length, n_fft, mid_side=False, mid_side_b2=False, reverse=False):
-    import threading
+    channels = _split_channels(wave, mid_side, mid_side_b2, reverse)
+    return get_backend().submit_stft(channels, n_fft, hop_length)()
 
-    if reverse:
-        wave_left = np.flip(np.asfortranarray(wave[0]))
-        wave_right = np.flip(np.asfortranarray(wave[1]))
-    elif mid_side:
-        wave_left = np.asfortranarray(np.add(wave[0], wave[1]) / 2)
-        wave_right = np.asfortranarray(np.subtract(wave[0], wave[1]))
-    elif mid_side_b2:
-        wave_left = np.asfortranarray(np.add(wave[1], wave[0] * .5))
-        wave_right = np.asfortranarray(np.subtract(wave[0], wave[1] * .5))
-    else:
-        wave_left = np.asfortranarray(wave[0])
-        wave_right = np.asfortranarray(wave[1])
-   
-    def run_thread(**kwargs):
-        global spec_left
-        spec_left = librosa.stft(**kwargs)
-
-    thread = threading.Thread(target=run_thread, kwargs={'y': wave_left, 'n_fft': n_fft, 'hop_length': hop_length})
-    thread.start()
-    spec_right = librosa.stft(wave_right, n_fft, hop_length=hop_length)
-    thread.join()   
-    
-    spec = np.asfortranarray([spec_left, spec_right])
 
-    return spec
+def wave_to_spectrogram_bands(wave, mp):
+    '''
+    Spectrograms of every band of mp, keyed by band number, for a stereo wave at
+    the top band rate. Bands are resampled top-down on the calling thread and
+    handed to the STFT backend as they are ready, which runs them in the shared
+    pool (librosa) or batches bands with equal n_fft, hop and length (torch).
+    '''
+    bands_n = len(mp.param['band'])
+    order = list(range(bands_n, 0, -1))
+
+    def jobs(wave):
+        for d in order:
+            bp = mp.param['band'][d]
+            if d != bands_n:
+                wave = resample(wave, mp.param['band'][d + 1]['sr'], bp['sr'], bp['res_type'])
+            channels = _split_channels(wave, mp.param['mid_side'], mp.param['mid_side_b2'], mp.param['reverse'])
+            yield channels, bp['n_fft'], bp['hl']
+
+    return dict(zip(order, get_backend().stft_bands(jobs(wave))))
     
     
 def combine_spectrograms(specs, mp):
@@ -93,11 +92,8 @@ def combine_spectrograms(specs, mp):
         if bands_n == 1:
             spec_c = fft_lp_filter(spec_c, mp.param['pre_filter_start'], mp.param['pre_filter_stop'])
         else:
-            gp = 1        
-            for b in range(mp.param['pre_filter_start'] + 1, mp.param['pre_filter_stop']):
-                g = math.pow(10, -(b - mp.param['pre_filter_start']) * (3.5 - gp) / 20.0)
-                gp = g
-                spec_c[:, b, :] *= g
+            start, stop = mp.param['pre_filter_start'] + 1, mp.param['pre_filter_stop']
+            spec_c[:, start:stop, :] *= _pre_filter_gains(start - 1, stop, spec_c.dtype)[None, :, None]
                 
     return np.asfortranarray(spec_c)
     
@@ -128,6 +124,24 @@ def spectrogram_to_image(spec, mode='magnitude'):
     return img
 
 
+def with_phase_of(mag, spec, spec_mag=None):
+    '''
+    mag * exp(1j * angle(spec)) without the trig round trip: spec * (mag / |spec|), in
+    spec's complex dtype. Zero bins of spec (angle 0) take mag itself. Pass spec_mag
+    when |spec| is already at hand.
+    '''
+    if spec_mag is None:
+        spec_mag = np.abs(spec)
+    ratio = np.zeros(np.broadcast(mag, spec_mag).shape, dtype=spec_mag.dtype)
+    np.divide(mag, spec_mag, out=ratio, where=spec_mag > 0)
+    out = spec * ratio
+    del ratio
+    silent = spec_mag == 0
+    if silent.any():
+        out[silent] = np.broadcast_to(mag, out.shape)[silent]
+    return out
+
+
 def reduce_vocal_aggressively(X, y, softmask):
     v = X - y
     y_mag_tmp = np.abs(y)
@@ -136,7 +150,7 @@ def reduce_vocal_aggressively(X, y, softmask):
     v_mask = v_mag_tmp > y_mag_tmp
     y_mag = np.clip(y_mag_tmp - v_mag_tmp * v_mask * softmask, 0, np.inf)
 
-    return y_mag * np.exp(1.j * np.angle(y))
+    return with_phase_of(y_mag, y, y_mag_tmp)
 
 
 def mask_silence(mag, ref, thres=0.2, min_range=64, fade_size=32):
@@ -206,12 +220,12 @@ def cache_or_load(mix_path, inst_path, mp):
                     
             if d == len(mp.param['band']): # high-end band
                 X_wave[d], _ = librosa.load(
-                    mix_path, bp['sr'], False, dtype=np.float32, res_type=bp['res_type'])
+                    mix_path, sr=bp['sr'], mono=False, dtype=np.float32, res_type=bp['res_type'])
                 y_wave[d], _ = librosa.load(
-                    inst_path, bp['sr'], False, dtype=np.float32, res_type=bp['res_type'])
+                    inst_path, sr=bp['sr'], mono=False, dtype=np.float32, res_type=bp['res_type'])
             else: # lower bands
-                X_wave[d] = librosa.resample(X_wave[d+1], mp.param['band'][d+1]['sr'], bp['sr'], res_type=bp['res_type'])
-                y_wave[d] = librosa.resample(y_wave[d+1], mp.param['band'][d+1]['sr'], bp['sr'], res_type=bp['res_type'])
+                X_wave[d] = librosa.resample(X_wave[d+1], orig_sr=mp.param['band'][d+1]['sr'], target_sr=bp['sr'], res_type=bp['res_type'])
+                y_wave[d] = librosa.resample(y_wave[d+1], orig_sr=mp.param['band'][d+1]['sr'], target_sr=bp['sr'], res_type=bp['res_type'])
             
             X_wave[d], y_wave[d] = align_wave_head_and_tail(X_wave[d], y_wave[d])
             
@@ -234,13 +248,7 @@ def cache_or_load(mix_path, inst_path, mp):
     return X_spec_m, y_spec_m
 
 
-def spectrogram_to_wave(spec, hop_length, mid_side, mid_side_b2, reverse):
-    spec_left = np.asfortranarray(spec[0])
-    spec_right = np.asfortranarray(spec[1])
-
-    wave_left = librosa.istft(spec_left, hop_length=hop_length)
-    wave_right = librosa.istft(spec_right, hop_length=hop_length)
-
+def _join_channels(wave_left, wave_right, mid_side, mid_side_b2, reverse):
     if reverse:
         return np.asfortranarray([np.flip(wave_left), np.flip(wave_right)])
     elif mid_side:
@@ -249,87 +257,144 @@ def spectrogram_to_wave(spec, hop_length, mid_side, mid_side_b2, reverse):
         return np.asfortranarray([np.add(wave_right / 1.25, .4 * wave_left), np.subtract(wave_left / 1.25, .4 * wave_right)])
     else:
         return np.asfortranarray([wave_left, wave_right])
-    
-    
-def spectrogram_to_wave_mt(spec, hop_length, mid_side, reverse, mid_side_b2):
-    import threading
 
-    spec_left = np.asfortranarray(spec[0])
-    spec_right = np.asfortranarray(spec[1])
+
+def spectrogram_to_wave(spec, hop_length, mid_side, mid_side_b2, reverse):
+    wave_left, wave_right = get_backend().istft(spec, hop_length)
+    return _join_channels(wave_left, wave_right, mid_side, mid_side_b2, reverse)
     
-    def run_thread(**kwargs):
-        global wave_left
-        wave_left = librosa.istft(**kwargs)
-        
-    thread = threading.Thread(target=run_thread, kwargs={'stft_matrix': spec_left, 'hop_length': hop_length})
-    thread.start()
-    wave_right = librosa.istft(spec_right, hop_length=hop_length)
-    thread.join()   
     
-    if reverse:
-        return np.asfortranarray([np.flip(wave_left), np.flip(wave_right)])
-    elif mid_side:
-        return np.asfortranarray([np.add(wave_left, wave_right / 2), np.subtract(wave_left, wave_right / 2)])
-    elif mid_side_b2:
-        return np.asfortranarray([np.add(wave_right / 1.25, .4 * wave_left), np.subtract(wave_left / 1.25, .4 * wave_right)])
-    else:
-        return np.asfortranarray([wave_left, wave_right])
+def spectrogram_to_wave_mt(spec, hop_length, mid_side, reverse, mid_side_b2):
+    wave_left, wave_right = get_backend().submit_istft(spec, hop_length)()
+    return _join_channels(wave_left, wave_right, mid_side, mid_side_b2, reverse)
     
     
+def istft_band_window():
+    '''Bands whose iSTFT cmb_spectrogram_to_wave keeps in flight at once (UVR_ISTFT_BANDS, default 2).'''
+    try:
+        n = int(os.environ.get('UVR_ISTFT_BANDS', '2'))
+    except ValueError:
+        n = 2
+    return max(1, n)
+
+
+def _band_spectrogram(spec_m, mp, d, offset, dtype, extra_bins_h=None, extra_bins=None):
+    bands_n = len(mp.param['band'])
+    bp = mp.param['band'][d]
+    spec_s = np.zeros(shape=(2, bp['n_fft'] // 2 + 1, spec_m.shape[2]), dtype=dtype)
+    h = bp['crop_stop'] - bp['crop_start']
+    spec_s[:, bp['crop_start']:bp['crop_stop'], :] = spec_m[:, offset:offset+h, :]
+
+    if d == bands_n: # higher
+        if extra_bins_h: # if --high_end_process bypass
+            max_bin = bp['n_fft'] // 2
+            spec_s[:, max_bin-extra_bins_h:max_bin, :] = extra_bins[:, :extra_bins_h, :]
+        if bp['hpf_start'] > 0:
+            spec_s = fft_hp_filter(spec_s, bp['hpf_start'], bp['hpf_stop'] - 1)
+    elif d == 1: # lower
+        spec_s = fft_lp_filter(spec_s, bp['lpf_start'], bp['lpf_stop'])
+    else: # mid
+        spec_s = fft_hp_filter(spec_s, bp['hpf_start'], bp['hpf_stop'] - 1)
+        spec_s = fft_lp_filter(spec_s, bp['lpf_start'], bp['lpf_stop'])
+    return spec_s
+
+
+def _add_band(wave, band_waves, mp, d):
+    bands_n = len(mp.param['band'])
+    bp = mp.param['band'][d]
+    wave_left, wave_right = band_waves
+    band_wave = _join_channels(wave_left, wave_right, mp.param['mid_side'], mp.param['mid_side_b2'], mp.param['reverse'])
+    if d == bands_n: # higher
+        if bands_n == 1:
+            return band_wave
+        return np.add(wave, band_wave)
+    sr = mp.param['band'][d+1]['sr']
+    if d == 1: # lower
+        return resample(band_wave, bp['sr'], sr, "sinc_fastest")
+    # mid
+    wave2 = np.add(wave, band_wave)
+    # wave = librosa.core.resample(wave2, bp['sr'], sr, res_type="sinc_fastest")
+    return resample(wave2, bp['sr'], sr, 'scipy')
+
+
 def cmb_spectrogram_to_wave(spec_m, mp, extra_bins_h=None, extra_bins=None):
-    wave_band = {}
-    bands_n = len(mp.param['band'])    
-    offset = 0
+    '''
+    Bands are filtered and their channel iSTFTs submitted to the backend in order,
+    with at most istft_band_window() bands in flight; each finished band is folded
+    into the running wave and released at once. Peak memory is therefore that many
+    band spectrograms and waves plus the running sum, independent of the band count.
+    '''
+    bands_n = len(mp.param['band'])
+    # Band buffers keep spec_m's precision (complex64 from combine_spectrograms)
+    dtype = np.result_type(spec_m.dtype, np.complex64)
+    backend = get_backend()
+    window = istft_band_window()
 
+    wave = None
+    pending = deque()
+    offset = 0
     for d in range(1, bands_n + 1):
         bp = mp.param['band'][d]
-        spec_s = np.ndarray(shape=(2, bp['n_fft'] // 2 + 1, spec_m.shape[2]), dtype=complex)
-        h = bp['crop_stop'] - bp['crop_start']
-        spec_s[:, bp['crop_start']:bp['crop_stop'], :] = spec_m[:, offset:offset+h, :]
-        
-        offset += h
-        if d == bands_n: # higher
-            if extra_bins_h: # if --high_end_process bypass
-                max_bin = bp['n_fft'] // 2
-                spec_s[:, max_bin-extra_bins_h:max_bin, :] = extra_bins[:, :extra_bins_h, :]
-            if bp['hpf_start'] > 0:
-                spec_s = fft_hp_filter(spec_s, bp['hpf_start'], bp['hpf_stop'] - 1)
-            if bands_n == 1:
-                wave = spectrogram_to_wave(spec_s, bp['hl'], mp.param['mid_side'], mp.param['mid_side_b2'], mp.param['reverse'])
-            else:
-                wave = np.add(wave, spectrogram_to_wave(spec_s, bp['hl'], mp.param['mid_side'], mp.param['mid_side_b2'], mp.param['reverse']))
-        else:
-            sr = mp.param['band'][d+1]['sr']
-            if d == 1: # lower
-                spec_s = fft_lp_filter(spec_s, bp['lpf_start'], bp['lpf_stop'])
-                wave = librosa.resample(spectrogram_to_wave(spec_s, bp['hl'], mp.param['mid_side'], mp.param['mid_side_b2'], mp.param['reverse']), bp['sr'], sr, res_type="sinc_fastest")
-            else: # mid
-                spec_s = fft_hp_filter(spec_s, bp['hpf_start'], bp['hpf_stop'] - 1)
-                spec_s = fft_lp_filter(spec_s, bp['lpf_start'], bp['lpf_stop'])
-                wave2 = np.add(wave, spectrogram_to_wave(spec_s, bp['hl'], mp.param['mid_side'], mp.param['mid_side_b2'], mp.param['reverse']))
-                # wave = librosa.core.resample(wave2, bp['sr'], sr, res_type="sinc_fastest")
-                wave = librosa.core.resample(wave2, bp['sr'], sr,res_type='scipy')
-        
+        spec_s = _band_spectrogram(spec_m, mp, d, offset, dtype, extra_bins_h, extra_bins)
+        offset += bp['crop_stop'] - bp['crop_start']
+        pending.append((d, backend.submit_istft(spec_s, bp['hl'])))
+        del spec_s
+        if len(pending) >= window:
+            done, result = pending.popleft()
+            wave = _add_band(wave, result(), mp, done)
+    while pending:
+        done, result = pending.popleft()
+        wave = _add_band(wave, result(), mp, done)
+
     return wave.T
 
 
-def fft_lp_filter(spec, bin_start, bin_stop):
+# Per-bin gain vectors depend only on the band config, so they are built once and
+# applied to the ramp bins in a single broadcast multiply. Gains carry the spectrogram's
+# complex dtype so the multiply runs without a per-element cast.
+
+@lru_cache(maxsize=None)
+def _pre_filter_gains(filter_start, filter_stop, dtype):
+    gains = []
+    gp = 1
+    for b in range(filter_start + 1, filter_stop):
+        g = math.pow(10, -(b - filter_start) * (3.5 - gp) / 20.0)
+        gp = g
+        gains.append(g)
+    return np.array(gains, dtype=dtype)
+
+
+@lru_cache(maxsize=None)
+def _lp_gains(bin_start, bin_stop, dtype):
+    """Linear ramp over bins [bin_start, bin_stop)."""
+    gains = []
     g = 1.0
     for b in range(bin_start, bin_stop):
         g -= 1 / (bin_stop - bin_start)
-        spec[:, b, :] = g * spec[:, b, :]
-        
+        gains.append(g)
+    return np.array(gains, dtype=dtype)
+
+
+@lru_cache(maxsize=None)
+def _hp_gains(bin_start, bin_stop, dtype):
+    """Linear ramp over bins (bin_stop, bin_start], in ascending bin order."""
+    gains = []
+    g = 1.0
+    for b in range(bin_start, bin_stop, -1):
+        g -= 1 / (bin_start - bin_stop)
+        gains.append(g)
+    return np.array(gains[::-1], dtype=dtype)
+
+
+def fft_lp_filter(spec, bin_start, bin_stop):
+    spec[:, bin_start:bin_stop, :] *= _lp_gains(bin_start, bin_stop, spec.dtype)[None, :, None]
     spec[:, bin_stop:, :] *= 0
 
     return spec
 
 
 def fft_hp_filter(spec, bin_start, bin_stop):
-    g = 1.0
-    for b in range(bin_start, bin_stop, -1):
-        g -= 1 / (bin_start - bin_stop)
-        spec[:, b, :] = g * spec[:, b, :]
-    
+    spec[:, bin_stop + 1:bin_start + 1, :] *= _hp_gains(bin_start, bin_stop, spec.dtype)[None, :, None]
     spec[:, 0:bin_stop+1, :] *= 0
 
     return spec
@@ -338,7 +403,7 @@ def fft_hp_filter(spec, bin_start, bin_stop):
 def mirroring(a, spec_m, input_high_end, mp):
     if 'mirroring' == a:
         mirror = np.flip(np.abs(spec_m[:, mp.param['pre_filter_start']-10-input_high_end.shape[1]:mp.param['pre_filter_start']-10, :]), 1)
-        mirror = mirror * np.exp(1.j * np.angle(input_high_end))
+        mirror = with_phase_of(mirror, input_high_end)
         
         return np.where(np.abs(input_high_end) <= np.abs(mirror), input_high_end, mirror)
         
@@ -366,22 +431,10 @@ def ensembling(a, specs):
     return spec
 
 def stft(wave, nfft, hl):
-    wave_left = np.asfortranarray(wave[0])
-    wave_right = np.asfortranarray(wave[1])
-    spec_left = librosa.stft(wave_left, nfft, hop_length=hl)
-    spec_right = librosa.stft(wave_right, nfft, hop_length=hl)
-    spec = np.asfortranarray([spec_left, spec_right])
-
-    return spec
+    return get_backend().stft((wave[0], wave[1]), nfft, hl)
 
 def istft(spec, hl):
-    spec_left = np.asfortranarray(spec[0])
-    spec_right = np.asfortranarray(spec[1])
-
-    wave_left = librosa.istft(spec_left, hop_length=hl)
-    wave_right = librosa.istft(spec_right, hop_length=hl)
-    wave = np.asfortranarray([wave_left, wave_right])
-    return wave
+    return get_backend().istft(spec, hl)
 
 
 if __name__ == "__main__":
@@ -418,12 +471,12 @@ if __name__ == "__main__":
             
             if d == len(mp.param['band']): # high-end band                
                 wave[d], _ = librosa.load(
-                    args.input[i], bp['sr'], False, dtype=np.float32, res_type=bp['res_type'])
+                    args.input[i], sr=bp['sr'], mono=False, dtype=np.float32, res_type=bp['res_type'])
                 
                 if len(wave[d].shape) == 1: # mono to stereo
                     wave[d] = np.array([wave[d], wave[d]])
             else: # lower bands
-                wave[d] = librosa.resample(wave[d+1], mp.param['band'][d+1]['sr'], bp['sr'], res_type=bp['res_type'])
+                wave[d] = librosa.resample(wave[d+1], orig_sr=mp.param['band'][d+1]['sr'], target_sr=bp['sr'], res_type=bp['res_type'])
                        
             spec[d] = wave_to_spectrogram(wave[d], bp['hl'], bp['n_fft'], mp.param['mid_side'], mp.param['mid_side_b2'], mp.param['reverse'])
             
@@ -445,7 +498,7 @@ if __name__ == "__main__":
             X_mag = np.abs(specs[0])
             y_mag = np.abs(specs[1])            
             max_mag = np.where(X_mag >= y_mag, X_mag, y_mag)  
-            v_spec = specs[1] - max_mag * np.exp(1.j * np.angle(specs[0]))
+            v_spec = specs[1] - with_phase_of(max_mag, specs[0])
         else:
             specs[1] = reduce_vocal_aggressively(specs[0], specs[1], 0.2)
             v_spec = specs[0] - specs[1]
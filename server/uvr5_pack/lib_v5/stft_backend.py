@@ -0,0 +1,151 @@
+'''
+Pluggable STFT backends for spec_utils, chosen per process by UVR_STFT_BACKEND.
+
+librosa (default) makes one librosa.stft/istft call per channel. torch runs all
+channels, and any bands that share n_fft, hop and length, through one batched
+torch.stft/istft call on cached Hann windows, using torch's intra-op threads.
+Both take and return librosa's layout: waves (channels, samples), spectrograms
+(channels, bins, frames), complex64 for float32 input and complex128 for float64.
+'''
+import os
+import threading
+from functools import lru_cache
+
+import librosa
+import numpy as np
+
+from uvr5_pack.lib_v5 import stft_engine
+
+BACKENDS = ('librosa', 'torch')
+
+_backend = None
+_lock = threading.Lock()
+
+
+class LibrosaBackend(object):
+    '''One librosa call per channel; submit_* spreads the channels over the stft_engine pool.'''
+
+    name = 'librosa'
+
+    def stft(self, waves, n_fft, hop_length):
+        return np.asfortranarray([librosa.stft(np.asfortranarray(y), n_fft=n_fft, hop_length=hop_length)
+                                  for y in waves])
+
+    def istft(self, specs, hop_length):
+        return np.asfortranarray([librosa.istft(np.asfortranarray(s), hop_length=hop_length) for s in specs])
+
+    def submit_stft(self, waves, n_fft, hop_length):
+        '''Start the STFT of every channel; returns a callable that waits for the stacked result.'''
+        futures = [stft_engine.submit(librosa.stft, np.asfortranarray(y), n_fft=n_fft, hop_length=hop_length)
+                   for y in waves]
+        return lambda: np.asfortranarray([f.result() for f in futures])
+
+    def submit_istft(self, specs, hop_length):
+        futures = [stft_engine.submit(librosa.istft, np.asfortranarray(s), hop_length=hop_length) for s in specs]
+        return lambda: np.asfortranarray([f.result() for f in futures])
+
+    def stft_bands(self, jobs):
+        '''STFTs of (waves, n_fft, hop_length) jobs, started as the iterable yields them.'''
+        pending = [self.submit_stft(*job) for job in jobs]
+        return [result() for result in pending]
+
+    def istft_bands(self, jobs):
+        pending = [self.submit_istft(*job) for job in jobs]
+        return [result() for result in pending]
+
+
+@lru_cache(maxsize=None)
+def _window(n_fft, dtype):
+    import torch
+    # librosa's default window: scipy hann with fftbins=True, i.e. periodic
+    return torch.hann_window(n_fft, periodic=True, dtype=dtype)
+
+
+class TorchBackend(LibrosaBackend):
+    '''Batched torch.stft/istft; a submitted job is one pool task for all its channels.'''
+
+    name = 'torch'
+
+    @staticmethod
+    def _real(x):
+        x = np.asarray(x)
+        return x if x.dtype in (np.float32, np.float64) else x.astype(np.float32)
+
+    def stft(self, waves, n_fft, hop_length):
+        import torch
+        x = torch.from_numpy(np.ascontiguousarray(self._real(waves)))
+        with torch.inference_mode():
+            spec = torch.stft(x, n_fft, hop_length=hop_length, window=_window(n_fft, x.dtype), center=True,
+                              pad_mode='constant', return_complex=True)
+        return np.asfortranarray(spec.numpy())
+
+    def istft(self, specs, hop_length):
+        import torch
+        specs = np.asarray(specs)
+        if specs.dtype not in (np.complex64, np.complex128):
+            specs = specs.astype(np.complex64)
+        x = torch.from_numpy(np.ascontiguousarray(specs))
+        n_fft = 2 * (x.shape[-2] - 1)
+        with torch.inference_mode():
+            wave = torch.istft(x, n_fft, hop_length=hop_length, window=_window(n_fft, x.real.dtype), center=True)
+        return np.asfortranarray(wave.numpy())
+
+    def submit_stft(self, waves, n_fft, hop_length):
+        return stft_engine.submit(self.stft, waves, n_fft, hop_length).result
+
+    def submit_istft(self, specs, hop_length):
+        return stft_engine.submit(self.istft, specs, hop_length).result
+
+    @staticmethod
+    def _batched(jobs, key, submit):
+        # Jobs with the same key are stacked on the channel axis and run as one call
+        jobs = [(np.asarray(job[0]),) + tuple(job[1:]) for job in jobs]
+        groups = {}
+        for i, job in enumerate(jobs):
+            groups.setdefault(key(job), []).append(i)
+        results = [None] * len(jobs)
+        pending = []
+        for members in groups.values():
+            first = jobs[members[0]]
+            stacked = np.concatenate([jobs[i][0] for i in members]) if len(members) > 1 else first[0]
+            pending.append((members, submit(stacked, *first[1:])))
+        for members, result in pending:
+            out = result()
+            start = 0
+            for i in members:
+                n = jobs[i][0].shape[0]
+                results[i] = np.asfortranarray(out[start:start + n])
+                start += n
+        return results
+
+    def stft_bands(self, jobs):
+        return self._batched(jobs, lambda j: (j[0].shape[1:], j[0].dtype, j[1], j[2]), self.submit_stft)
+
+    def istft_bands(self, jobs):
+        return self._batched(jobs, lambda j: (j[0].shape[1:], j[0].dtype, j[1]), self.submit_istft)
+
+
+def create(name):
+    if name == 'librosa':
+        return LibrosaBackend()
+    if name == 'torch':
+        return TorchBackend()
+    raise ValueError('Unknown STFT backend {!r} (expected one of {})'.format(name, ', '.join(BACKENDS)))
+
+
+def get_backend():
+    '''The process-wide backend, read from UVR_STFT_BACKEND on first use.'''
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = create(os.environ.get('UVR_STFT_BACKEND', 'librosa').strip().lower() or 'librosa')
+        return _backend
+
+
+def set_backend(name=None):
+    '''Switch backends (None = re-read UVR_STFT_BACKEND on next use); returns the previous one.'''
+    global _backend
+    with _lock:
+        previous = _backend
+        _backend = create(name) if name is not None else None
+    return previous
@@ -0,0 +1,54 @@
+'''
+Shared thread pool for the per-band, per-channel STFTs of the lib_v5 pipeline.
+
+spec_utils submits one task per band and channel and collects the results from
+futures, so concurrent separations never share state. The pool is created on
+first use and bounded by UVR_STFT_THREADS (default: CPU count, at most 8).
+Tasks submitted here must not themselves wait on the pool.
+'''
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_max_workers = None
+_lock = threading.Lock()
+
+
+def default_workers():
+    try:
+        n = int(os.environ.get('UVR_STFT_THREADS', '0'))
+    except ValueError:
+        n = 0
+    if n > 0:
+        return n
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def executor():
+    '''The shared ThreadPoolExecutor, created on first use.'''
+    global _executor, _max_workers
+    with _lock:
+        if _executor is None:
+            _max_workers = _max_workers or default_workers()
+            _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix='uvr-stft')
+        return _executor
+
+
+def max_workers():
+    with _lock:
+        return _max_workers or default_workers()
+
+
+def set_max_workers(n=None):
+    '''Resize the pool (None = UVR_STFT_THREADS default); running tasks finish on the old pool.'''
+    global _executor, _max_workers
+    with _lock:
+        old, _executor = _executor, None
+        _max_workers = n
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def submit(fn, *args, **kwargs):
+    return executor().submit(fn, *args, **kwargs)
@@ -0,0 +1,128 @@
+'''
+Persistent index of UVR weight fingerprints.
+
+Resolving a checkpoint's parameter set needs its md5, which means reading the
+whole file (hundreds of MB for the 537238KB nets). The result is recorded in a
+sidecar JSON next to the weights (UVR_MODEL_INDEX overrides the location),
+keyed by real path and validated by size and mtime, so later constructions
+resolve without touching the weights. Entries store the param-set name rather
+than the params JSON path, so the index stays valid when the checkout is moved.
+Hashing, when needed, reads the file in HASH_BLOCK_SIZE blocks.
+'''
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+
+INDEX_NAME = '.uvr_model_index.json'
+HASH_BLOCK_SIZE = 1024 * 1024
+# Checkpoint sizes (KB) of the nets variants; the nearest one wins
+NN_ARCH_SIZES = [31191, 33966, 61968, 123821, 123812, 537238]
+
+
+def file_md5(path, block_size=HASH_BLOCK_SIZE):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def nets_module(model_bytes):
+    '''Module implementing the network for a checkpoint of ``model_bytes``.'''
+    model_size = math.ceil(model_bytes / 1024)
+    arch = min(NN_ARCH_SIZES, key=lambda x: abs(x - model_size))
+    if arch == NN_ARCH_SIZES[0]:
+        return 'uvr5_pack.lib_v5.nets'
+    return 'uvr5_pack.lib_v5.nets_{}KB'.format(arch)
+
+
+def index_path_for(model_path):
+    return os.environ.get('UVR_MODEL_INDEX') or os.path.join(os.path.dirname(model_path), INDEX_NAME)
+
+
+class ModelIndex(object):
+    '''Resolves weights to {md5, nets, param_name, params}, remembering results on disk.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, index_path):
+        entries = self._indexes.get(index_path)
+        if entries is None:
+            try:
+                with open(index_path, 'r') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                entries = {}
+            self._indexes[index_path] = entries
+        return entries
+
+    @staticmethod
+    def _save(index_path, entries):
+        # Written atomically; a read-only weights directory just keeps the index in memory
+        try:
+            fd, tmp = tempfile.mkstemp(prefix='.uvr_index_', dir=os.path.dirname(index_path) or '.')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, index_path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _resolved(entry):
+        from uvr5_pack.utils import _params_path
+
+        info = dict(entry)
+        info['params'] = _params_path(entry['param_set'])
+        return info
+
+    def resolve(self, model_path):
+        from uvr5_pack.utils import _get_name_params
+
+        real = os.path.realpath(model_path)
+        st = os.stat(real)
+        index_path = index_path_for(real)
+        with self._lock:
+            entry = self._load(index_path).get(real)
+            # Entries without param_set predate it (absolute params path) and are re-resolved
+            if (entry and 'param_set' in entry and entry['size'] == st.st_size
+                    and entry['mtime_ns'] == st.st_mtime_ns):
+                self.hits += 1
+                return self._resolved(entry)
+
+        # Hash outside the lock; concurrent first sightings just hash twice
+        model_hash = file_md5(real)
+        param_name, params = _get_name_params(model_path, model_hash)
+        entry = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'md5': model_hash,
+            'nets': nets_module(st.st_size),
+            'param_name': param_name,
+            'param_set': os.path.splitext(os.path.basename(params))[0],
+        }
+        with self._lock:
+            self.misses += 1
+            entries = self._load(index_path)
+            entries[real] = entry
+            self._save(index_path, entries)
+        return self._resolved(entry)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+model_index = ModelIndex()
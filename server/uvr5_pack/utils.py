@@ -1,7 +1,10 @@
+import os
 import torch
 import numpy as np
 from tqdm import tqdm
 
+from uvr5_pack.lib_v5.optimize import inference_context
+
 def make_padding(width, cropsize, offset):
     left = offset
     roi_size = cropsize - left * 2
@@ -10,43 +13,97 @@ def make_padding(width, cropsize, offset):
     right = roi_size - (width % roi_size) + left
 
     return left, right, roi_size
-def inference(X_spec, device, model, aggressiveness,data):
+
+def _available_memory(device):
+    if str(device).startswith('cuda'):
+        free, _ = torch.cuda.mem_get_info(torch.device(device))
+        return free
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+def requested_batch_size(data):
+    requested = str(data.get('batch_size', os.environ.get('UVR_BATCH_SIZE', 'auto')))
+    if requested.isdigit() and int(requested) > 0:
+        return int(requested)
+    return None
+
+def batch_size_for(data, window_bytes, device, per_window_bytes=None):
+    '''
+    Number of windows stacked per forward pass.
+    data['batch_size'] (or UVR_BATCH_SIZE) fixes it; 'auto' sizes it from free memory,
+    using a measured per-window footprint when available, else
+    window_bytes * UVR_BATCH_MEM_FACTOR. Capped at UVR_MAX_BATCH.
+    '''
+    requested = requested_batch_size(data)
+    if requested is not None:
+        return requested
+    max_batch = int(os.environ.get('UVR_MAX_BATCH', '16'))
+    if per_window_bytes is None:
+        per_window_bytes = window_bytes * float(os.environ.get('UVR_BATCH_MEM_FACTOR', '128'))
+    budget = _available_memory(device) * 0.7
+    return int(max(1, min(max_batch, budget // max(per_window_bytes, 1))))
+
+def inference(X_spec, device, model, aggressiveness,data, coef=None):
     '''
     data ： dic configs
+    coef: level the magnitudes are normalized by before the model (default |X_spec|.max());
+    chunked callers pass the whole track's peak so every chunk is scaled alike.
+    Returns (predicted magnitude, |X_spec|).
     '''
     
     def _execute(X_mag_pad, roi_size, n_window, device, model, aggressiveness,is_half=True):
         model.eval()
-        with torch.no_grad():
-            preds = []
-            
-            iterations = [n_window]
-
-            total_iterations = sum(iterations)            
-            for i in tqdm(range(n_window)): 
-                start = i * roi_size
-                X_mag_window = X_mag_pad[None, :, :, start:start + data['window_size']]
+        window_size = data['window_size']
+        window_bytes = X_mag_pad.shape[0] * X_mag_pad.shape[1] * window_size * (2 if is_half else 4)
+        # On CUDA an auto-sized run starts with one window to measure its real memory footprint
+        probe = str(device).startswith('cuda') and requested_batch_size(data) is None
+        batch_size = 1 if probe else batch_size_for(data, window_bytes, device)
+        pred = None
+        # data['cpu_perf'] adds inference_mode, bf16 autocast and channels-last inputs
+        perf = data.get('cpu_perf', False)
+        with inference_context(perf, data.get('bf16')):
+            progress = tqdm(total=n_window)
+            i = 0
+            while i < n_window:
+                n = min(batch_size, n_window - i)
+                X_mag_window = np.stack([
+                    X_mag_pad[:, :, (i + b) * roi_size:(i + b) * roi_size + window_size]
+                    for b in range(n)
+                ])
                 X_mag_window = torch.from_numpy(X_mag_window)
                 if(is_half==True):X_mag_window=X_mag_window.half()
+                if perf:
+                    X_mag_window = X_mag_window.contiguous(memory_format=torch.channels_last)
+                if probe:
+                    torch.cuda.reset_peak_memory_stats(device)
+                    base = torch.cuda.memory_allocated(device)
                 X_mag_window=X_mag_window.to(device)
 
-                pred = model.predict(X_mag_window, aggressiveness)
-
-                pred = pred.detach().cpu().numpy()
-                preds.append(pred[0])
-                
-            pred = np.concatenate(preds, axis=2)
+                out = model.predict(X_mag_window, aggressiveness)
+                out = out.detach().float().cpu().numpy()
+                if probe:
+                    batch_size = batch_size_for(
+                        data, window_bytes, device,
+                        per_window_bytes=torch.cuda.max_memory_allocated(device) - base)
+                    probe = False
+
+                if pred is None:
+                    pred = np.empty((out.shape[1], out.shape[2], n_window * roi_size), dtype=np.float32)
+                # (n, C, F, roi) -> (C, F, n * roi), written in window order
+                pred[:, :, i * roi_size:(i + n) * roi_size] = out.transpose(1, 2, 0, 3).reshape(
+                    out.shape[1], out.shape[2], n * roi_size)
+                i += n
+                progress.update(n)
+            progress.close()
         return pred
     
-    def preprocess(X_spec):
-        X_mag = np.abs(X_spec)
-        X_phase = np.angle(X_spec)
-
-        return X_mag, X_phase
-    
-    X_mag, X_phase = preprocess(X_spec)
+    # The phase is not needed here: callers apply pred with spec_utils.with_phase_of(pred, X_spec, X_mag)
+    X_mag = np.abs(X_spec)
 
-    coef = X_mag.max()
+    if coef is None:
+        coef = X_mag.max()
     X_mag_pre = X_mag / coef
 
     n_frame = X_mag_pre.shape[2]
@@ -76,167 +133,78 @@ def inference(X_spec, device, model, aggressiveness,data):
         pred_tta = pred_tta[:, :, roi_size // 2:]
         pred_tta = pred_tta[:, :, :n_frame]
 
-        return (pred + pred_tta) * 0.5 * coef, X_mag, np.exp(1.j * X_phase)
+        return (pred + pred_tta) * 0.5 * coef, X_mag
     else:
-        return pred * coef, X_mag, np.exp(1.j * X_phase)
+        return pred * coef, X_mag
             
 
 
-def  _get_name_params(model_path , model_hash):
-    ModelName = model_path
-    if model_hash == '47939caf0cfe52a0e81442b85b971dfd':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100.json')
-        param_name_auto=str('4band_44100')
-    if model_hash == '4e4ecb9764c50a8c414fee6e10395bbe':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_v2.json')
-        param_name_auto=str('4band_v2')
-    if model_hash == 'ca106edd563e034bde0bdec4bb7a4b36':
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_v2.json')
-        param_name_auto=str('4band_v2')
-    if model_hash == 'e60a1e84803ce4efc0a6551206cc4b71':
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100.json')
-        param_name_auto=str('4band_44100')
-    if model_hash == 'a82f14e75892e55e994376edbf0c8435':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100.json')
-        param_name_auto=str('4band_44100')
-    if model_hash == '6dd9eaa6f0420af9f1d403aaafa4cc06':   
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_v2_sn.json')
-        param_name_auto=str('4band_v2_sn')
-    if model_hash == '08611fb99bd59eaa79ad27c58d137727':
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_v2_sn.json')
-        param_name_auto=str('4band_v2_sn')
-    if model_hash == '5c7bbca45a187e81abbbd351606164e5':
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/3band_44100_msb2.json')
-        param_name_auto=str('3band_44100_msb2')
-    if model_hash == 'd6b2cb685a058a091e5e7098192d3233':    
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/3band_44100_msb2.json')
-        param_name_auto=str('3band_44100_msb2')
-    if model_hash == 'c1b9f38170a7c90e96f027992eb7c62b': 
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100.json')
-        param_name_auto=str('4band_44100')
-    if model_hash == 'c3448ec923fa0edf3d03a19e633faa53':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100.json')
-        param_name_auto=str('4band_44100')
-    if model_hash == '68aa2c8093d0080704b200d140f59e54':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/3band_44100.json')
-        param_name_auto=str('3band_44100.json')
-    if model_hash == 'fdc83be5b798e4bd29fe00fe6600e147':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/3band_44100_mid.json')
-        param_name_auto=str('3band_44100_mid.json')
-    if model_hash == '2ce34bc92fd57f55db16b7a4def3d745':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/3band_44100_mid.json')
-        param_name_auto=str('3band_44100_mid.json')
-    if model_hash == '52fdca89576f06cf4340b74a4730ee5f':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100.json')
-        param_name_auto=str('4band_44100.json')
-    if model_hash == '41191165b05d38fc77f072fa9e8e8a30':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100.json')
-        param_name_auto=str('4band_44100.json')
-    if model_hash == '89e83b511ad474592689e562d5b1f80e':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/2band_32000.json')
-        param_name_auto=str('2band_32000.json')
-    if model_hash == '0b954da81d453b716b114d6d7c95177f':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/2band_32000.json')
-        param_name_auto=str('2band_32000.json')
-
-    #v4 Models    
-    if model_hash == '6a00461c51c2920fd68937d4609ed6c8':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr16000_hl512.json')
-        param_name_auto=str('1band_sr16000_hl512')
-    if model_hash == '0ab504864d20f1bd378fe9c81ef37140':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr32000_hl512.json')
-        param_name_auto=str('1band_sr32000_hl512')
-    if model_hash == '7dd21065bf91c10f7fccb57d7d83b07f':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr32000_hl512.json')
-        param_name_auto=str('1band_sr32000_hl512')
-    if model_hash == '80ab74d65e515caa3622728d2de07d23':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr32000_hl512.json')
-        param_name_auto=str('1band_sr32000_hl512')
-    if model_hash == 'edc115e7fc523245062200c00caa847f':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr33075_hl384.json')
-        param_name_auto=str('1band_sr33075_hl384')
-    if model_hash == '28063e9f6ab5b341c5f6d3c67f2045b7':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr33075_hl384.json')
-        param_name_auto=str('1band_sr33075_hl384')
-    if model_hash == 'b58090534c52cbc3e9b5104bad666ef2':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr44100_hl512.json')
-        param_name_auto=str('1band_sr44100_hl512')
-    if model_hash == '0cdab9947f1b0928705f518f3c78ea8f':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr44100_hl512.json')
-        param_name_auto=str('1band_sr44100_hl512')
-    if model_hash == 'ae702fed0238afb5346db8356fe25f13':  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr44100_hl1024.json')
-        param_name_auto=str('1band_sr44100_hl1024')                        
-    #User Models
-
-    #1 Band
-    if '1band_sr16000_hl512' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr16000_hl512.json')
-        param_name_auto=str('1band_sr16000_hl512')
-    if '1band_sr32000_hl512' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr32000_hl512.json')
-        param_name_auto=str('1band_sr32000_hl512')
-    if '1band_sr33075_hl384' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr33075_hl384.json')
-        param_name_auto=str('1band_sr33075_hl384')
-    if '1band_sr44100_hl256' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr44100_hl256.json')
-        param_name_auto=str('1band_sr44100_hl256')
-    if '1band_sr44100_hl512' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr44100_hl512.json')
-        param_name_auto=str('1band_sr44100_hl512')
-    if '1band_sr44100_hl1024' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/1band_sr44100_hl1024.json')
-        param_name_auto=str('1band_sr44100_hl1024')
-        
-    #2 Band
-    if '2band_44100_lofi' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/2band_44100_lofi.json')
-        param_name_auto=str('2band_44100_lofi')
-    if '2band_32000' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/2band_32000.json')
-        param_name_auto=str('2band_32000')
-    if '2band_48000' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/2band_48000.json')
-        param_name_auto=str('2band_48000')
-        
-    #3 Band   
-    if '3band_44100' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/3band_44100.json')
-        param_name_auto=str('3band_44100')
-    if '3band_44100_mid' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/3band_44100_mid.json')
-        param_name_auto=str('3band_44100_mid')
-    if '3band_44100_msb2' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/3band_44100_msb2.json')
-        param_name_auto=str('3band_44100_msb2')
-        
-    #4 Band    
-    if '4band_44100' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100.json')
-        param_name_auto=str('4band_44100')
-    if '4band_44100_mid' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100_mid.json')
-        param_name_auto=str('4band_44100_mid')
-    if '4band_44100_msb' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100_msb.json')
-        param_name_auto=str('4band_44100_msb')
-    if '4band_44100_msb2' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100_msb2.json')
-        param_name_auto=str('4band_44100_msb2')
-    if '4band_44100_reverse' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100_reverse.json')
-        param_name_auto=str('4band_44100_reverse')
-    if '4band_44100_sw' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_44100_sw.json') 
-        param_name_auto=str('4band_44100_sw')
-    if '4band_v2' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_v2.json')
-        param_name_auto=str('4band_v2')
-    if '4band_v2_sn' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/4band_v2_sn.json')
-        param_name_auto=str('4band_v2_sn')
-    if 'tmodelparam' in ModelName:  
-        model_params_auto=str('uvr5_pack/lib_v5/modelparams/tmodelparam.json')
-        param_name_auto=str('User Model Param Set')
-    return param_name_auto , model_params_auto
+MODELPARAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib_v5', 'modelparams')
+
+# Official UVR weights by md5 -> params set
+MODEL_HASH_PARAMS = {
+    '47939caf0cfe52a0e81442b85b971dfd': '4band_44100',
+    '4e4ecb9764c50a8c414fee6e10395bbe': '4band_v2',
+    'ca106edd563e034bde0bdec4bb7a4b36': '4band_v2',
+    'e60a1e84803ce4efc0a6551206cc4b71': '4band_44100',
+    'a82f14e75892e55e994376edbf0c8435': '4band_44100',
+    '6dd9eaa6f0420af9f1d403aaafa4cc06': '4band_v2_sn',
+    '08611fb99bd59eaa79ad27c58d137727': '4band_v2_sn',
+    '5c7bbca45a187e81abbbd351606164e5': '3band_44100_msb2',
+    'd6b2cb685a058a091e5e7098192d3233': '3band_44100_msb2',
+    'c1b9f38170a7c90e96f027992eb7c62b': '4band_44100',
+    'c3448ec923fa0edf3d03a19e633faa53': '4band_44100',
+    '68aa2c8093d0080704b200d140f59e54': '3band_44100',
+    'fdc83be5b798e4bd29fe00fe6600e147': '3band_44100_mid',
+    '2ce34bc92fd57f55db16b7a4def3d745': '3band_44100_mid',
+    '52fdca89576f06cf4340b74a4730ee5f': '4band_44100',
+    '41191165b05d38fc77f072fa9e8e8a30': '4band_44100',
+    '89e83b511ad474592689e562d5b1f80e': '2band_32000',
+    '0b954da81d453b716b114d6d7c95177f': '2band_32000',
+    # v4 models
+    '6a00461c51c2920fd68937d4609ed6c8': '1band_sr16000_hl512',
+    '0ab504864d20f1bd378fe9c81ef37140': '1band_sr32000_hl512',
+    '7dd21065bf91c10f7fccb57d7d83b07f': '1band_sr32000_hl512',
+    '80ab74d65e515caa3622728d2de07d23': '1band_sr32000_hl512',
+    'edc115e7fc523245062200c00caa847f': '1band_sr33075_hl384',
+    '28063e9f6ab5b341c5f6d3c67f2045b7': '1band_sr33075_hl384',
+    'b58090534c52cbc3e9b5104bad666ef2': '1band_sr44100_hl512',
+    '0cdab9947f1b0928705f518f3c78ea8f': '1band_sr44100_hl512',
+    'ae702fed0238afb5346db8356fe25f13': '1band_sr44100_hl1024',
+}
+
+# User models name their params set in the file name
+USER_PARAM_SETS = [
+    '1band_sr16000_hl512', '1band_sr32000_hl512', '1band_sr33075_hl384',
+    '1band_sr44100_hl256', '1band_sr44100_hl512', '1band_sr44100_hl1024',
+    '2band_44100_lofi', '2band_32000', '2band_48000',
+    '3band_44100', '3band_44100_mid', '3band_44100_msb2',
+    '4band_44100', '4band_44100_mid', '4band_44100_msb', '4band_44100_msb2',
+    '4band_44100_reverse', '4band_44100_sw', '4band_v2', '4band_v2_sn',
+]
+USER_PARAM_FILE = 'tmodelparam'
+
+# Checked in order: an explicit tmodelparam, then the longest set name in the file
+# name, so '4band_44100_msb2' is never shadowed by '4band_44100' or '4band_44100_msb'
+FILENAME_PATTERNS = [(USER_PARAM_FILE, USER_PARAM_FILE, 'User Model Param Set')] + [
+    (pattern, pattern, pattern) for pattern in sorted(USER_PARAM_SETS, key=len, reverse=True)
+]
+
+
+def _params_path(param_set):
+    return os.path.join(MODELPARAMS_DIR, param_set + '.json')
+
+
+def _get_name_params(model_path, model_hash):
+    '''
+    Return (param_name, params json path) for a checkpoint.
+    A params set named in the file name wins over the md5 table, as it always has.
+    '''
+    for pattern, param_set, param_name in FILENAME_PATTERNS:
+        if pattern in model_path:
+            return param_name, _params_path(param_set)
+    param_set = MODEL_HASH_PARAMS.get(model_hash)
+    if param_set is None:
+        raise ValueError('Unknown UVR model {} (md5 {}); name it after its params set, '
+                         'e.g. 4band_v2_mymodel.pth'.format(os.path.basename(model_path), model_hash))
+    return param_set, _params_path(param_set)
@@ -0,0 +1,266 @@
+# server/wav_normalize.py
+"""
+In-place WAV normalization with constant memory.
+
+The data chunk is memory-mapped (``np.memmap`` over the WAV payload) and walked
+in blocks of BLOCK_FRAMES frames: one read pass measures the level, a second
+pass rewrites the samples with the gain applied. Nothing else in the file is
+touched. 16/24/32-bit PCM and 32/64-bit float data are supported, including
+WAVE_FORMAT_EXTENSIBLE headers.
+
+Modes:
+  peak  target_db is the sample peak in dBFS (default -0.1).
+  rms   target_db is the RMS level of all samples in dBFS.
+  lufs  target_db is the integrated loudness in LUFS (ITU-R BS.1770 K-weighting
+        with the -70 LUFS absolute and -10 LU relative gates).
+
+For rms and lufs the gain is capped so the peak does not exceed full scale.
+"""
+
+import math
+import os
+import struct
+from typing import Dict, Optional
+
+import numpy as np
+from scipy.signal import lfilter
+
+BLOCK_FRAMES = 1 << 16
+MODES = ("peak", "rms", "lufs")
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# BS.1770 gating: 400 ms blocks with 75% overlap are built from 100 ms segments
+LUFS_SEGMENT_SECONDS = 0.1
+LUFS_BLOCK_SEGMENTS = 4
+LUFS_ABSOLUTE_GATE = -70.0
+LUFS_RELATIVE_GATE = -10.0
+
+
+class WavLayout:
+    """Sample format and position of a WAV file's data chunk."""
+
+    def __init__(self, format_tag: int, channels: int, sample_rate: int, bits: int, offset: int, frames: int):
+        self.format_tag = format_tag
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.bits = bits
+        self.offset = offset
+        self.frames = frames
+
+    @property
+    def is_float(self) -> bool:
+        return self.format_tag == WAVE_FORMAT_IEEE_FLOAT
+
+    @property
+    def full_scale(self) -> float:
+        """Sample magnitude that corresponds to 0 dBFS."""
+        return 1.0 if self.is_float else float(1 << (self.bits - 1))
+
+
+def read_layout(path: str) -> WavLayout:
+    """Parse the RIFF header of ``path``; raises ValueError for unsupported files."""
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                format_tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    # The real format is the first two bytes of the SubFormat GUID
+                    format_tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, block_align, bits)
+                f.seek(size & 1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path} has a data chunk before its fmt chunk")
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+    format_tag, channels, sample_rate, block_align, bits = fmt
+    supported = {WAVE_FORMAT_PCM: (16, 24, 32), WAVE_FORMAT_IEEE_FLOAT: (32, 64)}
+    if bits not in supported.get(format_tag, ()):
+        raise ValueError(f"Unsupported WAV sample format (format {format_tag}, {bits} bit)")
+    if channels < 1 or block_align != channels * bits // 8:
+        raise ValueError(f"Inconsistent WAV header in {path}")
+    # Streaming writers leave the size at 0 or 0xFFFFFFFF; trust the file instead
+    size = min(size, file_size - offset)
+    return WavLayout(format_tag, channels, sample_rate, bits, offset, size // block_align)
+
+
+def _open(path: str, layout: WavLayout, mode: str = "r"):
+    """Memory-map the data chunk as (frames, channels), or (frames, channels, 3) bytes for 24-bit."""
+    if layout.frames == 0:
+        return None
+    if layout.bits == 24:
+        return np.memmap(path, dtype=np.uint8, mode=mode, offset=layout.offset,
+                         shape=(layout.frames, layout.channels, 3))
+    if layout.is_float:
+        dtype = np.float32 if layout.bits == 32 else np.float64
+    else:
+        dtype = np.int16 if layout.bits == 16 else np.int32
+    return np.memmap(path, dtype=dtype, mode=mode, offset=layout.offset, shape=(layout.frames, layout.channels))
+
+
+def _decode(block: np.ndarray, layout: WavLayout) -> np.ndarray:
+    """Raw samples of a block as floats in the file's own units (full scale = ``layout.full_scale``)."""
+    if layout.bits == 24:
+        b = block.astype(np.int32)
+        v = b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)
+        return ((v ^ 0x800000) - 0x800000).astype(np.float32)
+    # float32 holds 24 bits exactly; 32-bit PCM needs float64
+    return block.astype(np.float64 if layout.bits in (32, 64) else np.float32)
+
+
+def _encode(values: np.ndarray, layout: WavLayout) -> np.ndarray:
+    if layout.is_float:
+        return values
+    lo, hi = -(1 << (layout.bits - 1)), (1 << (layout.bits - 1)) - 1
+    v = np.clip(np.rint(values), lo, hi).astype(np.int32)
+    if layout.bits == 24:
+        return np.stack((v & 0xFF, (v >> 8) & 0xFF, (v >> 16) & 0xFF), axis=-1).astype(np.uint8)
+    return v.astype(np.int16) if layout.bits == 16 else v
+
+
+def k_weighting(sample_rate: int):
+    """BS.1770 pre-filter (high shelf) and RLB high-pass as (b, a) pairs for ``sample_rate``.
+
+    Bilinear designs that reproduce the standard's 48 kHz coefficients exactly
+    and extend them to other rates.
+    """
+    # High shelf, about +4 dB above 1.7 kHz
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / sample_rate)
+    vh = 10 ** (gain_db / 20.0)
+    vb = vh ** 0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    shelf = (
+        np.array([(vh + vb * k / q + k * k) / a0, 2.0 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]),
+        np.array([1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]),
+    )
+    # Second-order high-pass at about 38 Hz
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / sample_rate)
+    a0 = 1.0 + k / q + k * k
+    highpass = (
+        np.array([1.0, -2.0, 1.0]),
+        np.array([1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]),
+    )
+    return shelf, highpass
+
+
+def _gated_loudness(segments: np.ndarray, segment_frames: int) -> float:
+    """Integrated loudness from per-segment sums of K-weighted squares (summed over channels)."""
+    if len(segments) < LUFS_BLOCK_SEGMENTS:
+        # Shorter than one gating block: ungated loudness of what there is
+        total = segments.sum() / max(1, len(segments) * segment_frames)
+        return -0.691 + 10 * math.log10(total) if total > 0 else -math.inf
+    window = np.ones(LUFS_BLOCK_SEGMENTS)
+    z = np.convolve(segments, window, mode="valid") / (LUFS_BLOCK_SEGMENTS * segment_frames)
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(z)
+    gated = z[loudness > LUFS_ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return -math.inf
+    relative = -0.691 + 10 * math.log10(gated.mean()) + LUFS_RELATIVE_GATE
+    gated = z[(loudness > LUFS_ABSOLUTE_GATE) & (loudness > relative)]
+    return -0.691 + 10 * math.log10(gated.mean())
+
+
+def measure(path: str, mode: str = "peak", block_frames: int = BLOCK_FRAMES) -> Dict[str, float]:
+    """Measure a WAV file in one streaming pass.
+
+    Returns ``peak`` (linear, 1.0 = full scale) and, for rms/lufs, ``level``
+    (dBFS or LUFS; ``-inf`` for silence).
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown normalize mode '{mode}' (expected one of {', '.join(MODES)})")
+    layout = read_layout(path)
+    data = _open(path, layout)
+    result = {"peak": 0.0}
+    if data is None:
+        if mode != "peak":
+            result["level"] = -math.inf
+        return result
+
+    scale = layout.full_scale
+    peak = 0.0
+    squares = 0.0
+    segment_frames = max(1, int(round(LUFS_SEGMENT_SECONDS * layout.sample_rate)))
+    if mode == "lufs":
+        # Whole segments per block so gating segments never straddle two blocks
+        block_frames = segment_frames * max(1, block_frames // segment_frames)
+        (shelf_b, shelf_a), (hp_b, hp_a) = k_weighting(layout.sample_rate)
+        shelf_zi = np.zeros((max(len(shelf_a), len(shelf_b)) - 1, layout.channels))
+        hp_zi = np.zeros((max(len(hp_a), len(hp_b)) - 1, layout.channels))
+        segments = []
+
+    for start in range(0, layout.frames, block_frames):
+        x = _decode(data[start:start + block_frames], layout)
+        peak = max(peak, float(np.abs(x).max()) / scale)
+        if mode == "rms":
+            xs = x.astype(np.float64) / scale
+            squares += float(np.einsum("ij,ij->", xs, xs))
+        elif mode == "lufs":
+            xs = x.astype(np.float64) / scale
+            y, shelf_zi = lfilter(shelf_b, shelf_a, xs, axis=0, zi=shelf_zi)
+            y, hp_zi = lfilter(hp_b, hp_a, y, axis=0, zi=hp_zi)
+            n = len(y) // segment_frames * segment_frames
+            if n:
+                # Channel weights are 1.0 for mono/stereo, the only layouts the server writes
+                segments.append((y[:n] ** 2).reshape(-1, segment_frames, layout.channels).sum(axis=(1, 2)))
+    del data
+
+    result["peak"] = peak
+    if mode == "rms":
+        mean = squares / (layout.frames * layout.channels)
+        result["level"] = 10 * math.log10(mean) if mean > 0 else -math.inf
+    elif mode == "lufs":
+        result["level"] = _gated_loudness(np.concatenate(segments) if segments else np.zeros(0), segment_frames)
+    return result
+
+
+def apply_gain(path: str, gain: float, block_frames: int = BLOCK_FRAMES):
+    """Multiply every sample of ``path`` by ``gain`` in place, clipping integer formats."""
+    layout = read_layout(path)
+    data = _open(path, layout, mode="r+")
+    if data is None:
+        return
+    for start in range(0, layout.frames, block_frames):
+        block = data[start:start + block_frames]
+        block[...] = _encode(_decode(block, layout) * gain, layout)
+    data.flush()
+    del data
+
+
+def normalize_wav(path: str, target_db: float = -0.1, mode: str = "peak",
+                  block_frames: int = BLOCK_FRAMES) -> Optional[float]:
+    """Normalize ``path`` in place to ``target_db`` and return the applied gain.
+
+    Returns None (and leaves the file untouched) for silent files. Raises
+    ValueError for unknown modes and unsupported formats.
+    """
+    levels = measure(path, mode, block_frames)
+    peak = levels["peak"]
+    if peak == 0:
+        return None
+    if mode == "peak":
+        gain = 10 ** (target_db / 20.0) / peak
+    else:
+        if not math.isfinite(levels["level"]):
+            return None
+        gain = min(10 ** ((target_db - levels["level"]) / 20.0), 1.0 / peak)
+    apply_gain(path, gain, block_frames)
+    return gain
@@ -0,0 +1,109 @@
+# server/zipstream.py
+"""
+Zip archives generated on the fly from files already on disk.
+
+Archives are produced chunk by chunk while they are sent, instead of copying
+every stem into a staging directory and building the whole archive before the
+first byte goes out. WAV stems barely compress, so entries are stored
+uncompressed by default; ZIP_COMPRESSION=deflate (or ``compression="deflate"``)
+enables deflate. Entry sizes and CRCs follow each entry in data descriptors, as
+written by zipfile for unseekable output.
+"""
+
+import io
+import os
+import zipfile
+from typing import Dict, Iterator, Optional
+
+from fastapi.responses import StreamingResponse
+
+CHUNK_SIZE = 1024 * 1024
+COMPRESSION = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+}
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _compression_name(compression: Optional[str]) -> str:
+    name = (compression or os.environ.get("ZIP_COMPRESSION", "stored")).lower()
+    if name not in COMPRESSION:
+        raise ValueError(f"Unknown zip compression '{name}' (expected stored or deflate)")
+    return name
+
+
+def iter_zip(entries: Dict[str, str], compression: Optional[str] = None,
+             chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a zip archive of ``entries`` ({arcname: path}) in chunks."""
+    method = COMPRESSION[_compression_name(compression)]
+    buf = _StreamBuffer()
+    with zipfile.ZipFile(buf, "w", compression=method) as zf:
+        for arcname, path in entries.items():
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = method
+            with open(path, "rb") as src, zf.open(zinfo, "w") as dest:
+                for chunk in iter(lambda: src.read(chunk_size), b""):
+                    dest.write(chunk)
+                    data = buf.drain()
+                    if data:
+                        yield data
+            data = buf.drain()
+            if data:
+                yield data
+    # Central directory, written when the archive is closed
+    yield buf.drain()
+
+
+def write_zip(entries: Dict[str, str], zip_path: str, compression: Optional[str] = None) -> str:
+    """Write a zip archive of ``entries`` to ``zip_path`` without staging copies."""
+    with open(zip_path, "wb") as f:
+        for chunk in iter_zip(entries, compression):
+            f.write(chunk)
+    return zip_path
+
+
+def dir_entries(root: str) -> Dict[str, str]:
+    """Map every file under ``root`` to its path relative to ``root``, like make_archive."""
+    entries = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            entries[os.path.relpath(path, root)] = path
+    return entries
+
+
+def zip_response(entries: Dict[str, str], filename: str, compression: Optional[str] = None,
+                 headers: Optional[Dict[str, str]] = None, background=None) -> StreamingResponse:
+    """StreamingResponse that sends ``entries`` as ``filename`` while zipping them."""
+    compression = _compression_name(compression)  # fail before the response starts
+    headers = dict(headers or {})
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(
+        iter_zip(entries, compression),
+        media_type="application/zip",
+        headers=headers,
+        background=background,
+    )
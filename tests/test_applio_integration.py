@@ -138,5 +138,116 @@ class TestModelListingAPI:
             assert '@app.get("/applio/models")' in content, "Should have /applio/models endpoint"
             assert 'list_applio_models' in content, "Should have list_applio_models function"
 
+
+class TestApplioStreaming:
+    """Test the streaming multipart proxy to the Applio container"""
+
+    @pytest.fixture
+    def applio_stub(self):
+        """Local HTTP/1.1 server standing in for Applio; echoes the uploaded file back"""
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        seen = {"connections": set(), "bodies": []}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                seen["connections"].add(self.client_address)
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                seen["bodies"].append((self.path, self.headers["Content-Type"], body))
+                boundary = self.headers["Content-Type"].split("boundary=")[1].encode()
+                file_part = [p for p in body.split(b"--" + boundary) if b'name="file"' in p][0]
+                payload = file_part.split(b"\r\n\r\n", 1)[1][:-2]
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}", seen
+        server.shutdown()
+        server.server_close()
+
+    def test_streams_file_and_reuses_connection(self, applio_stub, tmp_path, monkeypatch):
+        import applio_client
+        from rvc_infer import RVCConverter
+
+        url, seen = applio_stub
+        monkeypatch.setenv("APPLIO_SERVER", url)
+        monkeypatch.setattr(applio_client, "CHUNK_SIZE", 4096)
+        monkeypatch.setattr(applio_client, "_clients", {})
+        vocals = tmp_path / "vocals.wav"
+        audio = os.urandom(100_000)
+        vocals.write_bytes(audio)
+
+        converter = RVCConverter()
+        outputs = [
+            converter._process_with_applio(str(vocals), applio_model="voice", pitch_change_all=2.0,
+                                           normalize=False, output_format="wav")
+            for _ in range(2)
+        ]
+
+        for out in outputs:
+            with open(out, "rb") as f:
+                assert f.read() == audio
+        assert len(seen["connections"]) == 1
+        path, content_type, body = seen["bodies"][0]
+        assert path == "/convert"
+        assert b'name="model_name"\r\n\r\nvoice\r\n' in body
+        assert b'name="pitch"\r\n\r\n2\r\n' in body
+
+    def test_encoder_chunks_and_length(self, tmp_path):
+        from applio_client import MultipartEncoder
+
+        vocals = tmp_path / "vocals.wav"
+        vocals.write_bytes(os.urandom(10_000))
+        body = MultipartEncoder({"model_name": "voice"}, {"file": str(vocals)}, chunk_size=1024)
+
+        chunks = list(body)
+        assert max(len(c) for c in chunks) <= 1024
+        assert sum(len(c) for c in chunks) == body.content_length
+
+    def test_error_status_raises(self, tmp_path, monkeypatch):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import applio_client
+        from rvc_infer import RVCConverter
+
+        class Failing(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                body = b'{"error": "model missing"}'
+                self.send_response(500)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Failing)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            monkeypatch.setenv("APPLIO_SERVER", f"http://127.0.0.1:{server.server_address[1]}")
+            monkeypatch.setattr(applio_client, "_clients", {})
+            vocals = tmp_path / "vocals.wav"
+            vocals.write_bytes(b"RIFF")
+            with pytest.raises(RuntimeError, match="status 500.*model missing"):
+                RVCConverter()._process_with_applio(str(vocals), applio_model="voice", normalize=False)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
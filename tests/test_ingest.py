@@ -0,0 +1,100 @@
+"""
+Tests for decode-once audio ingestion
+"""
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import ingest
+import scratch
+from rvc_infer import _ChunkReader, _audio_duration
+
+
+def _write(path, sr=22050, channels=2, seconds=0.5, subtype="PCM_16", fmt=None, seed=0):
+    rng = np.random.default_rng(seed)
+    data = (rng.standard_normal((int(sr * seconds), channels)) * 0.1).astype(np.float32)
+    sf.write(path, data, sr, subtype=subtype, format=fmt)
+    return sf.read(path, dtype="float32", always_2d=True)[0]
+
+
+class TestDecode:
+    """Test conversion to the canonical float32 WAV"""
+
+    @pytest.mark.parametrize("channels", [1, 2])
+    def test_pcm_wav(self, tmp_path, channels):
+        src = str(tmp_path / "in.wav")
+        expected = _write(src, channels=channels)
+        with scratch.ScratchWorkspace(str(tmp_path / "scratch")) as ws:
+            decoded = ingest.decode(src, ws)
+            assert decoded.path != src
+            assert decoded.source == src
+            assert os.path.dirname(decoded.path) == ws.path
+            assert (decoded.samplerate, decoded.channels, decoded.frames) == (22050, channels, len(expected))
+            np.testing.assert_array_equal(decoded.array(), expected)
+
+    def test_flac(self, tmp_path):
+        src = str(tmp_path / "in.flac")
+        expected = _write(src, fmt="FLAC")
+        with scratch.ScratchWorkspace(str(tmp_path / "scratch")) as ws:
+            np.testing.assert_array_equal(ingest.decode(src, ws).array(), expected)
+
+    def test_canonical_input_is_reused(self, tmp_path):
+        src = str(tmp_path / "in.wav")
+        _write(src, subtype="FLOAT")
+        decoded = ingest.decode(src)
+        assert decoded.path == src
+        assert os.listdir(tmp_path) == ["in.wav"]
+
+    def test_memmap_is_read_only(self, tmp_path):
+        src = str(tmp_path / "in.wav")
+        _write(src, subtype="FLOAT")
+        with pytest.raises(ValueError):
+            ingest.open_decoded(src).array()[0, 0] = 1.0
+
+    def test_failure_removes_partial_file(self, tmp_path, monkeypatch):
+        src = str(tmp_path / "broken.mp3")
+        with open(src, "wb") as f:
+            f.write(b"not audio")
+        monkeypatch.setattr(ingest, "_decode_ffmpeg", lambda *a: False)
+        with scratch.ScratchWorkspace(str(tmp_path / "scratch")) as ws:
+            with pytest.raises(Exception):
+                ingest.decode(src, ws)
+            assert os.listdir(ws.path) == []
+
+    def test_env_toggle(self, monkeypatch):
+        monkeypatch.setenv("INGEST_DECODE", "0")
+        assert not ingest.enabled()
+        monkeypatch.setenv("INGEST_DECODE", "1")
+        assert ingest.enabled()
+
+
+class TestReaders:
+    """Test that the separators read the decoded file without decoding again"""
+
+    def test_probe_duration(self, tmp_path):
+        src = str(tmp_path / "in.wav")
+        _write(src, sr=8000, seconds=1.5)
+        assert ingest.probe_duration(src) == pytest.approx(1.5)
+        assert _audio_duration(src) == pytest.approx(1.5)
+
+    def test_chunk_reader_uses_memmap(self, tmp_path):
+        src = str(tmp_path / "in.wav")
+        expected = _write(src, sr=44100, subtype="FLOAT")
+        reader = _ChunkReader(src)
+        assert reader._decoded is not None and reader._file is None
+        np.testing.assert_array_equal(reader.read(1000, 5000, 44100, "polyphase"), expected[1000:6000].T)
+
+    def test_converter_falls_back_to_original(self, tmp_path, monkeypatch):
+        from rvc_infer import RVCConverter
+        src = str(tmp_path / "missing.wav")
+        stats = {}
+        with scratch.ScratchWorkspace(str(tmp_path / "scratch")) as ws:
+            assert RVCConverter._decode_input(src, ws, stats) == src
+            assert os.listdir(ws.path) == []
+        assert "decode" not in stats.get("timings", {})
+        monkeypatch.setenv("INGEST_DECODE", "0")
+        pcm = str(tmp_path / "in.wav")
+        _write(pcm)
+        assert RVCConverter._decode_input(pcm, None, stats) == pcm
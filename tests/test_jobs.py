@@ -0,0 +1,154 @@
+"""
+Tests for the background job manager
+"""
+import os
+import threading
+import time
+
+import pytest
+
+from jobs import DONE, FAILED, JobManager, JobResult
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=4, gpu_concurrency=1, cpu_concurrency=2)
+    yield manager
+    manager.shutdown()
+
+
+class TestJobManager:
+    """Test job execution, progress and stage throttling"""
+
+    def test_job_reports_stages_and_result(self, manager, tmp_path):
+        seen = []
+
+        def work(job):
+            stage = manager.stage_hook(job)
+            for name in ("separate", "rvc", "normalize"):
+                with stage(name):
+                    seen.append((job.stage, job.percent))
+            return JobResult(str(tmp_path / "out.wav"), media_type="audio/wav")
+
+        job = manager.submit("convert", work, ["upload", "separate", "rvc", "normalize"])
+        result = job.future.result(timeout=10)
+
+        assert seen == [("separate", 25.0), ("rvc", 50.0), ("normalize", 75.0)]
+        assert job.status == DONE
+        assert job.percent == 100.0
+        assert result.filename == "out.wav"
+        assert manager.get(job.id) is job
+
+    def test_progress_never_goes_backwards(self, manager):
+        seen = []
+
+        def work(job):
+            stage = manager.stage_hook(job)
+            with stage("applio"):
+                with stage("rvc"):
+                    seen.append((job.stage, job.percent))
+            return JobResult("out.wav")
+
+        job = manager.submit("convert", work, ["upload", "rvc", "applio"])
+        job.future.result(timeout=10)
+        assert seen == [("applio", 200.0 / 3)]
+
+    def test_aliased_stages_report_one_stage(self, manager):
+        seen = []
+        held = []
+
+        def work(job):
+            stage = manager.stage_hook(job)
+            for name in ("rvc", "applio", "normalize"):
+                with stage(name):
+                    held.append(manager._limits["gpu"]._value)
+                    seen.append((job.stage, job.percent))
+            return JobResult("out.wav")
+
+        job = manager.submit("convert", work, ["upload", "rvc+applio"],
+                             aliases={name: "rvc+applio" for name in ("rvc", "applio", "normalize")})
+        job.future.result(timeout=10)
+        assert seen == [("rvc+applio", 50.0)] * 3
+        assert held == [0, 1, 1]
+        assert job.to_dict()["stages"] == ["upload", "rvc+applio"]
+
+    def test_failed_job_records_error(self, manager):
+        def work(job):
+            raise RuntimeError("RVC CLI failed: boom")
+
+        job = manager.submit("convert", work, ["upload", "rvc"])
+        with pytest.raises(RuntimeError):
+            job.future.result(timeout=10)
+        assert job.status == FAILED
+        assert job.to_dict()["error"] == "RVC CLI failed: boom"
+
+    def test_gpu_stages_are_serialized(self, manager):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work(job):
+            with manager.stage_hook(job)("rvc"):
+                with lock:
+                    active.append(job.id)
+                    peak.append(len(active))
+                time.sleep(0.05)
+                with lock:
+                    active.remove(job.id)
+            return JobResult("out.wav")
+
+        jobs = [manager.submit("convert", work, ["rvc"]) for _ in range(4)]
+        for job in jobs:
+            job.future.result(timeout=10)
+        assert max(peak) == 1
+
+    def test_untracked_stages_run_concurrently(self, manager):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def work(job):
+            with manager.stage_hook(job)("applio"):
+                barrier.wait()
+            return JobResult("out.wav")
+
+        jobs = [manager.submit("convert", work, ["applio"]) for _ in range(3)]
+        for job in jobs:
+            job.future.result(timeout=10)
+        assert manager.stats()[DONE] == 3
+
+    def test_finished_jobs_expire(self):
+        manager = JobManager(max_workers=1, ttl=0)
+        try:
+            job = manager.submit("uvr", lambda job: JobResult("out.zip"), ["separate"])
+            job.future.result(timeout=10)
+            time.sleep(0.01)
+            manager.submit("uvr", lambda job: JobResult("out.zip"), ["separate"]).future.result(timeout=10)
+            assert manager.get(job.id) is None
+        finally:
+            manager.shutdown()
+
+    def test_prune_without_submit(self, tmp_path):
+        from scratch import ScratchReaper, ScratchWorkspace
+
+        manager = JobManager(max_workers=1, ttl=0)
+        try:
+            workspace = ScratchWorkspace(str(tmp_path))
+            job = manager.submit("uvr", lambda job: JobResult("out.zip"), ["separate"], workspace)
+            job.future.result(timeout=10)
+            time.sleep(0.01)
+            ScratchReaper(root=str(tmp_path), on_sweep=[manager.prune]).sweep()
+            assert manager.get(job.id) is None
+            assert workspace.closed
+            assert not os.path.exists(workspace.path)
+        finally:
+            manager.shutdown()
+
+    def test_remove(self, manager, tmp_path):
+        from scratch import ScratchWorkspace
+
+        workspace = ScratchWorkspace(str(tmp_path))
+        job = manager.submit("convert", lambda job: JobResult("out.wav"), ["rvc"], workspace)
+        job.future.result(timeout=10)
+        manager.remove(job.id)
+        assert manager.get(job.id) is None
+        assert not os.path.exists(workspace.path)
+        manager.remove(job.id)  # already gone: no-op
@@ -0,0 +1,117 @@
+"""
+Tests for the persistent UVR weights index
+"""
+import hashlib
+import json
+import os
+
+import pytest
+
+from uvr5_pack import model_index as mi
+from uvr5_pack.model_index import ModelIndex, file_md5, nets_module
+
+
+@pytest.fixture
+def weights(tmp_path):
+    path = tmp_path / "2band_32000_custom.pth"
+    path.write_bytes(os.urandom(3 * 1024 + 17))
+    return path
+
+
+class TestFingerprint:
+    """Test streamed hashing and nets selection"""
+
+    def test_streamed_md5_matches_whole_file(self, weights):
+        expected = hashlib.md5(weights.read_bytes()).hexdigest()
+        assert file_md5(str(weights), block_size=1000) == expected
+
+    @pytest.mark.parametrize("kb,module", [
+        (31191, "uvr5_pack.lib_v5.nets"),
+        (33966, "uvr5_pack.lib_v5.nets_33966KB"),
+        (123821, "uvr5_pack.lib_v5.nets_123821KB"),
+        (537238, "uvr5_pack.lib_v5.nets_537238KB"),
+        (600000, "uvr5_pack.lib_v5.nets_537238KB"),
+    ])
+    def test_nets_module_by_size(self, kb, module):
+        assert nets_module(kb * 1024) == module
+
+
+class TestModelIndex:
+    """Test resolutions are persisted and reused"""
+
+    def test_first_resolve_writes_sidecar(self, weights):
+        index = ModelIndex()
+        info = index.resolve(str(weights))
+
+        assert info["md5"] == hashlib.md5(weights.read_bytes()).hexdigest()
+        assert info["params"].endswith("2band_32000.json")
+        assert info["nets"] == "uvr5_pack.lib_v5.nets"
+        with open(weights.parent / mi.INDEX_NAME) as f:
+            assert json.load(f)[os.path.realpath(weights)]["md5"] == info["md5"]
+        assert index.misses == 1
+
+    def test_later_resolves_skip_hashing(self, weights, monkeypatch):
+        ModelIndex().resolve(str(weights))
+
+        def fail(*args, **kwargs):
+            raise AssertionError("weights were hashed again")
+        monkeypatch.setattr(mi, "file_md5", fail)
+
+        # A fresh index (new process) reads the sidecar instead of the weights
+        index = ModelIndex()
+        assert index.resolve(str(weights))["params"].endswith("2band_32000.json")
+        assert index.hits == 1
+
+    def test_changed_weights_are_rehashed(self, weights):
+        index = ModelIndex()
+        first = index.resolve(str(weights))
+
+        weights.write_bytes(os.urandom(5000))
+        os.utime(weights, ns=(1, 1))
+        second = index.resolve(str(weights))
+        assert second["md5"] != first["md5"]
+        assert index.misses == 2
+
+    def test_index_location_override(self, weights, tmp_path, monkeypatch):
+        target = tmp_path / "elsewhere" / "index.json"
+        target.parent.mkdir()
+        monkeypatch.setenv("UVR_MODEL_INDEX", str(target))
+
+        ModelIndex().resolve(str(weights))
+        assert target.exists()
+        assert not (weights.parent / mi.INDEX_NAME).exists()
+
+    def test_unwritable_index_still_resolves(self, weights, tmp_path, monkeypatch):
+        monkeypatch.setenv("UVR_MODEL_INDEX", str(tmp_path / "missing" / "index.json"))
+        index = ModelIndex()
+        assert index.resolve(str(weights))["md5"]
+        assert index.resolve(str(weights))["md5"]
+        assert index.hits == 1
+
+    def test_sidecar_stores_param_set_not_path(self, weights, monkeypatch):
+        ModelIndex().resolve(str(weights))
+        with open(weights.parent / mi.INDEX_NAME) as f:
+            entry = json.load(f)[os.path.realpath(weights)]
+        assert entry["param_set"] == "2band_32000"
+        assert "params" not in entry
+
+        # A moved checkout rebuilds the path from the current modelparams directory
+        from uvr5_pack import utils
+        monkeypatch.setattr(utils, "MODELPARAMS_DIR", "/moved/modelparams")
+        info = ModelIndex().resolve(str(weights))
+        assert info["params"] == os.path.join("/moved/modelparams", "2band_32000.json")
+
+    def test_legacy_entry_with_absolute_path_is_re_resolved(self, weights):
+        st = os.stat(weights)
+        legacy = {os.path.realpath(weights): {
+            "size": st.st_size, "mtime_ns": st.st_mtime_ns, "md5": "0" * 32,
+            "nets": "uvr5_pack.lib_v5.nets", "param_name": "2band_32000",
+            "params": "/old/checkout/modelparams/2band_32000.json",
+        }}
+        with open(weights.parent / mi.INDEX_NAME, "w") as f:
+            json.dump(legacy, f)
+
+        index = ModelIndex()
+        info = index.resolve(str(weights))
+        assert not info["params"].startswith("/old/")
+        assert index.misses == 1
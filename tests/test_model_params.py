@@ -0,0 +1,73 @@
+"""
+Tests for table-driven UVR model parameter resolution
+"""
+import json
+import os
+
+import pytest
+
+from uvr5_pack import utils
+from uvr5_pack.lib_v5 import model_param_init
+from uvr5_pack.lib_v5.model_param_init import ModelParameters, get_model_params
+from uvr5_pack.utils import MODEL_HASH_PARAMS, USER_PARAM_SETS, _get_name_params
+
+
+class TestNameParams:
+    """Test md5 and file name lookups"""
+
+    @pytest.mark.parametrize("model_hash,param_set", sorted(MODEL_HASH_PARAMS.items()))
+    def test_known_hashes(self, model_hash, param_set):
+        name, path = _get_name_params("/uvr5_weights/model.pth", model_hash)
+        assert name == param_set
+        assert os.path.basename(path) == param_set + ".json"
+        assert os.path.isfile(path)
+
+    @pytest.mark.parametrize("param_set", USER_PARAM_SETS)
+    def test_param_set_in_file_name(self, param_set):
+        name, path = _get_name_params(f"/uvr5_weights/{param_set}_custom.pth", None)
+        assert name == param_set
+        assert os.path.isfile(path)
+
+    def test_longest_pattern_wins(self):
+        assert _get_name_params("/w/4band_44100_msb2_x.pth", None)[0] == "4band_44100_msb2"
+        assert _get_name_params("/w/3band_44100_mid_x.pth", None)[0] == "3band_44100_mid"
+        assert _get_name_params("/w/4band_v2_sn_x.pth", None)[0] == "4band_v2_sn"
+
+    def test_file_name_overrides_hash(self):
+        model_hash = "47939caf0cfe52a0e81442b85b971dfd"  # 4band_44100
+        assert _get_name_params("/w/2band_48000_x.pth", model_hash)[0] == "2band_48000"
+
+    def test_user_param_file(self):
+        name, path = _get_name_params("/w/4band_44100_tmodelparam.pth", None)
+        assert name == "User Model Param Set"
+        assert path.endswith("tmodelparam.json")
+
+    def test_unknown_model(self):
+        with pytest.raises(ValueError, match="Unknown UVR model"):
+            _get_name_params("/w/mystery.pth", "0" * 32)
+
+    def test_resolves_outside_server_directory(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        _, path = _get_name_params("/w/model.pth", "b58090534c52cbc3e9b5104bad666ef2")
+        assert os.path.isabs(path) and os.path.isfile(path)
+
+
+class TestModelParamsCache:
+    """Test params JSON is parsed once per file"""
+
+    def test_memoized(self, monkeypatch):
+        path = os.path.join(utils.MODELPARAMS_DIR, "4band_v2.json")
+        model_param_init._load_model_params.cache_clear()
+        first = get_model_params(path)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("params were parsed again")
+        monkeypatch.setattr(model_param_init.json, "loads", fail)
+        assert get_model_params(path) is first
+        assert get_model_params(os.path.join(utils.MODELPARAMS_DIR, ".", "4band_v2.json")) is first
+
+    def test_matches_fresh_parse(self):
+        path = os.path.join(utils.MODELPARAMS_DIR, "3band_44100_msb2.json")
+        assert get_model_params(path).param == ModelParameters(path).param
+        with open(path) as f:
+            assert get_model_params(path).param["bins"] == json.load(f)["bins"]
@@ -0,0 +1,105 @@
+"""
+Tests for the cached polyphase resampler
+"""
+import glob
+import json
+import os
+
+import librosa
+import numpy as np
+import pytest
+import soundfile as sf
+
+from rvc_infer import _ChunkReader
+from uvr5_pack.lib_v5 import resample as rs
+
+MODELPARAMS = os.path.join(os.path.dirname(__file__), "..", "server", "uvr5_pack", "lib_v5", "modelparams")
+RATES = [(44100, 7350), (44100, 14700), (7350, 14700), (14700, 44100), (48000, 44100)]
+
+
+def _wave(sr, seconds=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((2, int(seconds * sr))) * 0.1).astype(np.float32)
+
+
+def _snr(reference, estimate):
+    return 10 * np.log10(np.sum(reference ** 2) / np.sum((reference - estimate) ** 2))
+
+
+class TestResample:
+    """Test one-shot resampling against librosa"""
+
+    @pytest.mark.parametrize("rates", RATES)
+    def test_polyphase_matches_librosa(self, rates):
+        wave = _wave(rates[0])
+        expected = librosa.resample(wave, orig_sr=rates[0], target_sr=rates[1], res_type="polyphase")
+        actual = rs.resample(wave, rates[0], rates[1], "polyphase")
+        assert actual.dtype == expected.dtype
+        np.testing.assert_array_equal(actual, expected)
+
+    @pytest.mark.parametrize("res_type", ["kaiser_fast", "sinc_fastest", "sinc_medium", "sinc_best", "scipy"])
+    def test_mapped_quality_in_band(self, res_type):
+        sr_in, sr_out = 7350, 14700
+        t = np.arange(sr_in * 2) / sr_in
+        wave = np.stack([np.sin(2 * np.pi * 440 * t), np.sin(2 * np.pi * 1500 * t + 1)]).astype(np.float32)
+        expected = librosa.resample(wave, orig_sr=sr_in, target_sr=sr_out, res_type=res_type)
+        actual = rs.resample(wave, sr_in, sr_out, res_type)
+        assert actual.shape == expected.shape
+        inner = slice(2000, -2000)
+        assert _snr(expected[:, inner], actual[:, inner]) > 70
+
+    def test_identity_is_skipped(self):
+        wave = _wave(44100)
+        assert rs.resample(wave, 44100, 44100, "sinc_best") is wave
+
+    def test_kernels_are_cached(self):
+        assert rs.kernel(44100, 7350, "best", "float32") is rs.kernel(44100, 7350, "best", "float32")
+        with pytest.raises(ValueError):
+            rs.kernel(44100, 7350, "best", "float32")[0] = 1.0
+
+    def test_unmapped_res_type_falls_back(self):
+        wave = _wave(16000, seconds=0.2)
+        expected = librosa.resample(wave, orig_sr=16000, target_sr=8000, res_type="fft")
+        np.testing.assert_array_equal(rs.resample(wave, 16000, 8000, "fft"), expected)
+
+    def test_modelparams_res_types_are_mapped(self):
+        for path in glob.glob(os.path.join(MODELPARAMS, "*.json")):
+            with open(path) as f:
+                bands = json.load(f)["band"].values()
+            for bp in bands:
+                assert rs.quality_for(bp["res_type"]), (path, bp["res_type"])
+
+
+class TestStreamingResampler:
+    """Test block-wise resampling reproduces the one-shot output"""
+
+    @pytest.mark.parametrize("rates", RATES)
+    @pytest.mark.parametrize("res_type", ["polyphase", "kaiser_fast", "sinc_best"])
+    def test_matches_one_shot(self, rates, res_type):
+        wave = _wave(rates[0], seconds=0.7)
+        stream = rs.StreamingResampler(rates[0], rates[1], res_type)
+        rng = np.random.default_rng(1)
+        parts, i = [], 0
+        while i < wave.shape[1]:
+            n = int(rng.integers(1, 5000))
+            parts.append(stream.process(wave[:, i:i + n]))
+            i += n
+        parts.append(stream.flush())
+        np.testing.assert_array_equal(np.concatenate(parts, axis=1), rs.resample(wave, rates[0], rates[1], res_type))
+
+    def test_rejects_unmapped_res_type(self):
+        with pytest.raises(ValueError):
+            rs.StreamingResampler(44100, 22050, "fft")
+
+    def test_chunk_reader_matches_whole_file(self, tmp_path):
+        path = str(tmp_path / "in.wav")
+        wave = _wave(48000, seconds=2.0)
+        sf.write(path, wave.T, 48000, subtype="FLOAT")
+        expected = rs.resample(wave, 48000, 44100, "kaiser_fast")
+
+        reader = _ChunkReader(path)
+        chunk, step = 30000, 22000
+        for start in range(0, expected.shape[1], step):
+            got = reader.read(start, chunk, 44100, "kaiser_fast")
+            want = expected[:, start:start + chunk]
+            np.testing.assert_allclose(got[:, :want.shape[1]], want, atol=1e-6)
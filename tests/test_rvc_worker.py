@@ -0,0 +1,101 @@
+"""
+Tests for the persistent RVC worker pool
+"""
+import textwrap
+
+import pytest
+
+from rvc_worker import RVCWorkerPool
+
+
+FAKE_CLI = textwrap.dedent('''
+    import argparse
+    import os
+    import sys
+
+    # Counts how many jobs this interpreter has executed
+    state = sys.modules.setdefault("fake_rvc_state", type(sys)("fake_rvc_state"))
+    state.jobs = getattr(state, "jobs", 0) + 1
+
+    p = argparse.ArgumentParser()
+    p.add_argument("--input")
+    p.add_argument("--output")
+    p.add_argument("--transpose", default="0")
+    args = p.parse_args()
+
+    print("converting", args.input)  # must not corrupt the worker protocol
+    if args.transpose == "fail":
+        sys.exit("bad transpose")
+    with open(args.output, "w") as f:
+        f.write(f"{os.getpid()} {state.jobs} {args.transpose}")
+''')
+
+
+@pytest.fixture
+def fake_cli(tmp_path):
+    path = tmp_path / "infer_cli.py"
+    path.write_text(FAKE_CLI)
+    return str(path)
+
+
+@pytest.fixture
+def pool(fake_cli):
+    pool = RVCWorkerPool(fake_cli, size=1, python="python")
+    yield pool
+    pool.close()
+
+
+class TestRVCWorkerPool:
+    """Test warm workers executing RVC CLI jobs"""
+
+    def test_jobs_run_in_same_warm_process(self, pool, tmp_path):
+        """Consecutive jobs reuse one interpreter instead of spawning per job"""
+        outputs = []
+        for i in range(3):
+            out = tmp_path / f"out{i}.wav"
+            pool.run(["--input", "in.wav", "--output", str(out), "--transpose", str(i)], timeout=30)
+            outputs.append(out.read_text().split())
+
+        pids = {pid for pid, _, _ in outputs}
+        assert len(pids) == 1
+        assert [int(jobs) for _, jobs, _ in outputs] == [1, 2, 3]
+        assert [t for _, _, t in outputs] == ["0", "1", "2"]
+
+    def test_failed_job_raises_and_worker_survives(self, pool, tmp_path):
+        """A CLI error is reported without killing the worker"""
+        with pytest.raises(RuntimeError, match="bad transpose"):
+            pool.run(["--input", "in.wav", "--output", str(tmp_path / "x.wav"), "--transpose", "fail"], timeout=30)
+
+        out = tmp_path / "ok.wav"
+        pool.run(["--input", "in.wav", "--output", str(out)], timeout=30)
+        assert out.exists()
+
+    def test_converter_uses_worker_pool(self, fake_cli, tmp_path, monkeypatch):
+        """RVCConverter routes CLI commands through the shared pool"""
+        import rvc_worker
+        from rvc_infer import RVCConverter
+
+        monkeypatch.setenv("RVC_WORKERS", "1")
+        monkeypatch.setattr(rvc_worker, "_pools", {})
+        out = tmp_path / "rvc_out.wav"
+        converter = RVCConverter()
+        try:
+            converter._run_rvc(["python", fake_cli, "--input", "in.wav", "--output", str(out)])
+            assert out.exists()
+            assert fake_cli in rvc_worker._pools
+        finally:
+            for p in rvc_worker._pools.values():
+                p.close()
+
+    def test_pool_is_opt_in(self, monkeypatch):
+        """RVC_WORKERS defaults to one subprocess per job; auto follows JOBS_GPU_CONCURRENCY"""
+        import rvc_worker
+
+        monkeypatch.setattr(rvc_worker, "_pools", {})
+        monkeypatch.delenv("RVC_WORKERS", raising=False)
+        assert rvc_worker.get_pool("/rvc/infer_cli.py") is None
+
+        monkeypatch.setattr(rvc_worker, "RVCWorkerPool", lambda cli_path, size: size)
+        monkeypatch.setenv("RVC_WORKERS", "auto")
+        monkeypatch.setenv("JOBS_GPU_CONCURRENCY", "3")
+        assert rvc_worker.get_pool("/rvc/infer_cli.py") == 3
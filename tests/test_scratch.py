@@ -0,0 +1,107 @@
+"""
+Tests for per-request scratch workspaces and the scratch reaper
+"""
+import os
+import time
+
+import pytest
+
+import scratch
+from scratch import ScratchReaper, ScratchWorkspace
+
+
+def _make_entry(root, name, size, age):
+    path = root / name
+    path.mkdir()
+    (path / "data.bin").write_bytes(b"x" * size)
+    then = time.time() - age
+    os.utime(path, (then, then))
+    return path
+
+
+class TestScratchWorkspace:
+    """Test workspaces own and remove their files"""
+
+    def test_cleanup_removes_everything(self, tmp_path):
+        ws = ScratchWorkspace(root=str(tmp_path))
+        sub = ws.mkdtemp("uvr_")
+        path = ws.mkstemp(suffix=".zip")
+        assert os.path.dirname(sub) == ws.path
+        assert os.path.dirname(path) == ws.path and path.endswith(".zip")
+
+        ws.cleanup()
+        ws.cleanup()
+        assert not os.path.exists(ws.path)
+        assert ws.closed
+
+    def test_context_manager(self, tmp_path):
+        with ScratchWorkspace(root=str(tmp_path)) as ws:
+            assert os.path.isdir(ws.path)
+        assert not os.path.exists(ws.path)
+
+    def test_module_helpers_fall_back_to_scratch_root(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SCRATCH_DIR", str(tmp_path / "scratch"))
+        d = scratch.mkdtemp(prefix="demucs_")
+        f = scratch.mkstemp(suffix=".zip")
+        assert os.path.dirname(d) == str(tmp_path / "scratch")
+        assert os.path.dirname(f) == str(tmp_path / "scratch")
+
+        with ScratchWorkspace() as ws:
+            assert os.path.dirname(scratch.mkdtemp(ws, "rvc_")) == ws.path
+
+
+class TestScratchReaper:
+    """Test age and size quotas on the scratch root"""
+
+    def test_reaps_expired_entries(self, tmp_path):
+        old = _make_entry(tmp_path, "old", 10, age=7200)
+        new = _make_entry(tmp_path, "new", 10, age=10)
+        reaper = ScratchReaper(root=str(tmp_path), max_age=3600, max_bytes=0, interval=60)
+
+        stats = reaper.sweep()
+        assert not old.exists()
+        assert new.exists()
+        assert stats["reaped"] == 1
+        assert stats["entries"] == 1
+
+    def test_size_quota_removes_oldest_first(self, tmp_path):
+        oldest = _make_entry(tmp_path, "a", 1000, age=900)
+        middle = _make_entry(tmp_path, "b", 1000, age=600)
+        newest = _make_entry(tmp_path, "c", 1000, age=300)
+        reaper = ScratchReaper(root=str(tmp_path), max_age=3600, max_bytes=2000, interval=60)
+
+        reaper.sweep()
+        assert not oldest.exists()
+        assert middle.exists() and newest.exists()
+        assert reaper.reaped_bytes == 1000
+
+    def test_size_quota_spares_recent_entries(self, tmp_path):
+        recent = _make_entry(tmp_path, "recent", 5000, age=1)
+        reaper = ScratchReaper(root=str(tmp_path), max_age=3600, max_bytes=100, interval=60)
+
+        reaper.sweep()
+        assert recent.exists()
+
+    def test_live_workspace_is_never_reaped(self, tmp_path):
+        ws = ScratchWorkspace(root=str(tmp_path))
+        try:
+            then = time.time() - 7200
+            os.utime(ws.path, (then, then))
+            reaper = ScratchReaper(root=str(tmp_path), max_age=3600, max_bytes=0, interval=60)
+            reaper.sweep()
+            assert os.path.isdir(ws.path)
+        finally:
+            ws.cleanup()
+
+    def test_env_defaults(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SCRATCH_DIR", str(tmp_path))
+        monkeypatch.setenv("SCRATCH_MAX_AGE_SECONDS", "120")
+        monkeypatch.setenv("SCRATCH_MAX_MB", "1")
+        reaper = ScratchReaper()
+        assert reaper.root == str(tmp_path)
+        assert reaper.max_age == pytest.approx(120)
+        assert reaper.max_bytes == 1024 * 1024
+
+    def test_missing_root(self, tmp_path):
+        reaper = ScratchReaper(root=str(tmp_path / "missing"), max_age=60, max_bytes=0, interval=60)
+        assert reaper.sweep()["entries"] == 0
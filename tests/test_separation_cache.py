@@ -0,0 +1,94 @@
+"""
+Tests for the content-addressed separation cache
+"""
+import os
+import time
+
+import scratch
+from separation_cache import SeparationCache
+
+
+def _write(path, size):
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return str(path)
+
+
+class TestSeparationCache:
+    """Test keying and size-bounded LRU eviction"""
+
+    def test_key_depends_on_audio_and_settings(self, tmp_path):
+        cache = SeparationCache(root=str(tmp_path / "cache"), max_bytes=1024)
+        a = _write(tmp_path / "a.wav", 64)
+        b = _write(tmp_path / "b.wav", 64)
+
+        assert cache.key(a, separator="demucs", stem="vocals") == cache.key(a, stem="vocals", separator="demucs")
+        assert cache.key(a, separator="demucs", stem="vocals") != cache.key(b, separator="demucs", stem="vocals")
+        assert cache.key(a, separator="demucs", stem="vocals") != cache.key(a, separator="uvr", stem="vocals")
+
+    def test_shared_source_is_stored_once(self, tmp_path):
+        cache = SeparationCache(root=str(tmp_path / "cache"), max_bytes=1024)
+        vocals = _write(tmp_path / "vocals.wav", 100)
+
+        stored = cache.put("k", {"stem": vocals, "vocals": vocals})
+
+        assert stored["stem"] == stored["vocals"]
+        assert cache.stats()["bytes"] == 100
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = SeparationCache(root=str(tmp_path / "cache"), max_bytes=250)
+        for key in ("a", "b"):
+            cache.put(key, {"stem": _write(tmp_path / f"{key}.wav", 100)})
+            time.sleep(0.01)
+        assert cache.get("a") is not None  # a is now more recent than b
+        time.sleep(0.01)
+
+        cache.put("c", {"stem": _write(tmp_path / "c.wav", 100)})
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["entries"] == 2
+
+    def test_disabled_when_budget_is_zero(self, tmp_path):
+        assert not SeparationCache(root=str(tmp_path), max_bytes=0).enabled
+
+    def test_hit_survives_eviction(self, tmp_path):
+        cache = SeparationCache(root=str(tmp_path / "cache"), max_bytes=1024)
+        vocals = _write(tmp_path / "vocals.wav", 100)
+        with open(vocals, "rb") as f:
+            expected = f.read()
+        cache.put("k", {"stem": vocals, "vocals": vocals})
+
+        with scratch.ScratchWorkspace(str(tmp_path / "scratch")) as ws:
+            hit = cache.get("k", ws)
+            assert hit["stem"] == hit["vocals"]
+            assert hit["stem"].startswith(ws.path + os.sep)
+
+            # A concurrent request's put() evicts the entry while this one still reads it
+            cache.max_bytes = 0
+            cache.evict()
+            assert cache.get("k") is None
+
+            with open(hit["stem"], "rb") as f:
+                assert f.read() == expected
+
+    def test_stale_staging_is_swept(self, tmp_path):
+        root = tmp_path / "cache"
+        stale = root / ".staging-dead"
+        fresh = root / ".staging-live"
+        for path in (stale, fresh):
+            path.mkdir(parents=True)
+            _write(path / "vocals.wav", 100)
+        old = time.time() - scratch.MIN_REAP_AGE_SECONDS - 10
+        os.utime(stale, (old, old))
+
+        cache = SeparationCache(root=str(root), max_bytes=1024)
+        assert not stale.exists()
+        # A put() still in progress is left alone
+        assert fresh.exists()
+
+        os.utime(fresh, (old, old))
+        cache.put("k", {"stem": _write(tmp_path / "a.wav", 100)})
+        assert not fresh.exists()
+        assert cache.stats()["entries"] == 1
@@ -0,0 +1,124 @@
+"""
+Tests for the vectorized spectrogram filters in spec_utils
+"""
+import math
+import os
+
+import numpy as np
+import pytest
+
+from uvr5_pack.lib_v5 import spec_utils
+from uvr5_pack.lib_v5.model_param_init import ModelParameters
+
+MODELPARAMS = os.path.join(os.path.dirname(__file__), "..", "server", "uvr5_pack", "lib_v5", "modelparams")
+
+
+def _legacy_lp(spec, bin_start, bin_stop):
+    g = 1.0
+    for b in range(bin_start, bin_stop):
+        g -= 1 / (bin_stop - bin_start)
+        spec[:, b, :] = g * spec[:, b, :]
+    spec[:, bin_stop:, :] *= 0
+    return spec
+
+
+def _legacy_hp(spec, bin_start, bin_stop):
+    g = 1.0
+    for b in range(bin_start, bin_stop, -1):
+        g -= 1 / (bin_start - bin_stop)
+        spec[:, b, :] = g * spec[:, b, :]
+    spec[:, 0:bin_stop + 1, :] *= 0
+    return spec
+
+
+def _legacy_pre_filter(spec, start, stop):
+    gp = 1
+    for b in range(start + 1, stop):
+        g = math.pow(10, -(b - start) * (3.5 - gp) / 20.0)
+        gp = g
+        spec[:, b, :] *= g
+    return spec
+
+
+def _spec(n_bins, dtype, frames=50):
+    rng = np.random.default_rng(0)
+    shape = (2, n_bins, frames)
+    return (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(dtype)
+
+
+@pytest.mark.parametrize("dtype", [np.complex64, np.complex128])
+class TestFilterEquivalence:
+    """The vectorized filters must reproduce the per-bin loops exactly"""
+
+    @pytest.mark.parametrize("start,stop", [(80, 120), (0, 33), (300, 481), (10, 10)])
+    def test_lp_filter(self, dtype, start, stop):
+        spec = _spec(481, dtype)
+        expected = _legacy_lp(spec.copy(), start, stop)
+        result = spec_utils.fft_lp_filter(spec, start, stop)
+        assert result is spec
+        assert result.dtype == dtype
+        np.testing.assert_array_equal(result, expected)
+
+    @pytest.mark.parametrize("start,stop", [(120, 80), (5, 0), (480, 300)])
+    def test_hp_filter(self, dtype, start, stop):
+        spec = _spec(481, dtype)
+        expected = _legacy_hp(spec.copy(), start, stop)
+        result = spec_utils.fft_hp_filter(spec, start, stop)
+        assert result.dtype == dtype
+        np.testing.assert_array_equal(result, expected)
+
+    def test_combine_spectrograms_pre_filter(self, dtype):
+        mp = ModelParameters(os.path.join(MODELPARAMS, "4band_v2.json"))
+        specs = {
+            d: _spec(bp["n_fft"] // 2 + 1, dtype, frames=40)
+            for d, bp in mp.param["band"].items()
+        }
+        result = spec_utils.combine_spectrograms(specs, mp)
+
+        # Reference: combine without the pre-filter, then apply the legacy ramp
+        start = mp.param["pre_filter_start"]
+        mp.param["pre_filter_start"] = 0
+        try:
+            expected = spec_utils.combine_spectrograms(specs, mp)
+        finally:
+            mp.param["pre_filter_start"] = start
+        expected = _legacy_pre_filter(expected, start, mp.param["pre_filter_stop"])
+        np.testing.assert_array_equal(result, expected)
+
+
+class TestTrigFreeMask:
+    """with_phase_of must match mag * exp(1j * angle(spec)) and keep complex64"""
+
+    def test_matches_angle_exp(self):
+        spec = _spec(257, np.complex64)
+        spec[:, 10, :5] = 0
+        mag = np.abs(_spec(257, np.complex64)).astype(np.float32)
+        expected = mag * np.exp(1.j * np.angle(spec))
+        result = spec_utils.with_phase_of(mag, spec)
+        assert result.dtype == np.complex64
+        np.testing.assert_allclose(result, expected, rtol=1e-6, atol=1e-6)
+        np.testing.assert_array_equal(result[:, 10, :5], mag[:, 10, :5])
+
+    def test_reduce_vocal_aggressively(self):
+        X, y = _spec(129, np.complex64), _spec(129, np.complex64) * 0.5
+        v = X - y
+        y_mag = np.clip(np.abs(y) - np.abs(v) * (np.abs(v) > np.abs(y)) * 0.3, 0, np.inf)
+        result = spec_utils.reduce_vocal_aggressively(X, y, 0.3)
+        assert result.dtype == np.complex64
+        np.testing.assert_allclose(result, y_mag * np.exp(1.j * np.angle(y)), rtol=1e-5, atol=1e-6)
+
+    def test_mirroring_keeps_dtype(self):
+        mp = ModelParameters(os.path.join(MODELPARAMS, "4band_v2.json"))
+        spec_m = _spec(mp.param["bins"] + 1, np.complex64)
+        high_end = _spec(40, np.complex64)
+        for mode in ("mirroring", "mirroring2"):
+            assert spec_utils.mirroring(mode, spec_m, high_end, mp).dtype == np.complex64
+
+    def test_cmb_spectrogram_to_wave_precision(self):
+        mp = ModelParameters(os.path.join(MODELPARAMS, "4band_v2.json"))
+        spec_m = _spec(mp.param["bins"] + 1, np.complex64, frames=32) * 0.01
+        wave = spec_utils.cmb_spectrogram_to_wave(spec_m, mp)
+        reference = spec_utils.cmb_spectrogram_to_wave(spec_m.astype(np.complex128), mp)
+        assert wave.dtype == np.float32
+        assert reference.dtype == np.float64
+        np.testing.assert_allclose(wave, reference, atol=1e-6)
@@ -0,0 +1,91 @@
+"""
+Tests for the librosa and torch STFT backends of spec_utils
+"""
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from uvr5_pack.lib_v5 import spec_utils, stft_backend
+from uvr5_pack.lib_v5.model_param_init import ModelParameters
+
+MODELPARAMS = os.path.join(os.path.dirname(__file__), "..", "server", "uvr5_pack", "lib_v5", "modelparams")
+PARAMS = sorted(os.path.basename(p) for p in glob.glob(os.path.join(MODELPARAMS, "*.json")))
+
+
+@pytest.fixture
+def backend():
+    """Restore the process backend after each test."""
+    yield stft_backend
+    stft_backend.set_backend(None)
+
+
+def _wave(sr, seconds=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((2, int(seconds * sr))) * 0.1).astype(np.float32)
+
+
+class TestTorchBackend:
+    """Test the torch backend against librosa"""
+
+    @pytest.mark.parametrize("params", PARAMS)
+    def test_parity(self, backend, params):
+        mp = ModelParameters(os.path.join(MODELPARAMS, params))
+        wave = _wave(mp.param['sr'])
+
+        backend.set_backend('librosa')
+        expected = spec_utils.wave_to_spectrogram_bands(wave, mp)
+        spec_m = spec_utils.combine_spectrograms(expected, mp)
+        expected_wave = spec_utils.cmb_spectrogram_to_wave(spec_m, mp)
+
+        backend.set_backend('torch')
+        actual = spec_utils.wave_to_spectrogram_bands(wave, mp)
+        actual_wave = spec_utils.cmb_spectrogram_to_wave(spec_m, mp)
+
+        for d in expected:
+            assert actual[d].dtype == expected[d].dtype
+            assert actual[d].shape == expected[d].shape
+            assert np.abs(actual[d] - expected[d]).max() < 1e-4
+        assert actual_wave.shape == expected_wave.shape
+        assert np.abs(actual_wave - expected_wave).max() < 1e-6
+
+    def test_round_trip_functions(self, backend):
+        wave = _wave(44100, seconds=0.2)
+        backend.set_backend('torch')
+        spec = spec_utils.stft(wave, 1024, 256)
+        assert spec.shape == (2, 513, wave.shape[1] // 256 + 1)
+        restored = spec_utils.istft(spec, 256)
+        n = restored.shape[1]
+        np.testing.assert_allclose(restored, wave[:, :n], atol=1e-5)
+
+    def test_equal_bands_share_one_call(self, backend, monkeypatch):
+        torch_backend = stft_backend.TorchBackend()
+        calls = []
+        stft = torch_backend.stft
+        monkeypatch.setattr(torch_backend, "stft", lambda waves, *a: calls.append(len(waves)) or stft(waves, *a))
+        waves = [_wave(8000, seed=i) for i in range(3)]
+        specs = torch_backend.stft_bands([(waves[0], 512, 128), (waves[1], 512, 128), (waves[2], 256, 128)])
+        assert sorted(calls) == [2, 4]
+        for w, s, n_fft in zip(waves, specs, (512, 512, 256)):
+            np.testing.assert_array_equal(s, torch_backend.stft(w, n_fft, 128))
+
+    def test_windows_are_cached(self):
+        import torch
+        assert stft_backend._window(512, torch.float32) is stft_backend._window(512, torch.float32)
+
+
+class TestBackendSelection:
+    """Test UVR_STFT_BACKEND handling"""
+
+    def test_default_and_env(self, backend, monkeypatch):
+        monkeypatch.delenv('UVR_STFT_BACKEND', raising=False)
+        backend.set_backend(None)
+        assert backend.get_backend().name == 'librosa'
+        monkeypatch.setenv('UVR_STFT_BACKEND', 'torch')
+        backend.set_backend(None)
+        assert backend.get_backend().name == 'torch'
+
+    def test_unknown_backend(self, backend):
+        with pytest.raises(ValueError):
+            backend.create('fftw')
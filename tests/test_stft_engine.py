@@ -0,0 +1,136 @@
+"""
+Tests for the pooled band/channel STFTs in spec_utils
+"""
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from uvr5_pack.lib_v5 import spec_utils, stft_engine
+from uvr5_pack.lib_v5.model_param_init import ModelParameters
+
+MODELPARAMS = os.path.join(os.path.dirname(__file__), "..", "server", "uvr5_pack", "lib_v5", "modelparams")
+
+
+@pytest.fixture
+def mp():
+    return ModelParameters(os.path.join(MODELPARAMS, "4band_v2.json"))
+
+
+@pytest.fixture
+def pool():
+    stft_engine.set_max_workers(3)
+    yield stft_engine.executor()
+    stft_engine.set_max_workers(None)
+
+
+def _wave(seed, seconds=1.0, sr=44100):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((2, int(seconds * sr))).astype(np.float32) * 0.1
+
+
+def _serial_bands(wave, mp):
+    import librosa
+    specs = {}
+    bands_n = len(mp.param['band'])
+    for d in range(bands_n, 0, -1):
+        bp = mp.param['band'][d]
+        if d != bands_n:
+            wave = librosa.resample(wave, orig_sr=mp.param['band'][d + 1]['sr'], target_sr=bp['sr'],
+                                    res_type=bp['res_type'])
+        specs[d] = spec_utils.wave_to_spectrogram(wave, bp['hl'], bp['n_fft'], mp.param['mid_side'],
+                                                  mp.param['mid_side_b2'], mp.param['reverse'])
+    return specs
+
+
+class TestStftEngine:
+    """Test pooled STFTs against the serial spec_utils functions"""
+
+    def test_bands_match_serial(self, mp, pool):
+        wave = _wave(0)
+        expected = _serial_bands(wave, mp)
+        actual = spec_utils.wave_to_spectrogram_bands(wave, mp)
+        assert sorted(actual) == sorted(expected)
+        for d in expected:
+            np.testing.assert_array_equal(actual[d], expected[d])
+
+    @pytest.mark.parametrize("flags", [(False, False, False), (True, False, False),
+                                       (False, True, False), (False, False, True)])
+    def test_mt_round_trip_matches_serial(self, pool, flags):
+        mid_side, mid_side_b2, reverse = flags
+        wave = _wave(1, seconds=0.2)
+        spec = spec_utils.wave_to_spectrogram_mt(wave, 256, 1024, mid_side, mid_side_b2, reverse)
+        np.testing.assert_array_equal(spec, spec_utils.wave_to_spectrogram(wave, 256, 1024, mid_side, mid_side_b2,
+                                                                           reverse))
+        np.testing.assert_array_equal(spec_utils.spectrogram_to_wave_mt(spec, 256, mid_side, reverse, mid_side_b2),
+                                      spec_utils.spectrogram_to_wave(spec, 256, mid_side, mid_side_b2, reverse))
+
+    def test_pool_size_does_not_change_output(self, mp):
+        spec_m = spec_utils.combine_spectrograms(spec_utils.wave_to_spectrogram_bands(_wave(2), mp), mp)
+        stft_engine.set_max_workers(1)
+        try:
+            expected = spec_utils.cmb_spectrogram_to_wave(spec_m, mp)
+        finally:
+            stft_engine.set_max_workers(4)
+        try:
+            actual = spec_utils.cmb_spectrogram_to_wave(spec_m, mp)
+        finally:
+            stft_engine.set_max_workers(None)
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_concurrent_callers_get_their_own_results(self, pool):
+        waves = [_wave(seed, seconds=0.5) for seed in range(6)]
+        expected = [spec_utils.wave_to_spectrogram(w, 128, 512) for w in waves]
+        results = [None] * len(waves)
+        barrier = threading.Barrier(len(waves))
+
+        def run(i):
+            barrier.wait()
+            results[i] = spec_utils.wave_to_spectrogram_mt(waves[i], 128, 512)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(waves))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for got, want in zip(results, expected):
+            np.testing.assert_array_equal(got, want)
+
+    def test_pool_is_bounded(self, monkeypatch):
+        monkeypatch.setenv('UVR_STFT_THREADS', '2')
+        stft_engine.set_max_workers(None)
+        try:
+            assert stft_engine.max_workers() == 2
+            assert stft_engine.executor()._max_workers == 2
+        finally:
+            monkeypatch.delenv('UVR_STFT_THREADS')
+            stft_engine.set_max_workers(None)
+
+    @pytest.mark.parametrize("window", ["1", "2", "4"])
+    def test_istft_bands_in_flight_are_bounded(self, mp, pool, monkeypatch, window):
+        """cmb_spectrogram_to_wave folds bands in as they finish; output does not depend on the window"""
+        spec_m = spec_utils.combine_spectrograms(spec_utils.wave_to_spectrogram_bands(_wave(3), mp), mp)
+        monkeypatch.setenv('UVR_ISTFT_BANDS', '4')
+        expected = spec_utils.cmb_spectrogram_to_wave(spec_m, mp)
+
+        backend = spec_utils.get_backend()
+        submit = backend.submit_istft
+        state = {'in_flight': 0, 'peak': 0}
+
+        def counting_submit(specs, hop_length):
+            result = submit(specs, hop_length)
+            state['in_flight'] += 1
+            state['peak'] = max(state['peak'], state['in_flight'])
+
+            def wait():
+                out = result()
+                state['in_flight'] -= 1
+                return out
+            return wait
+
+        monkeypatch.setattr(backend, 'submit_istft', counting_submit)
+        monkeypatch.setenv('UVR_ISTFT_BANDS', window)
+        actual = spec_utils.cmb_spectrogram_to_wave(spec_m, mp)
+        assert state['peak'] == int(window)
+        np.testing.assert_array_equal(actual, expected)
@@ -0,0 +1,96 @@
+"""
+Tests for chunked upload spooling and shared input paths
+"""
+import asyncio
+import io
+import os
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from uploads import (
+    InputPathNotAllowed,
+    MissingInput,
+    UploadTooLarge,
+    receive_input,
+    resolve_input_path,
+    spool_upload,
+)
+
+
+class ChunkCountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def _upload(data, size=None, filename="clip.wav"):
+    return UploadFile(ChunkCountingFile(data), size=size, filename=filename)
+
+
+class TestSpoolUpload:
+    """Test uploads are copied to disk in bounded chunks"""
+
+    def test_spools_in_chunks(self, monkeypatch):
+        monkeypatch.setattr("uploads.UPLOAD_CHUNK_SIZE", 1000)
+        data = os.urandom(4500)
+        upload = _upload(data)
+        path = asyncio.run(spool_upload(upload, max_bytes=0))
+        try:
+            assert path.endswith(".wav")
+            with open(path, "rb") as f:
+                assert f.read() == data
+            assert set(upload.file.reads) == {1000}
+        finally:
+            os.remove(path)
+
+    def test_rejects_declared_size_before_reading(self):
+        upload = _upload(b"x" * 10, size=10_000)
+        with pytest.raises(UploadTooLarge):
+            asyncio.run(spool_upload(upload, max_bytes=100))
+        assert upload.file.reads == []
+
+    def test_rejects_oversized_stream_and_removes_spool(self, monkeypatch, tmp_path):
+        monkeypatch.setattr("uploads.UPLOAD_CHUNK_SIZE", 64)
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+        with pytest.raises(UploadTooLarge):
+            asyncio.run(spool_upload(_upload(b"x" * 1000), max_bytes=100))
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestInputPath:
+    """Test server-local input paths are confined to allowed directories"""
+
+    def test_allowed_path(self, monkeypatch, tmp_path):
+        shared = tmp_path / "shared"
+        shared.mkdir()
+        clip = shared / "clip.wav"
+        clip.write_bytes(b"RIFF")
+        monkeypatch.setenv("UPLOAD_ALLOWED_DIRS", str(shared))
+
+        path, owned = asyncio.run(receive_input(None, str(clip)))
+        assert path == os.path.realpath(clip)
+        assert owned is False
+
+    def test_path_outside_allowed_dirs(self, monkeypatch, tmp_path):
+        shared = tmp_path / "shared"
+        shared.mkdir()
+        secret = tmp_path / "secret.wav"
+        secret.write_bytes(b"RIFF")
+        monkeypatch.setenv("UPLOAD_ALLOWED_DIRS", str(shared))
+
+        with pytest.raises(InputPathNotAllowed):
+            resolve_input_path(str(shared / ".." / "secret.wav"))
+
+    def test_disabled_by_default(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("UPLOAD_ALLOWED_DIRS", raising=False)
+        with pytest.raises(InputPathNotAllowed):
+            resolve_input_path(str(tmp_path))
+
+    def test_missing_input(self):
+        with pytest.raises(MissingInput):
+            asyncio.run(receive_input(None, None))
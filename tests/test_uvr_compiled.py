@@ -0,0 +1,126 @@
+"""
+Tests for TorchScript export of the UVR nets
+"""
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from uvr5_pack.lib_v5 import compiled as compiled_mod
+from uvr5_pack.lib_v5 import nets
+from uvr5_pack.lib_v5.compiled import CompiledUVRNet
+from uvr5_pack.lib_v5.optimize import inference_context, prepare_cpu_model
+from uvr5_pack.utils import inference
+
+N_FFT = 64
+SPLIT_BIN = 10
+AGG = {'split_bin': SPLIT_BIN, 'value': 0.1}
+
+
+@pytest.fixture
+def net():
+    torch.manual_seed(0)
+    return nets.CascadedASPPNet(N_FFT).eval()
+
+
+def _windows(batch, width=512):
+    return torch.rand(batch, 2, N_FFT // 2 + 1, width, generator=torch.Generator().manual_seed(batch))
+
+
+class TestCompiledUVRNet:
+    """Test traced predictors against the eager net"""
+
+    @pytest.mark.parametrize("batch", [1, 3])
+    def test_matches_eager(self, net, tmp_path, batch):
+        model = CompiledUVRNet(net, SPLIT_BIN, "k", str(tmp_path))
+        x = _windows(batch)
+        with torch.no_grad():
+            expected = net.predict(x.clone(), dict(AGG))
+            actual = model.predict(x.clone(), dict(AGG))
+        torch.testing.assert_close(actual, expected)
+        assert model.traced == 1
+
+    def test_artifact_reused_and_shares_weights(self, net, tmp_path):
+        first = CompiledUVRNet(net, SPLIT_BIN, "abc-cpu-float32", str(tmp_path))
+        first.compiled(512)
+        path = first.artifact_path(512)
+        assert os.path.exists(path)
+        assert torch.__version__.split('+')[0] in os.path.basename(path)
+
+        second = CompiledUVRNet(net, SPLIT_BIN, "abc-cpu-float32", str(tmp_path))
+        traced = second.compiled(512)
+        assert (second.loaded, second.traced) == (1, 0)
+        weight = net.stg1_low_band_net.enc1.conv1.conv[0].weight
+        assert any(p.data_ptr() == weight.data_ptr() for p in traced.parameters())
+
+        x = _windows(2)
+        with torch.no_grad():
+            torch.testing.assert_close(second.predict(x.clone(), dict(AGG)), net.predict(x.clone(), dict(AGG)))
+
+    def test_other_bin_count_is_retraced(self, tmp_path):
+        torch.manual_seed(0)
+        small = nets.CascadedASPPNet(N_FFT).eval()
+        CompiledUVRNet(small, SPLIT_BIN, "same", str(tmp_path)).compiled(512)
+
+        other = nets.CascadedASPPNet(N_FFT * 2).eval()
+        model = CompiledUVRNet(other, SPLIT_BIN, "same", str(tmp_path))
+        model.compiled(512)
+        assert (model.loaded, model.traced) == (0, 1)
+
+    def test_per_window_size(self, net):
+        model = CompiledUVRNet(net, SPLIT_BIN, "k", cache_dir=None)
+        with torch.no_grad():
+            model.predict(_windows(1, 512), dict(AGG))
+            model.predict(_windows(1, 384), dict(AGG))
+            model.predict(_windows(1, 512), dict(AGG))
+        assert model.traced == 2
+
+    def test_without_aggressiveness_runs_eager(self, net, monkeypatch):
+        model = CompiledUVRNet(net, SPLIT_BIN, "k", cache_dir=None)
+        monkeypatch.setattr(model, "compiled", lambda w: pytest.fail("traced path used"))
+        with torch.no_grad():
+            model.predict(_windows(1), None)
+            model.predict(_windows(1), {'split_bin': SPLIT_BIN + 1, 'value': 0.1})
+
+    def test_inference_with_perf_mode(self, net):
+        eager = nets.CascadedASPPNet(N_FFT).eval()
+        eager.load_state_dict(net.state_dict())
+        fast = prepare_cpu_model(net)
+        model = CompiledUVRNet(fast, SPLIT_BIN, "k", None, context=lambda: inference_context(True, False))
+
+        rng = np.random.default_rng(0)
+        spec = (rng.standard_normal((2, N_FFT // 2 + 1, 700))
+                + 1j * rng.standard_normal((2, N_FFT // 2 + 1, 700))).astype(np.complex64)
+        data = {'window_size': 512, 'tta': False, 'batch_size': 2}
+        expected, _ = inference(spec, 'cpu', eager, dict(AGG), dict(data))
+        actual, _ = inference(spec, 'cpu', model, dict(AGG), dict(data, cpu_perf=True, bf16=False))
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-5)
+
+    def test_disabled_by_env(self, monkeypatch):
+        monkeypatch.setenv('UVR_TORCHSCRIPT', '0')
+        assert not compiled_mod.torchscript_enabled()
+        monkeypatch.delenv('UVR_TORCHSCRIPT')
+        assert compiled_mod.torchscript_enabled()
+
+
+class TestSeparatorIntegration:
+    """Test UVRSeparator loads its trace from the artifact cache"""
+
+    def test_second_load_uses_artifact(self, tmp_path, monkeypatch):
+        from rvc_infer import UVRSeparator
+
+        monkeypatch.setenv('UVR_COMPILED_DIR', str(tmp_path / "compiled"))
+        monkeypatch.setenv('UVR_MODEL_INDEX', str(tmp_path / "index.json"))
+        monkeypatch.delenv('UVR_CPU_PERF', raising=False)
+        weights = tmp_path / "1band_sr16000_hl512_test.pth"
+        torch.manual_seed(0)
+        torch.save(nets.CascadedASPPNet(2048).state_dict(), str(weights))
+
+        first = UVRSeparator(model_path=str(weights), device='cpu')
+        assert isinstance(first.model, CompiledUVRNet)
+        assert first.model.traced == 1
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in first.model.net.modules())
+        second = UVRSeparator(model_path=str(weights), device='cpu')
+        assert (second.model.loaded, second.model.traced) == (1, 0)
+        assert second.nbytes == first.nbytes
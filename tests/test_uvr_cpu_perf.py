@@ -0,0 +1,122 @@
+"""
+Tests for the opt-in UVR CPU performance mode
+"""
+import importlib
+
+import numpy as np
+import pytest
+import torch
+
+from uvr5_pack.lib_v5 import layers, nets, optimize
+from uvr5_pack.lib_v5.optimize import fold_batchnorm, prepare_cpu_model
+from uvr5_pack.utils import inference
+
+N_FFT = 64
+NETS_VARIANTS = ["nets", "nets_33966KB", "nets_61968KB", "nets_123812KB", "nets_123821KB",
+                 "nets_537227KB", "nets_537238KB"]
+DATA = {'window_size': 512, 'tta': False, 'batch_size': 4}
+
+
+def randomize_bn(model, seed=0):
+    """Give every BatchNorm non-trivial statistics so folding is actually exercised."""
+    g = torch.Generator().manual_seed(seed)
+    for m in model.modules():
+        if isinstance(m, torch.nn.BatchNorm2d):
+            n = m.num_features
+            m.running_mean.copy_(torch.randn(n, generator=g) * 0.1)
+            m.running_var.copy_(torch.rand(n, generator=g) + 0.5)
+            with torch.no_grad():
+                m.weight.copy_(torch.rand(n, generator=g) + 0.5)
+                m.bias.copy_(torch.randn(n, generator=g) * 0.1)
+    return model.eval()
+
+
+def sdr(reference, estimate):
+    noise = np.sum((reference - estimate) ** 2)
+    return 10 * np.log10(np.sum(reference ** 2) / max(noise, 1e-20))
+
+
+@pytest.fixture
+def spec():
+    rng = np.random.default_rng(0)
+    shape = (2, N_FFT // 2 + 1, 700)
+    return (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+
+
+class TestFoldBatchNorm:
+    """Test BN folding leaves block outputs unchanged"""
+
+    @pytest.mark.parametrize("block", [
+        lambda: layers.Conv2DBNActiv(4, 6, 3, 1, 1),
+        lambda: layers.SeperableConv2DBNActiv(4, 6, 3, 1, 2, 2),
+    ])
+    def test_block(self, block):
+        torch.manual_seed(0)
+        module = randomize_bn(block())
+        x = torch.randn(2, 4, 9, 16)
+        with torch.no_grad():
+            expected = module(x)
+            fold_batchnorm(module)
+            actual = module(x)
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in module.modules())
+        torch.testing.assert_close(actual, expected, rtol=1e-5, atol=1e-5)
+
+    @pytest.mark.parametrize("variant", NETS_VARIANTS)
+    def test_every_nets_variant(self, variant):
+        module = importlib.import_module(f"uvr5_pack.lib_v5.{variant}")
+        torch.manual_seed(0)
+        model = randomize_bn(module.CascadedASPPNet(N_FFT))
+        x = torch.rand(1, 2, N_FFT // 2 + 1, 384)
+        with torch.no_grad():
+            expected = model.predict(x, None)
+            fold_batchnorm(model)
+            actual = model.predict(x, None)
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules())
+        torch.testing.assert_close(actual, expected, rtol=1e-4, atol=1e-5)
+
+    def test_requires_eval_mode(self):
+        with pytest.raises(ValueError):
+            fold_batchnorm(layers.Conv2DBNActiv(2, 2).train())
+
+
+class TestCpuPerfMode:
+    """Test perf-mode inference against the fp32 NCHW path"""
+
+    def _models(self):
+        torch.manual_seed(0)
+        reference = randomize_bn(nets.CascadedASPPNet(N_FFT))
+        fast = randomize_bn(nets.CascadedASPPNet(N_FFT))
+        fast.load_state_dict(reference.state_dict())
+        return reference, prepare_cpu_model(fast.eval())
+
+    def test_fp32_perf_mode_matches(self, spec):
+        reference, fast = self._models()
+        expected, _ = inference(spec, 'cpu', reference, None, dict(DATA))
+        actual, _ = inference(spec, 'cpu', fast, None, dict(DATA, cpu_perf=True, bf16=False))
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-5)
+
+    def test_bf16_sdr(self, spec):
+        reference, fast = self._models()
+        expected, _ = inference(spec, 'cpu', reference, None, dict(DATA))
+        actual, _ = inference(spec, 'cpu', fast, None, dict(DATA, cpu_perf=True, bf16=True))
+        assert actual.dtype == np.float32
+        assert sdr(expected, actual) > 25.0
+
+    def test_channels_last_weights(self):
+        _, fast = self._models()
+        conv = fast.stg1_low_band_net.enc1.conv1.conv[0]
+        assert conv.weight.is_contiguous(memory_format=torch.channels_last)
+
+    def test_env_flags(self, monkeypatch):
+        monkeypatch.delenv('UVR_FOLD_BN', raising=False)
+        assert optimize.fold_bn_enabled()
+        monkeypatch.setenv('UVR_FOLD_BN', '0')
+        assert not optimize.fold_bn_enabled()
+        monkeypatch.delenv('UVR_CPU_PERF', raising=False)
+        assert not optimize.cpu_perf_enabled()
+        monkeypatch.setenv('UVR_CPU_PERF', '1')
+        assert optimize.cpu_perf_enabled()
+        monkeypatch.setenv('UVR_CPU_BF16', '0')
+        assert not optimize.bf16_supported()
+        monkeypatch.setenv('UVR_CPU_BF16', '1')
+        assert optimize.bf16_supported()
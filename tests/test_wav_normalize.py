@@ -0,0 +1,148 @@
+"""
+Tests for in-place memmap WAV normalization
+"""
+import math
+import struct
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import wav_normalize
+from wav_normalize import measure, normalize_wav, read_layout
+
+SR = 48000
+
+
+def _sine(seconds=2.0, amp=0.5, freq=1000.0, channels=2):
+    t = np.arange(int(SR * seconds)) / SR
+    x = amp * np.sin(2 * np.pi * freq * t)
+    return np.stack([x] * channels, axis=1) if channels > 1 else x
+
+
+def _write(tmp_path, data, subtype, name="clip.wav"):
+    path = str(tmp_path / name)
+    sf.write(path, data, SR, subtype=subtype)
+    return path
+
+
+class TestLayout:
+    """Test RIFF parsing of the data chunk"""
+
+    @pytest.mark.parametrize("subtype,bits,is_float", [
+        ("PCM_16", 16, False), ("PCM_24", 24, False), ("PCM_32", 32, False), ("FLOAT", 32, True),
+    ])
+    def test_formats(self, tmp_path, subtype, bits, is_float):
+        path = _write(tmp_path, _sine(0.1), subtype)
+        layout = read_layout(path)
+        assert layout.bits == bits
+        assert layout.is_float == is_float
+        assert layout.channels == 2
+        assert layout.frames == int(SR * 0.1)
+
+    def test_unsupported_format(self, tmp_path):
+        path = _write(tmp_path, _sine(0.1), "PCM_U8")
+        with pytest.raises(ValueError):
+            read_layout(path)
+
+    def test_skips_unknown_chunks_and_bogus_size(self, tmp_path):
+        samples = (np.arange(-50, 50) * 300).astype(np.int16)
+        fmt = struct.pack("<HHIIHH", 1, 1, SR, SR * 2, 2, 16)
+        payload = samples.tobytes()
+        body = (b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+                + b"LIST" + struct.pack("<I", 3) + b"abc\x00"
+                + b"data" + struct.pack("<I", 0xFFFFFFFF) + payload)
+        path = tmp_path / "odd.wav"
+        path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+        layout = read_layout(str(path))
+        assert layout.frames == len(samples)
+        assert measure(str(path))["peak"] == pytest.approx(15000 / 32768)
+
+
+class TestNormalize:
+    """Test gains are applied in place for every supported format"""
+
+    @pytest.mark.parametrize("subtype,tol", [
+        ("PCM_16", 1e-4), ("PCM_24", 1e-6), ("PCM_32", 1e-8), ("FLOAT", 1e-6),
+    ])
+    def test_peak(self, tmp_path, subtype, tol):
+        data = _sine()
+        path = _write(tmp_path, data, subtype)
+        gain = normalize_wav(path, -1.0, block_frames=1000)
+
+        out, _ = sf.read(path)
+        target = 10 ** (-1.0 / 20)
+        assert gain == pytest.approx(target / 0.5, rel=1e-3)
+        assert np.abs(out).max() == pytest.approx(target, abs=tol)
+        np.testing.assert_allclose(out, data * gain, atol=2 * tol)
+
+    def test_block_size_does_not_matter(self, tmp_path):
+        data = _sine(channels=1)
+        a = _write(tmp_path, data, "PCM_24", "a.wav")
+        b = _write(tmp_path, data, "PCM_24", "b.wav")
+        normalize_wav(a, -3.0, block_frames=777)
+        normalize_wav(b, -3.0, block_frames=1 << 20)
+        with open(a, "rb") as fa, open(b, "rb") as fb:
+            assert fa.read() == fb.read()
+
+    def test_header_untouched(self, tmp_path):
+        path = _write(tmp_path, _sine(), "PCM_16")
+        layout = read_layout(path)
+        with open(path, "rb") as f:
+            header = f.read(layout.offset)
+        normalize_wav(path, -0.1)
+        with open(path, "rb") as f:
+            assert f.read(layout.offset) == header
+
+    def test_silence_is_left_alone(self, tmp_path):
+        path = _write(tmp_path, np.zeros((SR, 2)), "PCM_16")
+        assert normalize_wav(path, -0.1) is None
+        assert normalize_wav(path, -23.0, mode="lufs") is None
+
+    def test_rms_target(self, tmp_path):
+        path = _write(tmp_path, _sine(amp=0.1), "FLOAT")
+        normalize_wav(path, -20.0, mode="rms")
+        assert measure(path, "rms")["level"] == pytest.approx(-20.0, abs=0.01)
+
+    def test_loudness_gain_capped_at_full_scale(self, tmp_path):
+        path = _write(tmp_path, _sine(amp=0.5), "PCM_16")
+        gain = normalize_wav(path, 0.0, mode="rms")
+        assert gain == pytest.approx(2.0, rel=1e-3)
+
+    def test_unknown_mode(self, tmp_path):
+        path = _write(tmp_path, _sine(0.1), "PCM_16")
+        with pytest.raises(ValueError):
+            normalize_wav(path, -0.1, mode="loud")
+
+
+class TestLoudness:
+    """Test BS.1770 integrated loudness"""
+
+    def test_k_weighting_matches_standard_at_48k(self):
+        (shelf_b, shelf_a), (hp_b, hp_a) = wav_normalize.k_weighting(48000)
+        np.testing.assert_allclose(shelf_b, [1.53512485958697, -2.69169618940638, 1.19839281085285], rtol=1e-9)
+        np.testing.assert_allclose(shelf_a, [1.0, -1.69065929318241, 0.73248077421585], rtol=1e-9)
+        np.testing.assert_allclose(hp_a, [1.0, -1.99004745483398, 0.99007225036621], rtol=1e-9)
+
+    def test_full_scale_sine(self, tmp_path):
+        # A 0 dBFS 997 Hz sine in one channel reads -3.01 LUFS
+        path = _write(tmp_path, _sine(5.0, amp=1.0, freq=997.0, channels=1), "FLOAT")
+        assert measure(path, "lufs")["level"] == pytest.approx(-3.01, abs=0.05)
+
+    def test_relative_gate_ignores_quiet_passage(self, tmp_path):
+        loud = _sine(3.0, amp=0.5, channels=1)
+        quiet = _sine(3.0, amp=0.5 * 10 ** (-30 / 20), channels=1)
+        path = _write(tmp_path, np.concatenate([loud, quiet]), "FLOAT")
+        only_loud = _write(tmp_path, loud, "FLOAT", "loud.wav")
+        # Ungated, the quiet half would pull the level down by about 3 LU
+        assert measure(path, "lufs")["level"] == pytest.approx(measure(only_loud, "lufs")["level"], abs=0.3)
+
+    def test_normalize_to_target(self, tmp_path):
+        path = _write(tmp_path, _sine(amp=0.05), "PCM_24")
+        normalize_wav(path, -16.0, mode="lufs", block_frames=1000)
+        assert measure(path, "lufs")["level"] == pytest.approx(-16.0, abs=0.01)
+
+    def test_short_clip_is_ungated(self, tmp_path):
+        path = _write(tmp_path, _sine(0.2, amp=1.0, freq=997.0, channels=1), "FLOAT")
+        assert math.isfinite(measure(path, "lufs")["level"])
@@ -0,0 +1,64 @@
+"""
+Tests for on-the-fly zip archives
+"""
+import io
+import os
+import zipfile
+
+import pytest
+
+from zipstream import dir_entries, iter_zip, write_zip
+
+
+@pytest.fixture
+def stems(tmp_path):
+    paths = {}
+    for name in ("vocals.wav", "drums.wav"):
+        path = tmp_path / name
+        path.write_bytes(os.urandom(50_000))
+        paths[name] = str(path)
+    return paths
+
+
+def _open(chunks):
+    return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+
+class TestZipStream:
+    """Test streamed archives are valid and built from the original files"""
+
+    def test_stored_by_default(self, stems, monkeypatch):
+        monkeypatch.delenv("ZIP_COMPRESSION", raising=False)
+        with _open(iter_zip(stems)) as zf:
+            assert zf.testzip() is None
+            assert sorted(zf.namelist()) == ["drums.wav", "vocals.wav"]
+            for name, path in stems.items():
+                assert zf.getinfo(name).compress_type == zipfile.ZIP_STORED
+                with open(path, "rb") as f:
+                    assert zf.read(name) == f.read()
+
+    def test_deflate_optional(self, stems, monkeypatch):
+        monkeypatch.setenv("ZIP_COMPRESSION", "deflate")
+        with _open(iter_zip(stems)) as zf:
+            assert zf.testzip() is None
+            assert zf.getinfo("vocals.wav").compress_type == zipfile.ZIP_DEFLATED
+
+    def test_unknown_compression(self, stems):
+        with pytest.raises(ValueError):
+            list(iter_zip(stems, compression="bzip2"))
+
+    def test_chunks_are_bounded(self, stems):
+        chunks = list(iter_zip(stems, chunk_size=4096))
+        assert len(chunks) > 20
+        assert max(len(c) for c in chunks) <= 4096 + 1024
+
+    def test_write_zip_and_dir_entries(self, stems, tmp_path):
+        nested = tmp_path / "htdemucs" / "track"
+        nested.mkdir(parents=True)
+        (nested / "bass.wav").write_bytes(b"RIFF")
+        entries = dir_entries(str(tmp_path / "htdemucs"))
+        assert entries == {os.path.join("track", "bass.wav"): str(nested / "bass.wav")}
+
+        archive = write_zip(entries, str(tmp_path / "out.zip"))
+        with zipfile.ZipFile(archive) as zf:
+            assert zf.read("track/bass.wav") == b"RIFF"